@@ -0,0 +1,67 @@
+"""Times the downsampling of long histories for the charts, and the plotting
+of a line with and without it.
+
+    python -m benchmarks.bench_downsample --points 1000000 10000000
+    python -m benchmarks.bench_downsample --points 1000000 --plot
+"""
+
+import io
+import time
+import argparse
+
+import numpy as np
+
+from coain.renderer.downsample import lttb, ohlc_buckets
+
+from benchmarks.bench_features import synthetic_history
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings += [time.perf_counter() - start]
+    return min(timings)
+
+
+def plot_time(x: np.ndarray, y: np.ndarray) -> float:
+    """Draws a line with matplotlib to an in-memory png and returns the time
+    it took."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    fig, ax = plt.subplots(figsize=(15, 5))
+    ax.plot(x, y)
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', nargs='+', type=int, default=[1000000, 10000000])
+    parser.add_argument('--out', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args()
+
+    for points in args.points:
+        df = synthetic_history(points)
+        close = df["close"].to_numpy()
+
+        lttb_s = best_of(lambda: lttb(close, args.out), args.repeat)
+        ohlc_s = best_of(lambda: ohlc_buckets(df, args.out), args.repeat)
+        print("{:>10} points -> {}: lttb {:.3f}s, ohlc_buckets {:.3f}s".format(points, args.out, lttb_s, ohlc_s))
+
+        if args.plot:
+            kept = lttb(close, args.out)
+            raw_s = plot_time(np.arange(points), close)
+            downsampled_s = plot_time(kept, close[kept])
+            print("{:>10} points: matplotlib raw {:.3f}s, downsampled {:.3f}s".format(points, raw_s, downsampled_s))
+
+
+if __name__ == "__main__":
+    main()
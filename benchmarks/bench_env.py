@@ -0,0 +1,195 @@
+"""Measures the rollout throughput of the envs of the project.
+
+Every combination of env configuration, action scheme, reward scheme and
+history length is built and stepped with random actions, reporting the
+steps per second, the mean reset latency and the peak memory traced while
+building the env and rolling it out.
+
+    python -m benchmarks.bench_env --rows 1000 100000 --output bench.json
+    python -m benchmarks.bench_env --compare baseline.json bench.json
+
+The configurations are the envs built by `trade_sine.create_env` ("sine"),
+`trade_ai.create_env` ("ai") and `train_ray.create_env` ("ray"), the last
+one needing ray. Actions are "bsh" for `BuySellHold` and "simpleN" for
+`MySimpleOrders(trade_sizes=N)`, rewards are "pbr" and "sharpe", as named by
+`create_schemes`.
+"""
+
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import itertools
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import trade_ai
+import trade_sine
+
+from coain.dataset.createfeatures import create_basic_features
+
+from benchmarks.bench_features import synthetic_history
+
+
+CONFIGS = ["sine", "ai", "ray"]
+ACTIONS = ["bsh", "simple2", "simple4", "simple10"]
+REWARDS = ["pbr", "sharpe"]
+ROWS = [1000, 100000, 1000000]
+
+# the metrics compared between runs, and whether higher is better
+METRICS = {"steps_per_s": True, "reset_ms": False, "peak_mb": False}
+
+
+def build_env(config: str, action: str, reward: str, rows: int, compiled: bool = True) -> 'TradingEnv':
+    """Builds the env of a configuration with the given schemes, through the
+    env creator of its script."""
+    if config == "ai":
+        data = create_basic_features(synthetic_history(rows)).rename(columns={'volume': 'volume eth'})
+        return trade_ai.create_env(data, compiled=compiled, action=action, reward=reward)
+    if config == "sine":
+        return trade_sine.create_env(rows=rows, compiled=compiled, action=action, reward=reward)
+
+    # the ray script needs ray to be imported
+    import train_ray
+    return train_ray.create_env({
+        "window_size": 25,
+        "compiled_feed": compiled,
+        "rows": rows,
+        "action": action,
+        "reward": reward
+    })
+
+
+def rollout(env: 'TradingEnv', steps: int, seed: int = 0) -> float:
+    """Steps `env` with random actions, resetting it when done, and returns
+    the time spent stepping."""
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, env.action_space.n, steps)
+
+    elapsed = 0.
+    env.reset()
+    for action in actions:
+        start = time.perf_counter()
+        _, _, done, _ = env.step(int(action))
+        elapsed += time.perf_counter() - start
+        if done:
+            env.reset()
+    return elapsed
+
+
+def bench(config: str, action: str, reward: str, rows: int, steps: int, resets: int, compiled: bool) -> dict:
+    start = time.perf_counter()
+    env = build_env(config, action, reward, rows, compiled)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(resets):
+        env.reset()
+    reset_ms = (time.perf_counter() - start) / resets * 1000
+
+    steps_per_s = steps / rollout(env, steps)
+
+    del env
+    gc.collect()
+
+    # traced separately, tracing slows every allocation down
+    tracemalloc.start()
+    env = build_env(config, action, reward, rows, compiled)
+    rollout(env, min(steps, 1000))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "config": config,
+        "action": action,
+        "reward": reward,
+        "rows": rows,
+        "feed": "compiled" if compiled else "stream",
+        "build_s": build_s,
+        "reset_ms": reset_ms,
+        "steps_per_s": steps_per_s,
+        "peak_mb": peak / 2 ** 20
+    }
+
+
+def key(result: dict) -> tuple:
+    return tuple(result[k] for k in ("config", "action", "reward", "rows", "feed"))
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """Prints the change of every metric between two runs and returns whether
+    any got worse by more than `tolerance`."""
+    previous = {key(r): r for r in baseline["results"]}
+
+    regressed = False
+    for result in current["results"]:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            change = result[metric] / old[metric] - 1
+            worse = -change if higher_is_better else change
+            flag = " REGRESSION" if worse > tolerance else ""
+            regressed = regressed or bool(flag)
+            changes += ["{} {:+.1%}{}".format(metric, change, flag)]
+
+        print("{:<45} {}".format("/".join(str(k) for k in key(result)), ", ".join(changes)))
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--configs', nargs='+', default=CONFIGS, choices=CONFIGS)
+    parser.add_argument('--actions', nargs='+', default=ACTIONS)
+    parser.add_argument('--rewards', nargs='+', default=REWARDS, choices=REWARDS)
+    parser.add_argument('--rows', nargs='+', type=int, default=ROWS)
+    parser.add_argument('--feeds', nargs='+', default=["compiled"], choices=["compiled", "stream"])
+    parser.add_argument('--steps', type=int, default=5000)
+    parser.add_argument('--resets', type=int, default=20)
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(int(compare(baseline, current, args.tolerance)))
+
+    # orders cancelled for their tiny commission log a warning each
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    for config, action, reward, rows, feed in itertools.product(
+            args.configs, args.actions, args.rewards, args.rows, args.feeds):
+        result = bench(config, action, reward, rows, args.steps, args.resets, feed == "compiled")
+        print("{:<45} {:>10.0f} steps/s {:>8.2f} ms/reset {:>9.1f} MB peak {:>7.2f}s build".format(
+            "/".join(str(k) for k in key(result)),
+            result["steps_per_s"], result["reset_ms"], result["peak_mb"], result["build_s"]))
+        results += [result]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "steps": args.steps,
+                "results": results
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Times the candle shape features on a synthetic minute history.
+
+    python -m benchmarks.bench_features --rows 1000000
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from coain.dataset.createfeatures import create_basic_features
+
+
+def synthetic_history(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, rows)).round(2)
+    open_ = np.roll(close, 1)
+    open_[0] = close[0]
+    high = np.maximum(open_, close) + rng.integers(0, 5, rows) * 0.01
+    low = np.minimum(open_, close) - rng.integers(0, 5, rows) * 0.01
+    return pd.DataFrame({
+        'time': pd.date_range('2018-01-01', periods=rows, freq='min'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.uniform(0, 10, rows)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = synthetic_history(args.rows)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        create_basic_features(df)
+        timings += [time.perf_counter() - start]
+
+    print("create_basic_features: {} rows, best {:.3f}s, mean {:.3f}s".format(
+        args.rows, min(timings), np.mean(timings)))
+
+
+if __name__ == "__main__":
+    main()
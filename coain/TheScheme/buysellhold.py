@@ -13,6 +13,7 @@ from tensortrade.oms.wallets import Portfolio
 
 import logging
 from abc import abstractmethod
+from collections import deque
 from itertools import product
 from typing import Union, List, Any
 
@@ -30,6 +31,8 @@ from tensortrade.oms.orders import (
     TradeType
 )
 
+from coain.TheScheme.execution import is_simple_market_order, execute_market_order
+
 class BuySellHold(TensorTradeActionScheme):
 
     registered_name = "buysellhold"
@@ -56,7 +59,9 @@ class BuySellHold(TensorTradeActionScheme):
         if abs(action - self.action) > 0:
             src = self.cash if self.action == 0 else self.asset
             tgt = self.asset if self.action == 0 else self.cash
-            order = proportion_order(portfolio, src, tgt, 1.0)
+            # an order cancelled for its commission leaves nothing to trade back
+            if src.balance.size > 0 and not self._execute(portfolio, src):
+                order = proportion_order(portfolio, src, tgt, 1.0)
             self.action = action
 
         for listener in self.listeners:
@@ -64,18 +69,68 @@ class BuySellHold(TensorTradeActionScheme):
 
         return [order]
 
+    def _execute(self, portfolio: 'Portfolio', source: 'Wallet') -> bool:
+        """Trades the whole `source` balance on the fast path of
+        `execute_market_order`, returning whether it was handled."""
+        if self.cash.instrument != portfolio.base_instrument:
+            return False
+
+        ep = ExchangePair(self.cash.exchange, self.cash.instrument / self.asset.instrument)
+        if not is_simple_market_order(ep, portfolio):
+            return False
+
+        quantity = (source.balance.as_float() * source.instrument).quantize()
+        side = TradeSide.BUY if source is self.cash else TradeSide.SELL
+        return self.execute_market_order(portfolio, ep, side, quantity)
+
+    def execute_market_order(self,
+                             portfolio: 'Portfolio',
+                             exchange_pair: 'ExchangePair',
+                             side: 'TradeSide',
+                             quantity: 'Quantity') -> bool:
+        """Executes a market order on the fast path, recording its fill in
+        the broker, see `execute_market_order`."""
+        return execute_market_order(portfolio, self.broker, exchange_pair, side, quantity)
+
     def reset(self):
         super().reset()
         self.action = 0
 
 
 class PBR(TensorTradeRewardScheme):
+    """A reward scheme for position-based returns.
+
+    The reward of each step is the change in price since the previous step
+    times the current position, -1 for out of the market and 1 for in it.
+    Parameters
+    ----------
+    price : `Stream`, optional
+        The price stream of the traded pair. The rewards are computed by a
+        feed of streams evaluated on every step.
+    prices : `np.ndarray`, optional
+        The whole price history of the traded pair. The price changes are
+        computed once and the reward of each step is read by the clock step,
+        giving the same rewards as `price` without evaluating a feed.
+    offset : int
+        The index in `prices` of the price observed at clock step 0, e.g. the
+        `min_periods` of the observer.
+    """
 
     registered_name = "pbr"
 
-    def __init__(self, price: 'Stream'):
+    def __init__(self, price: 'Stream' = None, prices: 'np.ndarray' = None, offset: int = 0):
         super().__init__()
         self.position = -1
+        self.offset = offset
+
+        if prices is not None:
+            self.feed = None
+            diffs = np.diff(np.asarray(prices, dtype="float"), prepend=np.nan)
+            self._diffs = np.where(np.isnan(diffs), 0, diffs)
+            return
+
+        if price is None:
+            raise ValueError("PBR requires either a 'price' stream or a 'prices' array.")
 
         r = Stream.sensor(price, lambda p: p.value, dtype="float").diff()
         position = Stream.sensor(self, lambda rs: rs.position, dtype="float")
@@ -89,44 +144,141 @@ class PBR(TensorTradeRewardScheme):
         self.position = -1 if action == 0 else 1
 
     def get_reward(self, portfolio: 'Portfolio'):
-        return self.feed.next()["reward"]
+        if self.feed is not None:
+            return self.feed.next()["reward"]
+
+        # the first reward after a reset has no previous price to compare to
+        step = self.clock.step
+        if step <= 1:
+            return 0.
+        return self._diffs[step + self.offset] * self.position
+
+    def rewards_for(self, actions: 'np.ndarray') -> np.ndarray:
+        """Computes the rewards of a whole episode of actions at once.
+        Parameters
+        ----------
+        actions : `np.ndarray`
+            The action taken on each step of the episode, starting from the
+            first step after a reset.
+        Returns
+        -------
+        `np.ndarray`
+            The reward of each step, as `get_reward` would give them.
+        """
+        if self.feed is not None:
+            raise ValueError("Rewards can only be computed at once when PBR is created with 'prices'.")
+
+        actions = np.asarray(actions)
+        positions = np.where(actions == 0, -1, 1)
+        steps = np.arange(1, len(actions) + 1) + self.offset
+
+        rewards = self._diffs[steps] * positions
+        rewards[:1] = 0
+        return rewards
 
     def reset(self):
         self.position = -1
-        self.feed.reset()
+        if self.feed is not None:
+            self.feed.reset()
 
 
 class SharpeRatio(TensorTradeRewardScheme):
     """A reward scheme that rewards the agent for increasing its net worth,
        while penalizing more volatile strategies.
+
+       The returns of the last `window_size` steps are kept in a ring buffer
+       together with their running mean and sum of squared deviations from
+       it, updated like Welford's algorithm, so each step costs the same
+       however long the episode is.
        Parameters
        ----------
-       return_algorithm : {'sharpe', 'sortino'}, Default 'sharpe'.
-           The risk-adjusted return metric to use.
        risk_free_rate : float, Default 0.
            The risk free rate of returns to use for calculating metrics.
        target_returns : float, Default 0
            The target returns per period for use in calculating the sortino ratio.
        window_size : int
            The size of the look back window for computing the reward.
+       return_algorithm : {'sharpe', 'sortino'}, Default 'sharpe'.
+           The risk-adjusted return metric to use.
        """
 
 
     def __init__(self,
                  risk_free_rate: float = 0.,
                  target_returns: float = 0.,
-                 window_size: int = 1) -> None:
+                 window_size: int = 1,
+                 return_algorithm: str = 'sharpe') -> None:
 
         self._risk_free_rate = self.default('risk_free_rate', risk_free_rate)
         self._target_returns = self.default('target_returns', target_returns)
         self._window_size = self.default('window_size', window_size)
-
-
-    def _sharpe_ratio(self, returns: 'pd.Series') -> float:
-        """Computes the sharpe ratio for a given series of a returns.
+        self._return_algorithm = self.default('return_algorithm', return_algorithm)
+
+        if self._return_algorithm not in ('sharpe', 'sortino'):
+            raise ValueError(f"Valid return algorithms are 'sharpe' and 'sortino'. Found '{self._return_algorithm}'.")
+
+        self.reset()
+
+    def reset(self) -> None:
+        self._returns = deque(maxlen=self._window_size)
+        self._mean = 0.
+        self._m2 = 0.
+        self._sum_downside_sq = 0.
+        self._scale = 0.
+        self._downside_scale = 0.
+        self._n = 0
+
+    def _push(self, r: float) -> None:
+        """Adds a return to the window and updates the running mean, sum of
+        squared deviations and downside sum of squares."""
+        n = len(self._returns)
+        old = 0.
+        old_downside_sq = 0.
+        if n == self._window_size:
+            # the oldest return is replaced, the window keeps its size
+            old = self._returns[0]
+            old_downside_sq = min(old - self._target_returns, 0) ** 2
+            mean = self._mean + (r - old) / n
+            self._m2 += (r - old) * (r - mean + old - self._mean)
+            self._mean = mean
+            self._sum_downside_sq -= old_downside_sq
+        else:
+            delta = r - self._mean
+            self._mean += delta / (n + 1)
+            self._m2 += delta * (r - self._mean)
+
+        downside_sq = min(r - self._target_returns, 0) ** 2
+        self._returns.append(r)
+        self._sum_downside_sq += downside_sq
+
+        # the rounding errors of the updates are relative to the squares of
+        # the returns they went through, so sums that became small next to
+        # them, e.g. the variance of a flat window, are recomputed from the
+        # window, as they are every window so errors never build up
+        self._scale += r * r + old * old
+        self._downside_scale += downside_sq + old_downside_sq
+        self._n += 1
+        if self._n % self._window_size == 0 \
+                or self._m2 < 1e-8 * self._scale \
+                or self._sum_downside_sq < 1e-8 * self._downside_scale:
+            returns = np.array(self._returns)
+            self._mean = returns.mean()
+            self._m2 = ((returns - self._mean) ** 2).sum()
+            self._sum_downside_sq = (np.minimum(returns - self._target_returns, 0) ** 2).sum()
+            self._scale = 0.
+            self._downside_scale = 0.
+
+    def _push_return(self, net_worth: float, previous: float) -> None:
+        # a portfolio worth nothing has no return, so it adds a flat one
+        # instead of an infinite one
+        self._push(net_worth / previous - 1 if previous != 0 else 0.)
+
+    def _sharpe_ratio(self, returns: 'pd.Series' = None) -> float:
+        """Computes the sharpe ratio for a given series of a returns, by
+        default the returns in the look back window.
         Parameters
         ----------
-        returns : `pd.Series`
+        returns : `pd.Series`, optional
             The returns for the `portfolio`.
         Returns
         -------
@@ -136,8 +288,41 @@ class SharpeRatio(TensorTradeRewardScheme):
         ----------
         .. [1] https://en.wikipedia.org/wiki/Sharpe_ratio
         """
-        return (np.mean(returns) - self._risk_free_rate + 1e-9) / (np.std(returns) + 1e-9)
+        if returns is not None:
+            return (np.mean(returns) - self._risk_free_rate + 1e-9) / (np.std(returns) + 1e-9)
+
+        n = len(self._returns)
+        if n == 0:
+            return np.nan
+
+        std = np.sqrt(max(self._m2 / n, 0.))
+        return (self._mean - self._risk_free_rate + 1e-9) / (std + 1e-9)
+
+    def _sortino_ratio(self, returns: 'pd.Series' = None) -> float:
+        """Computes the sortino ratio for a given series of a returns, by
+        default the returns in the look back window.
+        Parameters
+        ----------
+        returns : `pd.Series`, optional
+            The returns for the `portfolio`.
+        Returns
+        -------
+        float
+            The sortino ratio for the given series of a `returns`.
+        References
+        ----------
+        .. [1] https://en.wikipedia.org/wiki/Sortino_ratio
+        """
+        if returns is not None:
+            downside = np.minimum(np.asarray(returns) - self._target_returns, 0)
+            return (np.mean(returns) - self._risk_free_rate + 1e-9) / (np.sqrt(np.mean(downside ** 2)) + 1e-9)
 
+        n = len(self._returns)
+        if n == 0:
+            return np.nan
+
+        downside_std = np.sqrt(max(self._sum_downside_sq / n, 0.))
+        return (self._mean - self._risk_free_rate + 1e-9) / (downside_std + 1e-9)
 
     def get_reward(self, portfolio: 'Portfolio') -> float:
         """Computes the reward corresponding to the selected risk-adjusted return metric.
@@ -150,10 +335,23 @@ class SharpeRatio(TensorTradeRewardScheme):
         float
             The reward corresponding to the selected risk-adjusted return metric.
         """
-        net_worths = [nw['net_worth'] for nw in portfolio.performance.values()][-(self._window_size + 1):]
-        returns = pd.Series(net_worths).pct_change().dropna()
-        risk_adjusted_return = self._sharpe_ratio(returns)
-        return risk_adjusted_return
+        # only the last two entries are needed to get the newest return
+        history = getattr(portfolio, "history", None)
+        if history is not None:
+            net_worth = history["net_worth"]
+            if len(net_worth) > 1:
+                self._push_return(float(net_worth[-1]), float(net_worth[-2]))
+        else:
+            performance = reversed(portfolio.performance.values())
+            net_worth = next(performance)['net_worth']
+            previous = next(performance, None)
+
+            if previous is not None:
+                self._push_return(float(net_worth), float(previous['net_worth']))
+
+        if self._return_algorithm == 'sortino':
+            return self._sortino_ratio()
+        return self._sharpe_ratio()
 
 
 class MySimpleOrders(TensorTradeActionScheme):
@@ -248,6 +446,11 @@ class MySimpleOrders(TensorTradeActionScheme):
                 or size < self.min_order_abs:
             return []
 
+        if self._order_listener is None \
+                and is_simple_market_order(ep, portfolio, criteria, self._trade_type) \
+                and self.execute_market_order(portfolio, ep, side, quantity):
+            return []
+
         order = Order(
             step=self.clock.step,
             side=side,
@@ -263,4 +466,13 @@ class MySimpleOrders(TensorTradeActionScheme):
         if self._order_listener is not None:
             order.attach(self._order_listener)
 
-        return [order]
\ No newline at end of file
+        return [order]
+
+    def execute_market_order(self,
+                             portfolio: 'Portfolio',
+                             exchange_pair: 'ExchangePair',
+                             side: 'TradeSide',
+                             quantity: 'Quantity') -> bool:
+        """Executes a market order on the fast path, recording its fill in
+        the broker, see `execute_market_order`."""
+        return execute_market_order(portfolio, self.broker, exchange_pair, side, quantity)
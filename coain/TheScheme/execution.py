@@ -0,0 +1,141 @@
+"""Contains a lightweight execution path for simulated market orders."""
+
+import logging
+from decimal import Decimal
+from typing import NamedTuple
+
+from tensortrade.oms.instruments import ExchangePair, Quantity
+from tensortrade.oms.orders import TradeSide, TradeType
+from tensortrade.oms.services.execution.simulated import execute_order
+
+
+class Fill(NamedTuple):
+    """A compact record of a market order executed by `execute_market_order`.
+
+    It has the attributes of `Trade` read by the renderers, without the id,
+    timestamps and listeners of a full `Trade`.
+    """
+
+    step: int
+    exchange_pair: ExchangePair
+    side: TradeSide
+    quantity: Quantity
+    price: Decimal
+    commission: Quantity
+    type: TradeType = TradeType.MARKET
+
+    @property
+    def base_instrument(self) -> 'Instrument':
+        return self.exchange_pair.pair.base
+
+    @property
+    def quote_instrument(self) -> 'Instrument':
+        return self.exchange_pair.pair.quote
+
+    @property
+    def size(self) -> Decimal:
+        return self.quantity.size
+
+    @property
+    def is_buy(self) -> bool:
+        return self.side == TradeSide.BUY
+
+    @property
+    def is_sell(self) -> bool:
+        return self.side == TradeSide.SELL
+
+
+def is_simple_market_order(exchange_pair: 'ExchangePair',
+                           portfolio: 'Portfolio',
+                           criteria: 'OrderCriteria' = None,
+                           trade_type: 'TradeType' = TradeType.MARKET) -> bool:
+    """Whether an order can be executed by `execute_market_order`, i.e. it is
+    a market order without criteria on an exchange running the simulated
+    `execute_order` service, and no order listener of the portfolio expects
+    to see it.
+    """
+    return criteria is None \
+        and trade_type == TradeType.MARKET \
+        and exchange_pair.exchange._service is execute_order \
+        and portfolio.order_listener is None
+
+
+def execute_market_order(portfolio: 'Portfolio',
+                         broker: 'Broker',
+                         exchange_pair: 'ExchangePair',
+                         side: 'TradeSide',
+                         quantity: 'Quantity') -> bool:
+    """Executes a simple market order by updating the wallet balances directly.
+
+    The fill, commission and converted quantities are computed with the same
+    `Quantity` arithmetic as `execute_order` and `Wallet.transfer`, so the
+    balances are identical to submitting an `Order` to the `Broker`, but no
+    `Order` or `Trade` is created, no quantity is locked and nothing is
+    written to the ledger. The fill is recorded in `broker.trades` as a
+    `Fill`. Orders the simulated service would cancel for their commission
+    are dropped the same way.
+    Parameters
+    ----------
+    portfolio : `Portfolio`
+        The portfolio holding the wallets of the pair.
+    broker : `Broker`
+        The broker the fill is recorded in.
+    exchange_pair : `ExchangePair`
+        The exchange pair to trade.
+    side : `TradeSide`
+        The side of the order.
+    quantity : `Quantity`
+        The quantity of the order, in the instrument sold.
+    Returns
+    -------
+    bool
+        Whether the order was handled. If not, e.g. the quantity is zero or
+        exceeds the maximum trade size, nothing was changed and the order has
+        to be submitted to the broker.
+    """
+    exchange = exchange_pair.exchange
+    pair = exchange_pair.pair
+    price = exchange_pair.price
+
+    source = portfolio.get_wallet(exchange.id, side.instrument(pair))
+    target = portfolio.get_wallet(exchange.id, pair.quote if side == TradeSide.BUY else pair.base)
+
+    if quantity.size == 0 or quantity > source.balance:
+        return False
+
+    max_trade_size = exchange.options.max_trade_size
+    if side == TradeSide.BUY and quantity.size > max_trade_size:
+        return False
+    if side == TradeSide.SELL and quantity.size * price >= max_trade_size:
+        return False
+
+    commission = exchange.options.commission * quantity
+    if commission.size < Decimal(10) ** -quantity.instrument.precision:
+        logging.warning("Commission is less than instrument precision. Canceling order. "
+                        "Consider defining a custom instrument with a higher precision.")
+        return True
+
+    filled = (quantity - commission).quantize()
+    commission = commission.quantize()
+
+    # a rounding remainder would stay locked by the order
+    if filled + commission != quantity:
+        return False
+
+    if side == TradeSide.BUY:
+        converted = Quantity(target.instrument, filled.size / price).quantize()
+    else:
+        converted = Quantity(target.instrument, filled.size * price).quantize()
+
+    source.balance = (source.balance - quantity).quantize()
+    target.balance = (target.balance + converted).quantize()
+
+    broker.trades[len(broker.trades)] = [Fill(
+        step=exchange.clock.step,
+        exchange_pair=exchange_pair,
+        side=side,
+        quantity=filled,
+        price=price,
+        commission=commission
+    )]
+    return True
@@ -0,0 +1,267 @@
+"""Contains the aggregation of candle histories into time, volume and dollar
+bars, and the cleaning of the candles they are built from."""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from coain.dataset.cache import _to_timestamps
+
+
+def aggregate(df: pd.DataFrame, starts: np.ndarray) -> pd.DataFrame:
+    """Aggregates groups of consecutive candles into one candle each.
+
+    Each group opens at the open of its first row, closes at the close of
+    its last row and spans the highest high and lowest low of its rows.
+    Columns whose name starts with "volume" are summed and every other
+    column, e.g. the time, takes the value of the first row of the group.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles, with 'open', 'high', 'low' and 'close' columns.
+    starts : `np.ndarray`
+        The increasing positions of the first row of each group.
+    Returns
+    -------
+    `pd.DataFrame`
+        A candle per group with the columns of `df`, indexed by the index of
+        the first row of each group.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(df)) - 1
+
+    data = {}
+    for c in df.columns:
+        values = df[c].to_numpy()
+        if not len(starts):
+            data[c] = values[:0]
+        elif c == 'high':
+            data[c] = np.maximum.reduceat(values, starts)
+        elif c == 'low':
+            data[c] = np.minimum.reduceat(values, starts)
+        elif c == 'close':
+            data[c] = values[ends]
+        elif str(c).startswith('volume'):
+            data[c] = np.add.reduceat(values, starts)
+        else:
+            data[c] = values[starts]
+
+    return pd.DataFrame(data, index=df.index[starts], columns=df.columns)
+
+
+def find_gaps(df: pd.DataFrame, freq: str, time_column: str = 'date') -> pd.DataFrame:
+    """Finds the missing candles of a history.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles in ascending time order.
+    freq : str
+        The period of the candles, e.g. '1min' or '1h'.
+    time_column : str
+        The column holding the time of each candle.
+    Returns
+    -------
+    `pd.DataFrame`
+        The 'start' and 'end' times of every gap and the number of candles
+        'missing' in it.
+    """
+    step = pd.Timedelta(freq).value
+    timestamps = _to_timestamps(df[time_column])
+    missing = np.diff(timestamps) // step - 1
+    gaps = np.flatnonzero(missing > 0)
+
+    return pd.DataFrame({
+        'start': pd.to_datetime(timestamps[gaps] + step),
+        'end': pd.to_datetime(timestamps[gaps + 1] - step),
+        'missing': missing[gaps]
+    })
+
+
+def clean_candles(df: pd.DataFrame, freq: str, time_column: str = 'date') -> pd.DataFrame:
+    """Sorts a candle history, removes its duplicate candles and fills its
+    gaps.
+
+    Candles are placed on a grid of `freq` periods starting at the first
+    one. Of the candles falling in the same period the last one is kept.
+    Missing candles are filled flat at the close of the previous candle,
+    with zero volume, and every other column takes the value of the previous
+    candle.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles, in any order.
+    freq : str
+        The period of the candles, e.g. '1min' or '1h'.
+    time_column : str
+        The column holding the time of each candle.
+    Returns
+    -------
+    `pd.DataFrame`
+        A candle per period from the first to the last one, in ascending
+        time order, with a datetime64 `time_column`.
+    """
+    if not len(df):
+        return df.reset_index(drop=True)
+
+    step = pd.Timedelta(freq).value
+    timestamps = _to_timestamps(df[time_column])
+
+    order = np.argsort(timestamps, kind='stable')
+    slots = (timestamps[order] - timestamps[order[0]]) // step
+
+    # the last candle of every period
+    last = np.append(slots[1:] != slots[:-1], True)
+    rows, slots = order[last], slots[last]
+
+    n = int(slots[-1]) + 1
+    present = np.zeros(n, dtype=bool)
+    present[slots] = True
+    source = np.full(n, -1, dtype=np.int64)
+    source[slots] = rows
+    # every period reads the last present candle at or before it
+    previous = source[np.maximum.accumulate(np.where(present, np.arange(n), 0))]
+
+    n_duplicates = len(df) - len(rows)
+    if n_duplicates or n > len(rows):
+        logging.info("Removed {} duplicate and filled {} missing candles.".format(n_duplicates, n - len(rows)))
+
+    close = df['close'].to_numpy()[previous]
+    data = {}
+    for c in df.columns:
+        if c == time_column:
+            data[c] = (timestamps[order[0]] + np.arange(n, dtype=np.int64) * step).view('datetime64[ns]')
+        elif c in ('open', 'high', 'low'):
+            data[c] = np.where(present, df[c].to_numpy()[previous], close)
+        elif str(c).startswith('volume'):
+            data[c] = np.where(present, df[c].to_numpy()[previous], 0)
+        else:
+            data[c] = df[c].to_numpy()[previous]
+
+    return pd.DataFrame(data, columns=df.columns)
+
+
+def time_bars(df: pd.DataFrame, freq: str, time_column: str = 'date') -> pd.DataFrame:
+    """Aggregates candles into bars of a longer period, e.g. '4h' or '15min'.
+
+    Bars start at multiples of `freq` since epoch and are labelled with their
+    start time. Periods without any candle have no bar, so gaps should be
+    filled with `clean_candles` beforehand.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles in ascending time order.
+    freq : str
+        The period of the bars.
+    time_column : str
+        The column holding the time of each candle.
+    Returns
+    -------
+    `pd.DataFrame`
+        The bars, with the columns of `df`.
+    """
+    step = pd.Timedelta(freq).value
+    periods = _to_timestamps(df[time_column]) // step
+    starts = np.flatnonzero(np.append(True, periods[1:] != periods[:-1])) if len(df) else np.empty(0, np.int64)
+
+    bars = aggregate(df, starts).reset_index(drop=True)
+    bars[time_column] = (periods[starts] * step).view('datetime64[ns]')
+    return bars
+
+
+def _threshold_bars(df: pd.DataFrame, value: np.ndarray, threshold: float) -> pd.DataFrame:
+    # a bar closes with the candle its cumulative value crosses a multiple of
+    # the threshold at
+    before = np.cumsum(value) - value
+    buckets = np.floor_divide(before, threshold)
+    starts = np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1])) if len(df) else np.empty(0, np.int64)
+    return aggregate(df, starts).reset_index(drop=True)
+
+
+def _volume(df: pd.DataFrame, volume_column: str = None) -> np.ndarray:
+    if volume_column is None:
+        volume_column = next(c for c in df.columns if str(c).startswith('volume'))
+    return df[volume_column].to_numpy(dtype=np.float64)
+
+
+def volume_bars(df: pd.DataFrame, threshold: float, volume_column: str = None) -> pd.DataFrame:
+    """Aggregates candles into bars of about `threshold` traded volume each.
+
+    A bar closes with the candle the cumulative volume of the history
+    crosses a multiple of `threshold` at, so the bars hold `threshold` volume
+    on average. A single candle crossing several multiples makes one bar.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles in ascending time order.
+    threshold : float
+        The volume of each bar.
+    volume_column : str, optional
+        The volume column, by default the first one starting with "volume".
+    Returns
+    -------
+    `pd.DataFrame`
+        The bars, with the columns of `df`.
+    """
+    return _threshold_bars(df, _volume(df, volume_column), threshold)
+
+
+def dollar_bars(df: pd.DataFrame,
+                threshold: float,
+                volume_column: str = None,
+                price_column: str = 'close') -> pd.DataFrame:
+    """Aggregates candles into bars of about `threshold` traded value each,
+    the value of a candle being its volume times its `price_column`.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candles in ascending time order.
+    threshold : float
+        The traded value of each bar.
+    volume_column : str, optional
+        The volume column, in units of the traded instrument, by default the
+        first one starting with "volume".
+    price_column : str
+        The price the volume is valued at.
+    Returns
+    -------
+    `pd.DataFrame`
+        The bars, with the columns of `df`.
+    """
+    value = _volume(df, volume_column) * df[price_column].to_numpy(dtype=np.float64)
+    return _threshold_bars(df, value, threshold)
+
+
+def _check_bar_size(freq: str, volume: float, dollar: float) -> None:
+    if sum(x is not None for x in (freq, volume, dollar)) != 1:
+        raise ValueError("Exactly one of freq, volume or dollar is needed, got {}.".format(
+            dict(freq=freq, volume=volume, dollar=dollar)))
+
+
+def bars(df: pd.DataFrame,
+         freq: str = None,
+         volume: float = None,
+         dollar: float = None,
+         time_column: str = 'date',
+         volume_column: str = None) -> pd.DataFrame:
+    """Builds time, volume or dollar bars from clean candles, given exactly one
+    of `freq`, `volume` or `dollar`."""
+    _check_bar_size(freq, volume, dollar)
+    if freq is not None:
+        return time_bars(df, freq, time_column)
+    if volume is not None:
+        return volume_bars(df, volume, volume_column)
+    return dollar_bars(df, dollar, volume_column)
+
+
+def bars_key(freq: str = None, volume: float = None, dollar: float = None) -> str:
+    """The part of the cache key telling the bars of `bars` apart."""
+    _check_bar_size(freq, volume, dollar)
+    if freq is not None:
+        return "time{}".format(pd.tseries.frequencies.to_offset(freq).freqstr)
+    # the shortest repr telling floats apart, so close sizes get their own
+    # entries
+    if volume is not None:
+        return "volume{!r}".format(float(volume))
+    return "dollar{!r}".format(float(dollar))
+
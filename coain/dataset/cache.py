@@ -0,0 +1,189 @@
+"""Contains an on-disk cache for OHLCV data fetched from
+https://www.cryptodatadownload.com.
+"""
+
+import os
+import time
+import tempfile
+
+from typing import Union, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class OHLCVCache:
+    """A columnar `.npz` cache of price histories keyed by exchange, pair and
+    timeframe.
+
+    Every entry stores each column of the fetched `pd.DataFrame` as its own
+    array together with an int64 `timestamp` column (nanoseconds since epoch)
+    used to order and merge candles, and the time at which it was last
+    refreshed.
+    Parameters
+    ----------
+    path : str
+        The folder the cache files are written to. It will be created if not
+        found.
+    ttl : float, optional
+        The number of seconds a cache entry is considered fresh. `None` means
+        entries never expire and are only refreshed on request.
+    Methods
+    -------
+    key(exchange_name,base_symbol,quote_symbol,timeframe)
+        Creates the key of a cache entry.
+    load(key)
+        Loads a cache entry.
+    update(key,df)
+        Appends the candles of `df` newer than the cached ones.
+    invalidate(key=None)
+        Removes one or every cache entry.
+    """
+
+    def __init__(self, path: str = 'data/cache', ttl: float = None) -> None:
+        self.path = path
+        self.ttl = ttl
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(exchange_name: str,
+            base_symbol: str,
+            quote_symbol: str,
+            timeframe: str,
+            *extra: str) -> str:
+        """Creates the key of a cache entry.
+        Parameters
+        ----------
+        exchange_name : str
+            The name of the exchange.
+        base_symbol : str
+            The base symbol fo the cryptocurrency pair.
+        quote_symbol : str
+            The quote symbol fo the cryptocurrency pair.
+        timeframe : str
+            The timeframe of the candles.
+        *extra : str
+            Any further strings needed to tell entries apart.
+        Returns
+        -------
+        str
+            The key of the cache entry.
+        """
+        parts = [exchange_name.lower(), quote_symbol + base_symbol, timeframe] + list(extra)
+        return "_".join(parts)
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.path, "{}.npz".format(key))
+
+    def age(self, key: str) -> Union[float, None]:
+        """The number of seconds since the entry was last refreshed, or `None`
+        if it is not cached."""
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as data:
+            return time.time() - float(data['__fetched_at__'])
+
+    def is_fresh(self, key: str) -> bool:
+        """Whether the entry is cached and younger than `ttl`."""
+        age = self.age(key)
+        if age is None:
+            return False
+        return self.ttl is None or age <= self.ttl
+
+    def load(self, key: str) -> Union[pd.DataFrame, None]:
+        """Loads a cache entry.
+        Parameters
+        ----------
+        key : str
+            The key of the cache entry.
+        Returns
+        -------
+        `pd.DataFrame`
+            The cached candles in ascending time order, or `None` if the entry
+            does not exist.
+        """
+        df, _ = self._read(key)
+        return df
+
+    def update(self, key: str, df: pd.DataFrame, time_column: str = 'date') -> pd.DataFrame:
+        """Appends the candles of `df` newer than the last cached timestamp and
+        stores the result.
+        Parameters
+        ----------
+        key : str
+            The key of the cache entry.
+        df : `pd.DataFrame`
+            Freshly fetched candles in ascending time order.
+        time_column : str
+            The column holding the time of each candle.
+        Returns
+        -------
+        `pd.DataFrame`
+            The full cached history after the update.
+        """
+        timestamps = _to_timestamps(df[time_column])
+        cached, cached_timestamps = self._read(key)
+
+        if cached is not None and len(cached_timestamps) > 0:
+            newer = timestamps > cached_timestamps[-1]
+            df = pd.concat([cached, df[newer]], ignore_index=True)
+            timestamps = np.concatenate([cached_timestamps, timestamps[newer]])
+        else:
+            df = df.reset_index(drop=True)
+
+        self._write(key, df, timestamps)
+        return df
+
+    def invalidate(self, key: str = None) -> None:
+        """Removes a cache entry, or every entry if `key` is `None`."""
+        if key is not None:
+            filenames = [self.filename(key)]
+        else:
+            filenames = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.npz')]
+
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _read(self, key: str) -> 'Tuple[pd.DataFrame, np.ndarray]':
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None, None
+
+        with np.load(filename, allow_pickle=False) as data:
+            columns = [str(c) for c in data['__columns__']]
+            df = pd.DataFrame({c: data['col_' + c] for c in columns}, columns=columns)
+            timestamps = data['__timestamp__']
+        return df, timestamps
+
+    def _write(self, key: str, df: pd.DataFrame, timestamps: np.ndarray) -> None:
+        arrays = {'col_' + c: _to_array(df[c]) for c in df.columns}
+        arrays['__columns__'] = np.array(list(df.columns), dtype=str)
+        arrays['__timestamp__'] = np.asarray(timestamps, dtype=np.int64)
+        arrays['__fetched_at__'] = np.array(time.time())
+
+        # write to a temporary file of its own first, so a crash never leaves a
+        # broken entry and concurrent writers of a key do not mix their files
+        fd, tmp = tempfile.mkstemp(prefix=".{}.".format(key), suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.filename(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def _to_timestamps(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        return column.to_numpy(dtype=np.int64)
+    return pd.to_datetime(column).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+def _to_array(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_object_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+        return column.astype(str).to_numpy(dtype=str)
+    return column.to_numpy()
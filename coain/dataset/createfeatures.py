@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from tensortrade.feed.core import Stream, DataFeed
 
@@ -16,29 +17,60 @@ def macd(price: Stream[float], fast: float, slow: float, signal: float) -> Strea
     return signal
 
 
+def sma_series(price: pd.Series, window: int) -> pd.Series:
+    """Vectorized counterpart of `price.rolling(window=window).mean()`."""
+    return price.rolling(window=window, min_periods=1).mean()
 
-def create_basic_features(df: pd.DataFrame):
-
-    df['change'] = df['open'] - df['close']
-    df['body'] = abs(df['change'])
-
-    df['abs'] =  df['change'].apply(lambda x: 1 if x > 0 else -1 )
-    #df['abs'] = df.apply(lambda x: calc_abs(df['change']), axis=1)
-
-
-    #df['abs']  = [1 if row > 0 else -1 for row in df['change']]
-
-    df['agreewick'] = [row.high - row.close if row.abs == 1 else row.close - row.low for row in df.itertuples()]
-    df['diswick'] = [row.open - row.low if row.abs == 1 else row.high - row.open for row in df.itertuples()]
-
-    df[df['agreewick'] == 0] = 0.01
-    df[df['diswick'] == 0] = 0.01
-
-    df['agreebodywick'] = [row.body/ row.agreewick for row in df.itertuples()]
-    df['disbodywick'] = [row.body / row.diswick for row in df.itertuples()]
+def rsi_series(price: pd.Series, period: float) -> pd.Series:
+    """Vectorized counterpart of `rsi`."""
+    r = price.diff()
+    upside = r.clip(lower=0).abs()
+    downside = r.clip(upper=0).abs()
+    rs = upside.ewm(alpha=1 / period).mean() / downside.ewm(alpha=1 / period).mean()
+    return 100 * (1 - (1 + rs) ** -1)
 
-    df = df.drop(['agreewick', 'diswick'], axis=1, inplace=False)
+def macd_series(price: pd.Series, fast: float, slow: float, signal: float) -> pd.Series:
+    """Vectorized counterpart of `macd`."""
+    fm = price.ewm(span=fast, adjust=False).mean()
+    sm = price.ewm(span=slow, adjust=False).mean()
+    md = fm - sm
+    signal = md - md.ewm(span=signal, adjust=False).mean()
+    return signal
 
 
-    return df
 
+def create_basic_features(df: pd.DataFrame, drop_zero_wicks: bool = True) -> pd.DataFrame:
+    """Creates the candle shape features of a price history.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The open, high, low and close of each candle. It is not modified.
+    drop_zero_wicks : bool
+        Whether to drop the candles with a wick of zero length. If False their
+        wick length is taken as 0.01 when computing the body to wick ratios.
+    Returns
+    -------
+    `pd.DataFrame`
+        The price history with the `change`, `body`, `abs`, `agreebodywick`
+        and `disbodywick` columns added.
+    """
+    change = df['open'].to_numpy() - df['close'].to_numpy()
+    body = np.abs(change)
+    up = change > 0
+
+    high = df['high'].to_numpy()
+    low = df['low'].to_numpy()
+    agreewick = np.where(up, high - df['close'].to_numpy(), df['close'].to_numpy() - low)
+    diswick = np.where(up, df['open'].to_numpy() - low, high - df['open'].to_numpy())
+
+    df = df.assign(change=change, body=body, abs=np.where(up, 1, -1))
+
+    zero_wick = (agreewick == 0) | (diswick == 0)
+    if drop_zero_wicks:
+        keep = ~zero_wick
+        df, body, agreewick, diswick = df[keep], body[keep], agreewick[keep], diswick[keep]
+    else:
+        agreewick = np.where(agreewick == 0, 0.01, agreewick)
+        diswick = np.where(diswick == 0, 0.01, diswick)
+
+    return df.assign(agreebodywick=body / agreewick, disbodywick=body / diswick)
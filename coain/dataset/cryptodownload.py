@@ -2,29 +2,116 @@
 https://www.cryptodatadownload.com.
 """
 
+import io
 import ssl
+import time
+import logging
+import threading
+
+from contextlib import closing, contextmanager
+from typing import IO, Dict, Iterator, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from coain.dataset.bars import bars, bars_key, clean_candles
+from coain.dataset.cache import OHLCVCache
+from coain.dataset.store import PriceStore
 
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
 
+# the period of the candles of each timeframe
+TIMEFRAMES = {"d": "1D", "h": "1h", "m": "1min"}
+
+
 class CryptoDataDownload:
     """Provides methods for retrieving data on different cryptocurrencies from
     https://www.cryptodatadownload.com/cdd/.
     Attributes
     ----------
     url : str
-        The url for collecting data from CryptoDataDownload.
+        The url for collecting data from CryptoDataDownload. A local folder
+        holding the same csv files can be used instead.
+    cache : `OHLCVCache`, optional
+        The cache used to store fetched data locally. Nothing is cached if
+        `None`.
+    pool_size : int
+        The number of connections kept alive per host by each http session.
+    verify : bool
+        Whether the https certificates of the url are verified. Requests
+        without verification warn with an `InsecureRequestWarning`.
+    timeout : float or Tuple[float, float]
+        The seconds a request waits to connect and then between bytes of the
+        response before it fails, as one number or a (connect, read) pair.
+    timings : dict
+        The seconds spent fetching each pair of the last `fetch_many` call.
+    errors : dict
+        The exception of each pair the last `fetch_many` call failed to fetch.
     Methods
     -------
-    fetch(exchange_name,base_symbol,quote_symbol,timeframe,include_all_volumes=False)
+    fetch(exchange_name,base_symbol,quote_symbol,timeframe,include_all_volumes=False,refresh=False)
         Fetches data for different exchanges and cryptocurrency pairs.
+    fetch_many(pairs,max_workers=8,retries=3,backoff=1.0,refresh=False)
+        Fetches data for many exchanges and cryptocurrency pairs in parallel.
+    ingest_binance(path,base_symbol,quote_symbol,timeframe,dtype='float32',chunksize=500000)
+        Streams the binance data of a pair into a `PriceStore`.
+    fetch_bars(exchange_name,base_symbol,quote_symbol,freq=None,volume=None,dollar=None,timeframe='m',refresh=False)
+        Builds time, volume or dollar bars from the candles of a pair.
     """
 
-    def __init__(self) -> None:
-        self.url = "https://www.cryptodatadownload.com/cdd/"
+    def __init__(self,
+                 url: str = None,
+                 cache: 'OHLCVCache' = None,
+                 pool_size: int = 8,
+                 verify: bool = True,
+                 timeout: 'Union[float, Tuple[float, float]]' = (10, 60)) -> None:
+        self.url = url or "https://www.cryptodatadownload.com/cdd/"
+        self.cache = cache
+        self.pool_size = pool_size
+        self.verify = verify
+        self.timeout = timeout
+        self.timings = {}
+        self.errors = {}
+
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        # sessions are not shared between threads, each keeps its own pool
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.verify = self.verify
+            self._local.session = session
+        return session
+
+    def _read_csv(self, filename: str) -> pd.DataFrame:
+        if not self.url.startswith(("http://", "https://")):
+            return pd.read_csv(self.url + filename, skiprows=1)
+
+        response = self._session().get(self.url + filename, timeout=self.timeout)
+        response.raise_for_status()
+        return pd.read_csv(io.StringIO(response.text), skiprows=1)
+
+    @contextmanager
+    def _open_csv(self, filename: str) -> 'Iterator[IO]':
+        """Opens a csv file for streaming, without downloading it first."""
+        if not self.url.startswith(("http://", "https://")):
+            with open(self.url + filename, "rb") as f:
+                yield f
+            return
+
+        with closing(self._session().get(self.url + filename, stream=True, timeout=self.timeout)) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield response.raw
 
     def fetch_default(self,
                       exchange_name: str,
@@ -58,7 +145,7 @@ class CryptoDataDownload:
         quote_vc = "Volume {}".format(quote_symbol)
         new_quote_vc = "volume_quote"
 
-        df = pd.read_csv(self.url + filename, skiprows=1)
+        df = self._read_csv(filename)
         df = df[::-1]
         df = df.drop(["symbol"], axis=1)
         df = df.rename({base_vc: new_base_vc, quote_vc: new_quote_vc, "Date": "date"}, axis=1)
@@ -100,7 +187,7 @@ class CryptoDataDownload:
         if timeframe.endswith("h"):
             timeframe = timeframe[:-1] + "hr"
         filename = "{}_{}{}_{}.csv".format("gemini", quote_symbol, base_symbol, timeframe)
-        df = pd.read_csv(self.url + filename, skiprows=1)
+        df = self._read_csv(filename)
         df = df[::-1]
         df = df.drop(["Symbol", "Unix Timestamp"], axis=1)
         df.columns = [name.lower() for name in df.columns]
@@ -128,15 +215,9 @@ class CryptoDataDownload:
             A open, high, low, close and volume for the specified
             cryptocurrency pair.
         """
-        if timeframe == 'm':
-            timeframe = 'minute'
-        if timeframe.endswith("h"):
-            timeframe = timeframe[:-1] + "1h"
+        filename = self._binance_filename(base_symbol, quote_symbol, timeframe)
 
-        filename = "{}_{}{}_{}.csv".format("Binance", quote_symbol, base_symbol, timeframe)
-
-
-        df = pd.read_csv(self.url + filename, skiprows=1)
+        df = self._read_csv(filename)
         df = df[::-1]
         df = df.drop(['symbol', 'unix', 'tradecount'], axis=1)
         df.columns = [name.lower() for name in df.columns]
@@ -144,12 +225,73 @@ class CryptoDataDownload:
         df = df.reset_index()
         return df, filename
 
+    def ingest_binance(self,
+                       path: str,
+                       base_symbol: str,
+                       quote_symbol: str,
+                       timeframe: str,
+                       dtype: str = 'float32',
+                       chunksize: int = 500000) -> 'Tuple[PriceStore, str]':
+        """Streams the binance data of a pair into a `PriceStore`.
+
+        Unlike `fetch_binance`, the csv is parsed in chunks of `chunksize`
+        rows written to the store as they come, with the values parsed
+        straight to `dtype` and the `unix` column as the time of each row,
+        so years of minute candles are stored with the memory of a few
+        chunks. The store holds the columns of `fetch_binance` besides the
+        date, in ascending time order.
+        Parameters
+        ----------
+        path : str
+            The folder to write the store to.
+        base_symbol : str
+            The base symbol fo the cryptocurrency pair.
+        quote_symbol : str
+            The quote symbol fo the cryptocurrency pair.
+        timeframe : {"d", "h", "m"}
+            The timeframe to collect data from.
+        dtype : {'float32', 'float64'}
+            The dtype the values are stored as.
+        chunksize : int
+            The number of rows parsed at once.
+        Returns
+        -------
+        `PriceStore`
+            The store opened for reading.
+        str
+            The name of the csv file.
+        """
+        filename = self._binance_filename(base_symbol, quote_symbol, timeframe)
+        columns = ["open", "high", "low", "close", "Volume {}".format(quote_symbol), "Volume {}".format(base_symbol)]
+
+        with self._open_csv(filename) as f:
+            store = PriceStore.write_csv(
+                path,
+                f,
+                columns={c: c.lower() for c in columns},
+                time_column="unix",
+                dtype=dtype,
+                chunksize=chunksize,
+                skiprows=1
+            )
+        return store, filename
+
+    @staticmethod
+    def _binance_filename(base_symbol: str, quote_symbol: str, timeframe: str) -> str:
+        if timeframe == 'm':
+            timeframe = 'minute'
+        if timeframe.endswith("h"):
+            timeframe = timeframe[:-1] + "1h"
+
+        return "{}_{}{}_{}.csv".format("Binance", quote_symbol, base_symbol, timeframe)
+
     def fetch(self,
               exchange_name: str,
               base_symbol: str,
               quote_symbol: str,
               timeframe: str,
-              include_all_volumes: bool = False) -> pd.DataFrame:
+              include_all_volumes: bool = False,
+              refresh: bool = False) -> pd.DataFrame:
         """Fetches data for different exchanges and cryptocurrency pairs.
         Parameters
         ----------
@@ -163,12 +305,108 @@ class CryptoDataDownload:
             The timeframe to collect data from.
         include_all_volumes : bool, optional
             Whether or not to include both base and quote volume.
+        refresh : bool, optional
+            Whether or not to download the data even if a fresh copy is cached.
+            Only candles newer than the cached ones are added to the cache.
         Returns
         -------
         `pd.DataFrame`
             A open, high, low, close and volume for the specified exchange and
             cryptocurrency pair.
         """
+        if self.cache is None:
+            return self._fetch(exchange_name, base_symbol, quote_symbol, timeframe, include_all_volumes)
+
+        is_binance = exchange_name.lower() == "binance"
+        extra = ["all"] if include_all_volumes and exchange_name.lower() not in ("gemini", "binance") else []
+        key = self.cache.key(exchange_name, base_symbol, quote_symbol, timeframe, *extra)
+
+        if refresh or not self.cache.is_fresh(key):
+            df = self._fetch(exchange_name, base_symbol, quote_symbol, timeframe, include_all_volumes)
+            if is_binance:
+                df = df[0]
+            df = self.cache.update(key, df)
+        else:
+            df = self.cache.load(key)
+
+        if is_binance:
+            return df, self._binance_filename(base_symbol, quote_symbol, timeframe)
+        return df
+
+    def fetch_bars(self,
+                   exchange_name: str,
+                   base_symbol: str,
+                   quote_symbol: str,
+                   freq: str = None,
+                   volume: float = None,
+                   dollar: float = None,
+                   timeframe: str = 'm',
+                   volume_column: str = None,
+                   refresh: bool = False) -> pd.DataFrame:
+        """Builds time, volume or dollar bars from the candles of a pair.
+
+        The candles of `timeframe` are fetched through the cache, cleaned
+        with `clean_candles`, which removes duplicate candles and fills gaps,
+        and aggregated into bars of `freq`, e.g. '4h' or '15min', of `volume`
+        traded volume or of `dollar` traded value, whichever is given. The
+        bars are cached too and only built again once the candles are
+        refreshed, so any number of bar sizes is served from one download.
+        Parameters
+        ----------
+        exchange_name : str
+            The name of the exchange.
+        base_symbol : str
+            The base symbol fo the cryptocurrency pair.
+        quote_symbol : str
+            The quote symbol fo the cryptocurrency pair.
+        freq : str, optional
+            The period of time bars.
+        volume : float, optional
+            The traded volume of volume bars.
+        dollar : float, optional
+            The traded value of dollar bars.
+        timeframe : {"d", "h", "m"}
+            The timeframe of the candles the bars are built from.
+        volume_column : str, optional
+            The volume column of volume and dollar bars, by default the first
+            one.
+        refresh : bool, optional
+            Whether or not to download the candles even if a fresh copy is
+            cached.
+        Returns
+        -------
+        `pd.DataFrame`
+            The bars, with the columns of the candles.
+        """
+        key = None
+        if self.cache is not None:
+            extra = [bars_key(freq, volume, dollar)] + ([volume_column] if volume_column else [])
+            key = self.cache.key(exchange_name, base_symbol, quote_symbol, timeframe, *extra)
+            candles_key = self.cache.key(exchange_name, base_symbol, quote_symbol, timeframe)
+
+            # bars built since the candles were last refreshed are up to date
+            age, candles_age = self.cache.age(key), self.cache.age(candles_key)
+            if not refresh and age is not None and self.cache.is_fresh(candles_key) and age <= candles_age:
+                return self.cache.load(key)
+
+        candles = self.fetch(exchange_name, base_symbol, quote_symbol, timeframe, refresh=refresh)
+        if isinstance(candles, tuple):
+            candles = candles[0]
+
+        candles = clean_candles(candles, TIMEFRAMES[timeframe], time_column="date")
+        df = bars(candles, freq, volume, dollar, time_column="date", volume_column=volume_column)
+
+        if key is not None:
+            self.cache.invalidate(key)
+            df = self.cache.update(key, df)
+        return df
+
+    def _fetch(self,
+               exchange_name: str,
+               base_symbol: str,
+               quote_symbol: str,
+               timeframe: str,
+               include_all_volumes: bool = False) -> pd.DataFrame:
         if exchange_name.lower() == "gemini":
             return self.fetch_gemini(base_symbol, quote_symbol, timeframe)
         if exchange_name.lower() == "binance":
@@ -178,4 +416,76 @@ class CryptoDataDownload:
                                   base_symbol,
                                   quote_symbol,
                                   timeframe,
-                                  include_all_volumes=include_all_volumes)
\ No newline at end of file
+                                  include_all_volumes=include_all_volumes)
+
+    def fetch_many(self,
+                   pairs: 'List[Tuple[str, str, str, str]]',
+                   max_workers: int = 8,
+                   retries: int = 3,
+                   backoff: float = 1.0,
+                   refresh: bool = False) -> 'Dict[Tuple[str, str, str, str], pd.DataFrame]':
+        """Fetches data for many exchanges and cryptocurrency pairs in parallel.
+        Parameters
+        ----------
+        pairs : List[Tuple[str, str, str, str]]
+            The (exchange_name, base_symbol, quote_symbol, timeframe) of each
+            pair to fetch.
+        max_workers : int
+            The maximum number of downloads running at the same time.
+        retries : int
+            The number of times a download is tried again after a connection
+            error, a timeout or a 429 or 5xx response. Other errors, like a
+            missing file, are not retried.
+        backoff : float
+            The seconds to wait before the first retry, doubled on each
+            following one.
+        refresh : bool, optional
+            Whether or not to download the data even if a fresh copy is cached.
+        Returns
+        -------
+        Dict[Tuple[str, str, str, str], `pd.DataFrame`]
+            The open, high, low, close and volume of each pair fetched. The
+            seconds spent on each pair are stored in `timings`. Pairs still
+            failing after the retries are left out and logged, and their
+            exception is stored in `errors`.
+        """
+        pairs = [tuple(p) for p in pairs]
+        self.timings = {}
+        self.errors = {}
+
+        def fetch_one(pair):
+            start = time.perf_counter()
+            for attempt in range(retries + 1):
+                try:
+                    df = self.fetch(*pair, refresh=refresh)
+                    break
+                except Exception as e:
+                    if attempt == retries or not _is_transient(e):
+                        raise
+                    logging.warning("Fetching {} failed ({}). Retrying.".format(pair, e))
+                    time.sleep(backoff * 2 ** attempt)
+            if isinstance(df, tuple):
+                df = df[0]
+            return df, time.perf_counter() - start
+
+        data = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch_one, p): p for p in pairs}
+            for future in as_completed(futures):
+                pair = futures[future]
+                try:
+                    data[pair], self.timings[pair] = future.result()
+                except Exception as e:
+                    logging.error("Fetching {} failed ({}).".format(pair, e))
+                    self.errors[pair] = e
+
+        return {p: data[p] for p in pairs if p in data}
+
+
+def _is_transient(error: Exception) -> bool:
+    # whether a failed request may succeed when tried again
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None and \
+        (response.status_code == 429 or response.status_code >= 500)
@@ -0,0 +1,278 @@
+"""Contains a feature engine that updates the trading features one candle at a
+time.
+"""
+
+import json
+
+from collections import deque
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+
+class EWMean:
+    """The online counterpart of `Stream.ewm(...).mean()`.
+
+    Follows the same update rule as the exponential weighted moving average
+    of pandas and tensortrade, so results match them to floating point
+    precision.
+    Parameters
+    ----------
+    alpha : float
+        The smoothing factor.
+    adjust : bool
+        Divide by decaying adjustment factor in beginning periods.
+    """
+
+    def __init__(self, alpha: float, adjust: bool = True) -> None:
+        self.alpha = alpha
+        self.adjust = adjust
+        self.reset()
+
+    def reset(self) -> None:
+        self.avg = None
+        self.n = 0
+        self.old_wt = 1.
+
+    def update(self, value: float) -> float:
+        is_observation = value == value
+        self.n += int(is_observation)
+
+        if self.avg is None:
+            self.avg = value
+        elif self.avg == self.avg:
+            self.old_wt *= 1 - self.alpha
+            if is_observation:
+                new_wt = 1. if self.adjust else self.alpha
+                if self.avg != value:
+                    self.avg = (self.old_wt * self.avg + new_wt * value) / (self.old_wt + new_wt)
+                self.old_wt = self.old_wt + new_wt if self.adjust else 1.
+        elif is_observation:
+            self.avg = value
+
+        return self.avg if self.n >= 1 else np.nan
+
+    def state_dict(self) -> dict:
+        return {"avg": self.avg, "n": self.n, "old_wt": self.old_wt}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.avg, self.n, self.old_wt = state["avg"], state["n"], state["old_wt"]
+
+
+class RollingMean:
+    """The online counterpart of `Stream.rolling(window).mean()`.
+
+    Keeps a running sum over the window. The sum is recomputed from the window
+    once every `window` updates so rounding errors never build up.
+    Parameters
+    ----------
+    window : int
+        The size of the rolling window.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self.values = deque(maxlen=self.window)
+        self.total = 0.
+        self.count = 0
+        self.n = 0
+
+    def update(self, value: float) -> float:
+        if len(self.values) == self.window:
+            old = self.values[0]
+            if old == old:
+                self.total -= old
+                self.count -= 1
+
+        self.values.append(value)
+        if value == value:
+            self.total += value
+            self.count += 1
+
+        self.n += 1
+        if self.n % self.window == 0:
+            self.total = float(np.nansum(self.values))
+
+        return self.total / self.count if self.count else np.nan
+
+    def state_dict(self) -> dict:
+        return {"values": list(self.values), "total": self.total, "count": self.count, "n": self.n}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.values = deque(state["values"], maxlen=self.window)
+        self.total, self.count, self.n = state["total"], state["count"], state["n"]
+
+
+class FeatureEngine:
+    """Computes the features of `create_basic_features`, the close price SMAs,
+    `rsi` and `macd` incrementally, in constant time per candle.
+
+    Feeding a price history through `update` candle by candle gives the same
+    columns as running `create_basic_features` over the whole history and
+    evaluating the feature streams built in `trade_ai.create_env`.
+    Parameters
+    ----------
+    sma_windows : Dict[str, int]
+        The name and window of each simple moving average of the close price.
+    rsi_period : float
+        The period of the relative strength index.
+    macd_fast : float
+        The span of the fast moving average of the macd.
+    macd_slow : float
+        The span of the slow moving average of the macd.
+    macd_signal : float
+        The span of the signal line of the macd.
+    drop_zero_wicks : bool
+        Whether to skip candles with a wick of zero length, as
+        `create_basic_features` drops them.
+    Methods
+    -------
+    update(candle)
+        Computes the features of a new candle.
+    update_many(df)
+        Computes the features of a batch of new candles.
+    state_dict()
+        The state of the engine.
+    load_state_dict(state)
+        Restores the state of the engine.
+    """
+
+    def __init__(self,
+                 sma_windows: 'Dict[str, int]' = None,
+                 rsi_period: float = 20,
+                 macd_fast: float = 10,
+                 macd_slow: float = 50,
+                 macd_signal: float = 5,
+                 drop_zero_wicks: bool = True) -> None:
+        self.sma_windows = sma_windows or {"fast": 10, "medium": 50, "slow": 100}
+        self.drop_zero_wicks = drop_zero_wicks
+
+        self._sma = {name: RollingMean(w) for name, w in self.sma_windows.items()}
+        self._upside = EWMean(alpha=1 / rsi_period)
+        self._downside = EWMean(alpha=1 / rsi_period)
+        self._fast = EWMean(alpha=2 / (macd_fast + 1), adjust=False)
+        self._slow = EWMean(alpha=2 / (macd_slow + 1), adjust=False)
+        self._signal = EWMean(alpha=2 / (macd_signal + 1), adjust=False)
+        self._last_close = np.nan
+
+    @property
+    def columns(self) -> 'List[str]':
+        """The names of the computed features, in output order."""
+        return ["change", "body", "abs", "agreebodywick", "disbodywick"] + list(self.sma_windows) + ["rsi", "macd"]
+
+    def _indicators(self) -> list:
+        return list(self._sma.values()) + [self._upside, self._downside, self._fast, self._slow, self._signal]
+
+    def update(self, candle: 'Union[dict, pd.Series]') -> 'Union[dict, None]':
+        """Computes the features of a new candle.
+        Parameters
+        ----------
+        candle : dict
+            The open, high, low and close of the candle.
+        Returns
+        -------
+        dict
+            The features of the candle, or `None` if it was skipped for having
+            a wick of zero length.
+        """
+        o, h, l, c = float(candle["open"]), float(candle["high"]), float(candle["low"]), float(candle["close"])
+
+        change = o - c
+        up = change > 0
+        agreewick = h - c if up else c - l
+        diswick = o - l if up else h - o
+
+        if agreewick == 0 or diswick == 0:
+            if self.drop_zero_wicks:
+                return None
+            agreewick = agreewick or 0.01
+            diswick = diswick or 0.01
+
+        features = {
+            "change": change,
+            "body": abs(change),
+            "abs": 1 if up else -1,
+            "agreebodywick": abs(change) / agreewick,
+            "disbodywick": abs(change) / diswick
+        }
+
+        for name, sma in self._sma.items():
+            features[name] = sma.update(c)
+
+        r = c - self._last_close
+        self._last_close = c
+        upside = self._upside.update(abs(max(r, 0)) if r == r else r)
+        downside = self._downside.update(abs(min(r, 0)) if r == r else r)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = np.float64(upside) / np.float64(downside)
+            features["rsi"] = float(100 * (1 - (1 + rs) ** -1))
+
+        md = self._fast.update(c) - self._slow.update(c)
+        features["macd"] = md - self._signal.update(md)
+
+        return features
+
+    def update_many(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Computes the features of a batch of new candles.
+        Parameters
+        ----------
+        df : `pd.DataFrame`
+            The open, high, low and close of the candles in ascending time
+            order.
+        Returns
+        -------
+        `pd.DataFrame`
+            The features of the candles that were not skipped, indexed like
+            `df`.
+        """
+        rows, index = [], []
+        columns = [df[c].to_numpy() for c in ("open", "high", "low", "close")]
+        for i, (o, h, l, c) in zip(df.index, zip(*columns)):
+            features = self.update({"open": o, "high": h, "low": l, "close": c})
+            if features is not None:
+                rows += [features]
+                index += [i]
+        return pd.DataFrame(rows, index=index, columns=self.columns)
+
+    def reset(self) -> None:
+        for indicator in self._indicators():
+            indicator.reset()
+        self._last_close = np.nan
+
+    def state_dict(self) -> dict:
+        """The state of the engine as a json serializable dict."""
+        return {
+            "sma": {name: sma.state_dict() for name, sma in self._sma.items()},
+            "upside": self._upside.state_dict(),
+            "downside": self._downside.state_dict(),
+            "fast": self._fast.state_dict(),
+            "slow": self._slow.state_dict(),
+            "signal": self._signal.state_dict(),
+            "last_close": self._last_close
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        """Restores the state of the engine from `state_dict`."""
+        for name, sma in self._sma.items():
+            sma.load_state_dict(state["sma"][name])
+        self._upside.load_state_dict(state["upside"])
+        self._downside.load_state_dict(state["downside"])
+        self._fast.load_state_dict(state["fast"])
+        self._slow.load_state_dict(state["slow"])
+        self._signal.load_state_dict(state["signal"])
+        self._last_close = state["last_close"]
+
+    def save(self, path: str) -> None:
+        """Saves the state of the engine to a json file."""
+        with open(path, "w") as f:
+            json.dump(self.state_dict(), f)
+
+    def restore(self, path: str) -> None:
+        """Restores the state of the engine from a json file written by
+        `save`."""
+        with open(path) as f:
+            self.load_state_dict(json.load(f))
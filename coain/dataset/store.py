@@ -0,0 +1,347 @@
+"""Contains a memory-mapped columnar store for price histories."""
+
+import os
+import json
+import shutil
+import tempfile
+
+from typing import IO, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from coain.dataset.cache import _to_timestamps
+
+
+class PriceStore:
+    """A folder of fixed dtype column files read through `numpy.memmap`.
+
+    Every numeric column of a price history is written to its own raw binary
+    file next to an int64 `timestamp` column holding nanoseconds since epoch.
+    Columns are opened read-only, so all the processes of a node reading the
+    same store share one page-cached copy of the data and slicing it by index
+    range never copies. They are all mapped when the store is opened, so an
+    open store keeps reading the same data when another one is written to
+    its folder.
+    Parameters
+    ----------
+    path : str
+        The folder holding the store.
+    Attributes
+    ----------
+    columns : List[str]
+        The names of the stored value columns, excluding `timestamp`.
+    Methods
+    -------
+    write(path,df,time_column='date',dtype='float64')
+        Writes a `pd.DataFrame` to a new store.
+    write_csv(path,filepath_or_buffer,columns,time_column='unix',dtype='float64',chunksize=500000,**kwargs)
+        Streams a csv file to a new store, chunk by chunk.
+    column(name,start=None,stop=None)
+        A read-only view of a column.
+    slice(start=None,stop=None)
+        Read-only views of every column.
+    frame(start=None,stop=None,time_column='time')
+        A `pd.DataFrame` backed by views of every column.
+    """
+
+    meta_filename = "meta.json"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(os.path.join(path, self.meta_filename)) as f:
+            self._meta = json.load(f)
+
+        self.columns = [c for c in self._meta["columns"] if c != "timestamp"]
+        self._arrays = {}
+        for name in self._meta["columns"]:
+            self._array(name)
+
+    @classmethod
+    def write(cls,
+              path: str,
+              df: pd.DataFrame,
+              time_column: str = 'date',
+              dtype: str = 'float64') -> 'PriceStore':
+        """Writes a `pd.DataFrame` to a new store.
+        Parameters
+        ----------
+        path : str
+            The folder to write the store to. It will be created if not found,
+            and a folder already there is replaced with everything in it.
+        df : `pd.DataFrame`
+            The price history in ascending time order.
+        time_column : str
+            The column holding the time of each row.
+        dtype : {'float64', 'float32'}
+            The dtype the numeric columns are stored as.
+        Returns
+        -------
+        `PriceStore`
+            The store opened for reading.
+        """
+        columns = {}
+        for c in df.columns:
+            if c != time_column and pd.api.types.is_numeric_dtype(df[c].dtype):
+                columns[c] = df[c].to_numpy(dtype=dtype)
+
+        with PriceStoreWriter(path) as writer:
+            writer.append(_to_timestamps(df[time_column]), columns)
+        return writer.store
+
+    @classmethod
+    def write_csv(cls,
+                  path: str,
+                  filepath_or_buffer: 'Union[str, IO]',
+                  columns: 'Union[List[str], Dict[str, str]]',
+                  time_column: str = 'unix',
+                  dtype: str = 'float64',
+                  chunksize: int = 500000,
+                  **kwargs) -> 'PriceStore':
+        """Streams a csv file to a new store, chunk by chunk.
+
+        Only the time column and the value `columns` are parsed, the values
+        straight to `dtype`, and each chunk is appended to the column files
+        before the next one is read, so the memory used is a small multiple
+        of the chunk size whatever the size of the file. Files in descending
+        time order are reversed on disk once written.
+        Parameters
+        ----------
+        path : str
+            The folder to write the store to. It will be created if not found,
+            and a folder already there is replaced with everything in it.
+        filepath_or_buffer : str or file-like
+            The csv file.
+        columns : List[str] or Dict[str, str]
+            The value columns of the csv to store, or a mapping of them to
+            the names they are stored under.
+        time_column : str
+            The column holding the time of each row, either unix times in
+            seconds, milliseconds, microseconds or nanoseconds, told apart by
+            their magnitude, or dates.
+        dtype : {'float64', 'float32'}
+            The dtype the value columns are parsed and stored as.
+        chunksize : int
+            The number of rows read at once.
+        **kwargs : keyword arguments
+            Extra keyword arguments passed to `pd.read_csv`, e.g. `skiprows`.
+        Returns
+        -------
+        `PriceStore`
+            The store opened for reading.
+        """
+        names = columns if isinstance(columns, dict) else {c: c for c in columns}
+        chunks = pd.read_csv(
+            filepath_or_buffer,
+            usecols=[time_column] + list(names),
+            dtype={c: dtype for c in names},
+            chunksize=chunksize,
+            **kwargs
+        )
+
+        with PriceStoreWriter(path) as writer:
+            for chunk in chunks:
+                times = chunk[time_column]
+                if pd.api.types.is_numeric_dtype(times.dtype):
+                    timestamps = _unix_to_timestamps(times.to_numpy(dtype=np.int64))
+                else:
+                    timestamps = _to_timestamps(times)
+                writer.append(timestamps, {name: chunk[c].to_numpy() for c, name in names.items()})
+        return writer.store
+
+    def __len__(self) -> int:
+        return self._meta["length"]
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self.column("timestamp")
+
+    def _array(self, name: str) -> np.memmap:
+        if name not in self._arrays:
+            if name not in self._meta["files"]:
+                raise KeyError("Column '{}' is not in the store.".format(name))
+
+            filename = os.path.join(self.path, self._meta["files"][name])
+            dtype = np.dtype(self._meta["dtypes"][name])
+            if len(self) == 0:
+                self._arrays[name] = np.empty(0, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(filename, dtype=dtype, mode="r", shape=(len(self),))
+        return self._arrays[name]
+
+    def column(self, name: str, start: int = None, stop: int = None) -> np.ndarray:
+        """A read-only view of a column.
+        Parameters
+        ----------
+        name : str
+            The name of the column.
+        start : int, optional
+            The first row of the range. Negative values count from the end.
+        stop : int, optional
+            The row after the last one of the range. Negative values count
+            from the end.
+        Returns
+        -------
+        `np.ndarray`
+            A view of the rows in the range.
+        """
+        return self._array(name)[start:stop]
+
+    def slice(self, start: int = None, stop: int = None, columns: 'List[str]' = None) -> 'Dict[str, np.ndarray]':
+        """Read-only views of the `columns` (default all) in a range of rows."""
+        columns = columns or ["timestamp"] + self.columns
+        return {c: self.column(c, start, stop) for c in columns}
+
+    def frame(self, start: int = None, stop: int = None, time_column: str = 'time') -> pd.DataFrame:
+        """A `pd.DataFrame` backed by views of every column in a range of rows.
+
+        The timestamps are exposed as a datetime64 view named `time_column`,
+        the first column, followed by the value columns in stored order.
+        """
+        data = {time_column: self.column("timestamp", start, stop).view("datetime64[ns]")}
+        for c in self.columns:
+            data[c] = self.column(c, start, stop)
+        return pd.DataFrame(data, copy=False)
+
+
+class PriceStoreWriter:
+    """Writes a `PriceStore` chunk by chunk, so histories larger than memory
+    can be stored.
+
+    Every appended chunk is written to the end of the column files at once.
+    The files are written to a temporary folder next to `path`, which
+    replaces the folder when the writer is closed, so a store being written
+    is never opened half done, no file of an older store is left behind, and
+    processes that memory-mapped the older store keep reading its files
+    rather than files truncated under them. Rows appended in descending time
+    order, as in the csv files of CryptoDataDownload, are reversed on disk
+    when the writer is closed, `block_size` rows at a time.
+    Parameters
+    ----------
+    path : str
+        The folder to write the store to. It will be created if not found,
+        and a folder already there is replaced with everything in it.
+    block_size : int
+        The number of rows held in memory while reversing a column.
+    Attributes
+    ----------
+    store : `PriceStore`
+        The store opened for reading, once the writer is closed.
+    """
+
+    def __init__(self, path: str, block_size: int = 1 << 20) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.store = None
+
+        # a sibling folder, so it can be renamed to the store folder
+        parent, name = os.path.split(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._folder = tempfile.mkdtemp(prefix=".{}.".format(name), dir=parent)
+
+        self._files = {}
+        self._dtypes = {}
+        self._length = 0
+        self._first = None
+        self._last = None
+
+    def append(self, timestamps: np.ndarray, columns: 'Dict[str, np.ndarray]') -> None:
+        """Appends rows to the store.
+        Parameters
+        ----------
+        timestamps : `np.ndarray`
+            The time of each row, in int64 nanoseconds since epoch.
+        columns : Dict[str, `np.ndarray`]
+            The values of each row, the same columns for every chunk.
+        """
+        columns = dict(timestamp=np.asarray(timestamps, dtype=np.int64), **columns)
+        if not self._files:
+            for i, name in enumerate(columns):
+                self._files[name] = open(os.path.join(self._folder, "{}.bin".format(i)), "wb")
+                self._dtypes[name] = np.asarray(columns[name]).dtype
+        elif set(columns) != set(self._files):
+            raise ValueError("Expected the columns {}, got {}.".format(list(self._files), list(columns)))
+
+        if not len(columns["timestamp"]):
+            return
+
+        for name, values in columns.items():
+            np.ascontiguousarray(values, dtype=self._dtypes[name]).tofile(self._files[name])
+
+        self._length += len(columns["timestamp"])
+        if self._first is None:
+            self._first = columns["timestamp"][0]
+        self._last = columns["timestamp"][-1]
+
+    def _reverse(self, filename: str, dtype: 'np.dtype') -> None:
+        source = np.memmap(filename, dtype=dtype, mode="r", shape=(self._length,))
+        with open(filename + ".tmp", "wb") as f:
+            for stop in range(self._length, 0, -self.block_size):
+                source[max(stop - self.block_size, 0):stop][::-1].tofile(f)
+        del source
+        os.replace(filename + ".tmp", filename)
+
+    def close(self) -> 'PriceStore':
+        """Finishes the column files, writes the metadata and opens the
+        store.
+        Returns
+        -------
+        `PriceStore`
+            The store opened for reading.
+        """
+        if self.store is not None:
+            return self.store
+
+        for f in self._files.values():
+            f.close()
+
+        descending = self._length > 1 and self._first > self._last
+        meta = {"length": self._length, "columns": [], "dtypes": {}, "files": {}}
+        for name, f in self._files.items():
+            if descending:
+                self._reverse(f.name, self._dtypes[name])
+
+            meta["columns"] += [name]
+            meta["dtypes"][name] = self._dtypes[name].str
+            meta["files"][name] = os.path.basename(f.name)
+
+        with open(os.path.join(self._folder, PriceStore.meta_filename), "w") as f:
+            json.dump(meta, f)
+
+        # the folder of the older store is moved aside rather than deleted in
+        # place, its files live on until the processes mapping them close them
+        replaced = None
+        if os.path.exists(self.path):
+            replaced = self._folder + ".replaced"
+            os.replace(self.path, replaced)
+        os.replace(self._folder, self.path)
+        if replaced is not None:
+            shutil.rmtree(replaced, ignore_errors=True)
+
+        self.store = PriceStore(self.path)
+        return self.store
+
+    def __enter__(self) -> 'PriceStoreWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self._files.values():
+                f.close()
+            shutil.rmtree(self._folder, ignore_errors=True)
+
+
+def _unix_to_timestamps(unix: np.ndarray) -> np.ndarray:
+    """Converts unix times to nanoseconds, telling seconds, milliseconds,
+    microseconds and nanoseconds apart by their magnitude, as files mixing
+    them exist."""
+    unix = np.asarray(unix, dtype=np.int64)
+    scale = np.select(
+        [unix < 10 ** 11, unix < 10 ** 14, unix < 10 ** 17],
+        [10 ** 9, 10 ** 6, 10 ** 3],
+        default=1
+    )
+    return unix * scale
@@ -0,0 +1,352 @@
+"""Contains a backtester replaying fixed action sequences in one vectorized
+pass."""
+
+from decimal import Decimal
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+
+def _quantize(values: np.ndarray, precision: int) -> np.ndarray:
+    """The integer units of `Decimal(value).quantize(10 ** -precision)` for
+    every float of `values`."""
+    scaled = values * 10. ** precision
+    units = np.rint(scaled)
+
+    # scaling rounds, so values next to a tie are quantized with decimals
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        units[i] = int(Decimal(float(values[i])).quantize(Decimal(10) ** -precision).scaleb(precision))
+
+    return units.astype(np.int64)
+
+
+def _multiply(a: np.ndarray, b: 'Union[np.ndarray, int]') -> np.ndarray:
+    """Multiplies integer arrays, in python integers if int64 could
+    overflow."""
+    if int(np.max(a, initial=0)) * int(np.max(b, initial=0)) >= 2 ** 62:
+        return np.asarray(a, dtype=object) * np.asarray(b, dtype=object)
+    return a * b
+
+
+def _divide(numerator: np.ndarray, denominator: 'Union[np.ndarray, int]', tie: int = 0) -> np.ndarray:
+    """Divides non negative integers rounding to the nearest integer, with ties
+    rounded up if `tie` is positive, down if negative and to even otherwise."""
+    quotient, remainder = numerator // denominator, numerator % denominator
+    twice = 2 * remainder
+    up = (twice > denominator) | ((twice == denominator) & ((tie > 0) | ((tie == 0) & (quotient % 2 == 1))))
+    return (quotient + up.astype(np.int64)).astype(np.int64)
+
+
+class BacktestResult:
+    """The outcome of replaying a batch of action sequences.
+
+    Every curve has one column per step of the episode: column 0 holds the
+    starting balances and column t + 1 the balances after the orders of step
+    t, valued at the price of step t + 1, like the `performance` of the
+    portfolio of a `TradingEnv`. After an episode is stopped its balances stay
+    frozen, so the last column is always the final value.
+    Attributes
+    ----------
+    cash : `np.ndarray`
+        The cash balance of every policy over time.
+    asset : `np.ndarray`
+        The asset balance of every policy over time.
+    net_worth : `np.ndarray`
+        The net worth of every policy over time.
+    end : `np.ndarray`
+        The step at which the episode of every policy was stopped.
+    trades : `pd.DataFrame`
+        The filled orders, with the policy, step, side, price, quantity
+        sent, commission paid and quantity received of each.
+    """
+
+    def __init__(self,
+                 cash: np.ndarray,
+                 asset: np.ndarray,
+                 net_worth: np.ndarray,
+                 end: np.ndarray,
+                 trades: pd.DataFrame) -> None:
+        self.cash = cash
+        self.asset = asset
+        self.net_worth = net_worth
+        self.end = end
+        self.trades = trades
+
+    @property
+    def final_net_worth(self) -> np.ndarray:
+        """The net worth of every policy at the end of its episode."""
+        return self.net_worth[..., -1]
+
+    @property
+    def returns(self) -> np.ndarray:
+        """The total return of every policy over its episode."""
+        return self.net_worth[..., -1] / self.net_worth[..., 0] - 1
+
+
+
+
+class Backtest:
+    """Replays fixed action sequences of the `BuySellHold` or `MySimpleOrders`
+    action schemes over a price history without stepping a `TradingEnv`.
+
+    Market orders are filled like the simulated `execute_order` service does:
+    at the price quantized to the cash precision, paying `commission` on the
+    quantity sent, with orders cancelled when their commission is below the
+    precision of the instrument sent. Balances are kept in integer units of
+    their instrument and rounded the way the `Decimal` quantities of the oms
+    are, so results match the ones of a `TradingEnv` exactly. The rounding
+    makes each fill depend on the balances left by the previous one, so fills
+    are computed one order at a time but for all policies at once, and
+    everything else (orders, curves, stops, trade list) over the whole
+    history in array operations.
+    Parameters
+    ----------
+    prices : `np.ndarray`
+        The price history of the traded pair.
+    cash : float
+        The starting cash balance.
+    asset : float
+        The starting asset balance.
+    cash_precision : int
+        The precision of the cash instrument.
+    asset_precision : int
+        The precision of the asset instrument.
+    commission : float
+        The commission of the exchange.
+    max_allowed_loss : float
+        The fraction of the initial net worth that can be lost before an
+        episode stops, as in the `MaxLossStopper`.
+    Methods
+    -------
+    buy_sell_hold(actions)
+        Replays actions of the `BuySellHold` action scheme.
+    simple_orders(actions, trade_sizes, durations, min_order_pct, min_order_abs)
+        Replays actions of the `MySimpleOrders` action scheme.
+    """
+
+    def __init__(self,
+                 prices: np.ndarray,
+                 cash: float = 1000.,
+                 asset: float = 0.,
+                 cash_precision: int = 2,
+                 asset_precision: int = 8,
+                 commission: float = 0.003,
+                 max_allowed_loss: float = 0.5) -> None:
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.cash_precision = cash_precision
+        self.asset_precision = asset_precision
+        self.commission = commission
+        self.max_allowed_loss = max_allowed_loss
+
+        self._cash = _quantize(np.array([cash], dtype=np.float64), cash_precision)[0]
+        self._asset = _quantize(np.array([asset], dtype=np.float64), asset_precision)[0]
+        self._quoted = _quantize(self.prices, cash_precision)
+
+        # the commission is a binary float, its exact value breaks decimal ties
+        rate = Decimal(str(commission))
+        self._rate_digits = max(-rate.as_tuple().exponent, 0)
+        self._rate = int(rate.scaleb(self._rate_digits))
+        self._rate_tie = int((Decimal(commission) - rate).compare(0))
+
+    def buy_sell_hold(self, actions: np.ndarray) -> BacktestResult:
+        """Replays actions of the `BuySellHold` action scheme, where every
+        change of action moves the whole balance in or out of the market.
+        Parameters
+        ----------
+        actions : `np.ndarray`
+            The action of every step, 0 or 1, of shape (steps,) for a single
+            policy or (policies, steps) for a batch.
+        Returns
+        -------
+        `BacktestResult`
+            The balances, net worth and trades of every policy.
+        """
+        actions = np.asarray(actions, dtype=np.int8)
+
+        side = actions.copy()
+        np.subtract(actions[..., 1:], actions[..., :-1], out=side[..., 1:])
+        return self._run(side, np.broadcast_to(1., side.shape), 0., 0.)
+
+    def simple_orders(self,
+                      actions: np.ndarray,
+                      trade_sizes: 'Union[List[float], int]' = 10,
+                      durations: 'Union[List[int], int]' = None,
+                      min_order_pct: float = 0.02,
+                      min_order_abs: float = 0.) -> BacktestResult:
+        """Replays actions of the `MySimpleOrders` action scheme trading a
+        single pair with market orders.
+        Parameters
+        ----------
+        actions : `np.ndarray`
+            The action of every step, an index of the action space of the
+            scheme, of shape (steps,) or (policies, steps).
+        trade_sizes : Union[List[float], int]
+            The trade sizes of the scheme.
+        durations : Union[List[int], int]
+            The durations of the scheme. They only change how actions are
+            numbered, as market orders are filled when they are placed.
+        min_order_pct : float
+            The minimum size of an order, in percent of the net worth.
+        min_order_abs : float
+            The minimum size of an order.
+        Returns
+        -------
+        `BacktestResult`
+            The balances, net worth and trades of every policy.
+        """
+        if not isinstance(trade_sizes, list):
+            trade_sizes = [(x + 1) / trade_sizes for x in range(trade_sizes)]
+        n_durations = len(durations) if isinstance(durations, list) else 1
+
+        # the action space is [None] + product(sizes, durations, [BUY, SELL])
+        k = np.arange(len(trade_sizes) * n_durations * 2)
+        sides = np.concatenate([[0], np.where(k % 2 == 0, 1, -1)]).astype(np.int8)
+        proportions = np.concatenate([[0.], np.asarray(trade_sizes)[k // (2 * n_durations)]])
+
+        actions = np.asarray(actions, dtype=np.int64)
+        return self._run(sides[actions], proportions[actions], min_order_pct, min_order_abs)
+
+
+    def _run(self,
+             side: np.ndarray,
+             proportion: np.ndarray,
+             min_order_pct: float,
+             min_order_abs: float) -> BacktestResult:
+        single = side.ndim == 1
+        side = np.atleast_2d(side)
+        proportion = np.atleast_2d(proportion)
+        n_policies, n_steps = side.shape
+
+        if n_steps >= len(self.prices):
+            raise ValueError("Expected fewer actions than prices, got {} actions for {} prices.".format(
+                n_steps, len(self.prices)))
+
+        # the steps every policy places an order at, one column per order
+        policy, step = np.nonzero(side)
+        counts = np.bincount(policy, minlength=n_policies)
+        rank = np.arange(len(policy)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        n_orders = counts.max(initial=0)
+        order_step = np.full((n_policies, n_orders), -1)
+        order_step[policy, rank] = step
+
+        # the balances left by every order, after the starting ones
+        cash = np.full(n_policies, self._cash)
+        asset = np.full(n_policies, self._asset)
+        cash_after = np.empty((n_policies, n_orders + 1), dtype=np.int64)
+        asset_after = np.empty((n_policies, n_orders + 1), dtype=np.int64)
+        cash_after[:, 0], asset_after[:, 0] = self._cash, self._asset
+
+        trades = []
+        for k in range(n_orders):
+            p = np.flatnonzero(order_step[:, k] >= 0)
+            t = order_step[p, k]
+            net_worth = cash[p] / 10 ** self.cash_precision + asset[p] / 10 ** self.asset_precision * self.prices[t]
+
+            buy = side[p, t] > 0
+            sell = ~buy
+            trades += [self._fill(p[buy], t[buy], proportion[p[buy], t[buy]], net_worth[buy],
+                                  cash, asset, min_order_pct, min_order_abs, True)]
+            trades += [self._fill(p[sell], t[sell], proportion[p[sell], t[sell]], net_worth[sell],
+                                  asset, cash, min_order_pct, min_order_abs, False)]
+
+            cash_after[p, k + 1] = cash[p]
+            asset_after[p, k + 1] = asset[p]
+
+        # the balances are constant between orders, so the curves repeat the
+        # balances left by each order until the step after the next one
+        n_values = counts + 1
+        value_policy = np.repeat(np.arange(n_policies), n_values)
+        value_index = np.arange(len(value_policy)) - np.repeat(np.cumsum(n_values) - n_values, n_values)
+
+        start = np.zeros(len(value_policy), dtype=np.int64)
+        start[value_index > 0] = step + 1
+        stop = np.append(start[1:], 0)
+        stop[np.cumsum(n_values) - 1] = n_steps + 1
+
+        cash_curve = np.repeat(cash_after[value_policy, value_index], stop - start).reshape(n_policies, -1)
+        cash_curve = cash_curve / 10 ** self.cash_precision
+        asset_curve = np.repeat(asset_after[value_policy, value_index], stop - start).reshape(n_policies, -1)
+        asset_curve = asset_curve / 10 ** self.asset_precision
+
+        net_worth = asset_curve * self.prices[:n_steps + 1]
+        net_worth += cash_curve
+
+        # freeze every episode at the step it is stopped at
+        loss = 1 - net_worth / net_worth[:, :1] > self.max_allowed_loss
+        loss[:, 0] = False
+        end = np.where(loss.any(axis=1), loss.argmax(axis=1), n_steps)
+
+        stopped = np.flatnonzero(end < n_steps)
+        after = np.arange(n_steps + 1) > end[stopped, None]
+        for curve in (cash_curve, asset_curve, net_worth):
+            frozen = curve[stopped]
+            curve[stopped] = np.where(after, frozen[np.arange(len(stopped)), end[stopped]][:, None], frozen)
+
+        trades = self._trades(trades)
+        trades = trades[trades["step"].to_numpy() < end[trades["policy"].to_numpy()]]
+        trades = trades.sort_values(["policy", "step"], kind="stable").reset_index(drop=True)
+
+        if single:
+            return BacktestResult(cash_curve[0], asset_curve[0], net_worth[0], end[0], trades)
+        return BacktestResult(cash_curve, asset_curve, net_worth, end, trades)
+
+    def _fill(self,
+              policy: np.ndarray,
+              step: np.ndarray,
+              proportion: np.ndarray,
+              net_worth: np.ndarray,
+              source: np.ndarray,
+              target: np.ndarray,
+              min_order_pct: float,
+              min_order_abs: float,
+              buy: bool) -> tuple:
+        """Fills the orders of `policy` sending a `proportion` of the `source`
+        balance to `target`, updating both in place."""
+        if buy:
+            source_precision, target_precision = self.cash_precision, self.asset_precision
+        else:
+            source_precision, target_precision = self.asset_precision, self.cash_precision
+
+        balance = source[policy]
+        size = balance / 10 ** source_precision
+        size = np.minimum(size * proportion, size)
+        quantity = _quantize(size, source_precision)
+
+        placed = (quantity > 0) & (size >= 10 ** -source_precision) \
+            & (size >= min_order_pct * net_worth) & (size >= min_order_abs)
+
+        # the commission is quantity * rate / 10 ** rate_digits units
+        scale = 10 ** self._rate_digits
+        commission = _multiply(quantity, self._rate)
+
+        # orders whose commission is below the precision are cancelled
+        ok = placed & ((commission > scale) | ((commission == scale) & (self._rate_tie >= 0)))
+        policy, step, quantity, commission = policy[ok], step[ok], quantity[ok], commission[ok]
+
+        paid = _divide(commission, scale, self._rate_tie)
+        sent = _divide(_multiply(quantity, scale) - commission, scale, -self._rate_tie)
+
+        price = self._quoted[step]
+        if buy:
+            received = _divide(_multiply(sent, 10 ** target_precision), price)
+        else:
+            received = _divide(_multiply(sent, price), 10 ** source_precision)
+
+        source[policy] = balance[ok] - paid - sent
+        target[policy] += received
+
+        return (policy, step, buy, price / 10 ** self.cash_precision,
+                sent / 10 ** source_precision, paid / 10 ** source_precision, received / 10 ** target_precision)
+
+    @staticmethod
+    def _trades(fills: list) -> pd.DataFrame:
+        columns = ["policy", "step", "side", "price", "quantity", "commission", "received"]
+        fills = [f for f in fills if len(f[0])]
+        if not fills:
+            fills = [(np.array([], dtype=np.int64), np.array([], dtype=np.int64), True) + (np.array([]),) * 4]
+
+        trades = {c: np.concatenate([f[i] for f in fills]) for i, c in enumerate(columns) if c != "side"}
+        trades["side"] = np.concatenate([np.full(len(f[0]), "buy" if f[2] else "sell") for f in fills])
+        return pd.DataFrame(trades, columns=columns)
@@ -0,0 +1,150 @@
+"""Contains the functions creating the environments of the project and their
+schemes."""
+
+from typing import Tuple, Union
+
+from tensortrade.env.default import actions, rewards, observers, stoppers, informers, renderers
+from tensortrade.env.generic import TradingEnv
+from tensortrade.env.generic.components.renderer import AggregateRenderer
+
+from coain.TheScheme.buysellhold import BuySellHold, MySimpleOrders, PBR, SharpeRatio
+from coain.env.feed import CompiledFeed
+from coain.env.observer import WindowObserver
+from coain.env.sampler import SampledTradingEnv
+
+
+def create(portfolio: 'Portfolio',
+           action_scheme: 'Union[actions.TensorTradeActionScheme, str]',
+           reward_scheme: 'Union[rewards.TensorTradeRewardScheme, str]',
+           feed: 'DataFeed',
+           window_size: int = 1,
+           min_periods: int = None,
+           **kwargs) -> TradingEnv:
+    """Creates a `TradingEnv` like `tensortrade.env.default.create`.
+
+    When `feed` is a `CompiledFeed` the observation windows are served by a
+    `WindowObserver` as views of its feature matrix, otherwise the default
+    `TensorTradeObserver` is used. Given a `sampler` in the keyword arguments,
+    the env owns the whole history of a `CompiledFeed` and plays each episode
+    on a window of it, see `SampledTradingEnv`.
+    Parameters
+    ----------
+    portfolio : `Portfolio`
+        The portfolio to be used by the environment.
+    action_scheme : `actions.TensorTradeActionScheme` or str
+        The action scheme for computing actions at every step of an episode.
+    reward_scheme : `rewards.TensorTradeRewardScheme` or str
+        The reward scheme for computing rewards at every step of an episode.
+    feed : `DataFeed`
+        The feed for generating observations to be used in the look back
+        window.
+    window_size : int
+        The size of the look back window to use for the observation space.
+    min_periods : int, optional
+        The minimum number of steps to warm up the `feed`.
+    **kwargs : keyword arguments
+        Extra keyword arguments needed to build the environment.
+    Returns
+    -------
+    `TradingEnv`
+        The trading environment.
+    """
+    action_scheme = actions.get(action_scheme) if isinstance(action_scheme, str) else action_scheme
+    reward_scheme = rewards.get(reward_scheme) if isinstance(reward_scheme, str) else reward_scheme
+
+    action_scheme.portfolio = portfolio
+
+    if isinstance(feed, CompiledFeed):
+        observer = WindowObserver(
+            portfolio=portfolio,
+            feed=feed,
+            renderer_feed=kwargs.get("renderer_feed", None),
+            window_size=window_size,
+            min_periods=min_periods,
+            history_capacity=kwargs.get("history_capacity", 1024),
+            history_ring=kwargs.get("history_ring", False)
+        )
+    else:
+        observer = observers.TensorTradeObserver(
+            portfolio=portfolio,
+            feed=feed,
+            renderer_feed=kwargs.get("renderer_feed", None),
+            window_size=window_size,
+            min_periods=min_periods
+        )
+
+    stopper = stoppers.MaxLossStopper(
+        max_allowed_loss=kwargs.get("max_allowed_loss", 0.5)
+    )
+
+    renderer = kwargs.get("renderer", renderers.EmptyRenderer())
+    if isinstance(renderer, list):
+        renderer = AggregateRenderer([renderers.get(r) if isinstance(r, str) else r for r in renderer])
+    elif isinstance(renderer, str):
+        renderer = renderers.get(renderer)
+
+    components = dict(
+        action_scheme=action_scheme,
+        reward_scheme=reward_scheme,
+        observer=observer,
+        stopper=kwargs.get("stopper", stopper),
+        informer=kwargs.get("informer", informers.TensorTradeInformer()),
+        renderer=renderer
+    )
+
+    if kwargs.get("sampler", None) is not None:
+        if not isinstance(feed, CompiledFeed):
+            raise ValueError("Sampled episodes need a CompiledFeed, got {}.".format(type(feed).__name__))
+        return SampledTradingEnv(sampler=kwargs["sampler"], **components)
+
+    return TradingEnv(**components)
+
+
+def create_schemes(action: str,
+                   reward: str,
+                   cash: 'Wallet',
+                   asset: 'Wallet',
+                   prices: 'np.ndarray' = None,
+                   price: 'Stream' = None) -> 'Tuple[TensorTradeActionScheme, TensorTradeRewardScheme]':
+    """Creates the action and reward schemes of an env by name, so the scripts
+    and the benchmarks build the same ones.
+    Parameters
+    ----------
+    action : str
+        "bsh" for `BuySellHold` between `cash` and `asset`, or "simpleN" for
+        `MySimpleOrders` with N trade sizes.
+    reward : str
+        "pbr" for `PBR`, attached to a `BuySellHold` action scheme, or
+        "sharpe" for `SharpeRatio`.
+    cash : `Wallet`
+        The cash wallet of the portfolio.
+    asset : `Wallet`
+        The asset wallet of the portfolio.
+    prices : `np.ndarray`, optional
+        The price history `PBR` reads its rewards from.
+    price : `Stream`, optional
+        The price stream `PBR` evaluates when `prices` is not given.
+    Returns
+    -------
+    `TensorTradeActionScheme`
+        The action scheme.
+    `TensorTradeRewardScheme`
+        The reward scheme.
+    """
+    if reward == "pbr":
+        reward_scheme = PBR(prices=prices) if prices is not None else PBR(price=price)
+    elif reward == "sharpe":
+        reward_scheme = SharpeRatio()
+    else:
+        raise ValueError("Unknown reward scheme '{}'.".format(reward))
+
+    if action == "bsh":
+        action_scheme = BuySellHold(cash=cash, asset=asset)
+        if isinstance(reward_scheme, PBR):
+            action_scheme.attach(reward_scheme)
+    elif action.startswith("simple") and action[len("simple"):].isdigit():
+        action_scheme = MySimpleOrders(trade_sizes=int(action[len("simple"):]))
+    else:
+        raise ValueError("Unknown action scheme '{}'.".format(action))
+
+    return action_scheme, reward_scheme
@@ -0,0 +1,134 @@
+"""Contains a data feed served from a precomputed feature matrix."""
+
+from itertools import islice
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from tensortrade.feed.core import Stream, DataFeed
+from tensortrade.feed.core.base import IterableStream
+
+
+def seek(feed: 'DataFeed', start: int) -> None:
+    """Moves the sources of a compiled feed that was just reset to row
+    `start`, so its next output is the one of that row.
+
+    Sources over arrays or lists are restarted on a slice of them, other
+    iterables are skipped through. The other streams of the graph are
+    expected to hold no state, like the portfolio streams of an observer.
+    """
+    for s in feed.process:
+        if not isinstance(s, IterableStream) or start == 0:
+            continue
+
+        if s.is_gen:
+            s.generator = islice(s.gen_fn(), start, None)
+        elif hasattr(s.iterable, "__getitem__"):
+            s.generator = iter(s.iterable[start:])
+        else:
+            s.generator = islice(iter(s.iterable), start, None)
+
+        s.stop = False
+        try:
+            s.current = next(s.generator)
+        except StopIteration:
+            s.stop = True
+
+
+class CompiledFeed(DataFeed):
+    """A `DataFeed` whose features are computed once, ahead of time, into a
+    contiguous 2D array.
+
+    Instead of evaluating a graph of rolling, ewm and arithmetic streams node
+    by node on every step, each column of the matrix is exposed as a plain
+    source stream, so the observer only reads the next value of each column.
+    The feed itself serves whole rows by index through the usual `next`,
+    `has_next` and `reset` methods.
+
+    A 2D array of `dtype` is used as the feature matrix without being copied,
+    e.g. a read-only array shared between processes. It is expected to be
+    free of nans, like the output of `pad`, and may start with `padding` rows
+    of zeros, which are not part of the feed but let observers serve their
+    first windows as views of the same memory.
+    Parameters
+    ----------
+    data : Union[`pd.DataFrame`, Dict[str, `np.ndarray`], `np.ndarray`]
+        The precomputed features, one column per feature in observation
+        order.
+    dtype : str
+        The dtype of the feature matrix.
+    columns : List[str]
+        The name of each feature when `data` is a 2D array.
+    padding : int
+        The number of leading rows of zeros of `data` when it is a 2D array.
+    Attributes
+    ----------
+    values : `np.ndarray`
+        The feature matrix of shape (steps, features).
+    padded_values : `np.ndarray`
+        The feature matrix preceded by `padding` rows of zeros.
+    padding : int
+        The number of rows of zeros of `padded_values`, or `None` if the
+        matrix was built from columns.
+    columns : List[str]
+        The name of each feature.
+    """
+
+    def __init__(self,
+                 data: 'Union[pd.DataFrame, Dict[str, np.ndarray], np.ndarray]',
+                 dtype: str = 'float64',
+                 columns: 'List[str]' = None,
+                 padding: int = 0) -> None:
+        if isinstance(data, np.ndarray):
+            self.padded_values = np.asarray(data, dtype=dtype)
+            self.columns = list(columns) if columns else [str(i) for i in range(data.shape[1])]
+        else:
+            self.padded_values = np.column_stack([np.asarray(data[c], dtype=dtype) for c in data.keys()])
+            self.columns = [str(c) for c in data.keys()]
+            padding = None
+
+        self.padding = padding
+        self.values = self.padded_values[padding or 0:]
+        self._index = 0
+
+        super().__init__([
+            Stream.source(self.values[:, i], dtype="float").rename(name)
+            for i, name in enumerate(self.columns)
+        ])
+        self.compile()
+
+    @classmethod
+    def from_streams(cls, streams: 'List[Stream]', dtype: str = 'float64') -> 'CompiledFeed':
+        """Compiles a list of feature streams by running their graph once over
+        the whole dataset. Useful for streams with no vectorized counterpart.
+        """
+        feed = DataFeed(streams)
+        feed.compile()
+
+        rows = []
+        while feed.has_next():
+            rows += [list(feed.next().values())]
+
+        names = [s.name for s in streams]
+        values = np.array(rows, dtype=dtype).reshape(-1, len(names))
+        return cls({name: values[:, i] for i, name in enumerate(names)}, dtype=dtype)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def row(self, index: int) -> np.ndarray:
+        """The features at step `index`."""
+        return self.values[index]
+
+    def next(self) -> dict:
+        self.value = dict(zip(self.columns, self.values[self._index]))
+        self._index += 1
+        return self.value
+
+    def has_next(self) -> bool:
+        return self._index < len(self.values)
+
+    def reset(self) -> None:
+        self._index = 0
+        self.value = None
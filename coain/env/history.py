@@ -0,0 +1,323 @@
+"""Contains a columnar history of per-step records and a portfolio keeping
+its performance in one."""
+
+from collections import OrderedDict
+from datetime import datetime
+from numbers import Number
+from typing import Callable, Dict, Iterator, List, Union
+
+import numpy as np
+import pandas as pd
+
+from tensortrade.oms.wallets import Portfolio
+
+
+class ColumnHistory:
+    """Records one row of named values per step in preallocated NumPy
+    columns.
+
+    Numeric values are stored as float64, dates as datetime64 and anything
+    else as objects. In the default growable mode the columns double their
+    capacity when full, so they hold the whole history. In ring mode they
+    hold the last `capacity` rows: every value is written twice, at its slot
+    and one capacity further, so the kept rows are always a contiguous slice
+    and every column is returned as a view without copying.
+
+    Columns are read with `history[name]`. For the code written against a
+    list of row dicts, `len`, integer and slice indexing and iteration give
+    the rows as dicts.
+    Parameters
+    ----------
+    capacity : int
+        The number of rows allocated up front, or kept in ring mode.
+    ring : bool
+        Whether to only keep the last `capacity` rows.
+    Attributes
+    ----------
+    offset : int
+        The number of rows dropped from the start of the history in ring
+        mode, i.e. the step of the first kept row.
+    """
+
+    def __init__(self, capacity: int = 1024, ring: bool = False) -> None:
+        self.capacity = capacity
+        self.ring = ring
+        self.offset = 0
+
+        self._columns = {}
+        self._count = 0
+
+    @classmethod
+    def from_columns(cls, columns: 'Dict[str, np.ndarray]', offset: int = 0) -> 'ColumnHistory':
+        """Creates a history holding `columns`, without copying them."""
+        history = cls(capacity=len(next(iter(columns.values()), [])))
+        history._columns = dict(columns)
+        history._count = history.capacity
+        history.offset = offset
+        return history
+
+    @property
+    def columns(self) -> 'List[str]':
+        return list(self._columns)
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity) if self.ring else self._count
+
+    def _new_column(self, value: object) -> np.ndarray:
+        size = 2 * self.capacity if self.ring else self.capacity
+        if isinstance(value, (Number, np.number)) and not isinstance(value, (np.datetime64, np.timedelta64)):
+            return np.full(size, np.nan)
+        if isinstance(value, (datetime, np.datetime64)):
+            return np.full(size, np.datetime64("NaT"), dtype="datetime64[ns]")
+        return np.full(size, None, dtype=object)
+
+    def _grow(self) -> None:
+        self.capacity = max(2 * self.capacity, 1)
+        for name, column in self._columns.items():
+            grown = np.empty(self.capacity, dtype=column.dtype)
+            grown[:self._count] = column[:self._count]
+            self._columns[name] = grown
+
+    def _set(self, column: np.ndarray, name: str, slot: int, value: object) -> None:
+        try:
+            column[slot] = value
+        except (TypeError, ValueError):
+            # values that do not fit the dtype of the column turn it to objects
+            column = self._columns[name] = column.astype(object)
+            column[slot] = value
+
+    def append(self, row: dict) -> None:
+        """Records the values of a step.
+        Parameters
+        ----------
+        row : dict
+            The value of every column at the step. Columns missing from the
+            row are recorded as missing values, new ones are added with
+            missing values for the previous rows.
+        """
+        if not self.ring and self._count == self.capacity:
+            self._grow()
+
+        slot = self._count % self.capacity if self.ring else self._count
+        columns = self._columns
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = self._new_column(value)
+            try:
+                column[slot] = value
+            except (TypeError, ValueError):
+                self._set(column, name, slot, value)
+
+        if len(row) < len(self._columns):
+            for name, column in self._columns.items():
+                if name not in row:
+                    self._set(column, name, slot, None if column.dtype == object else np.nan)
+
+        if self.ring:
+            for column in self._columns.values():
+                column[slot + self.capacity] = column[slot]
+
+        self._count += 1
+        if self.ring and self._count > self.capacity:
+            self.offset += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """A read-only view of the kept rows of a column, oldest first."""
+        column = self._columns[name]
+        n = len(self)
+        start = (self._count - n) % self.capacity if self.ring else 0
+        view = column[start:start + n]
+        view.flags.writeable = False
+        return view
+
+    def __getitem__(self, key: 'Union[str, int, slice]') -> 'Union[np.ndarray, dict, List[dict]]':
+        if isinstance(key, str):
+            return self.column(key)
+
+        if isinstance(key, int):
+            n = len(self)
+            if not -n <= key < n:
+                raise IndexError("history index out of range")
+            slot = (self._count - n) % self.capacity if self.ring else 0
+            slot += key % n
+            return {name: c[slot] for name, c in self._columns.items()}
+
+        columns = {name: self.column(name) for name in self._columns}
+        if isinstance(key, slice):
+            return [{name: c[i] for name, c in columns.items()} for i in range(*key.indices(len(self)))]
+        return {name: c[key] for name, c in columns.items()}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __iter__(self) -> 'Iterator[dict]':
+        return iter(self[:])
+
+    def to_frame(self) -> pd.DataFrame:
+        """The kept rows as a `pd.DataFrame` indexed by step."""
+        index = pd.RangeIndex(self.offset, self.offset + len(self))
+        return pd.DataFrame({name: self.column(name) for name in self._columns}, index=index)
+
+    def snapshot(self) -> 'ColumnHistory':
+        """A history of the rows kept now that later appends do not change.
+
+        In growable mode appends only write past the current rows, so the
+        snapshot holds views of the columns. Ring mode overwrites old rows,
+        so the snapshot holds copies of them.
+        """
+        columns = {name: self.column(name) for name in self._columns}
+        if self.ring:
+            columns = {name: c.copy() for name, c in columns.items()}
+        return ColumnHistory.from_columns(columns, offset=self.offset)
+
+
+class ColumnarPortfolio(Portfolio):
+    """A `Portfolio` that records its performance in a `ColumnHistory`
+    instead of an ordered dict holding a dict per step.
+
+    The net worth and the balances of every step are columns of `history`,
+    read by the renderers and reward schemes of the project without any
+    conversion. `performance` still returns the ordered dict of the
+    `Portfolio` for other consumers. It is kept between reads and only the
+    steps recorded since the last read are converted, so reading it every
+    step costs a dict per step, like the `Portfolio` does.
+    Parameters
+    ----------
+    base_instrument : `Instrument`
+        The base instrument to measure value in.
+    wallets : `List[WalletType]`
+        The wallets to be used in the portfolio.
+    order_listener : `OrderListener`
+        The order listener to set for all orders executed by this portfolio.
+    performance_listener : `Callable[[OrderedDict], None]`
+        The performance listener to send all portfolio updates to.
+    capacity : int
+        The number of steps allocated up front, or kept in ring mode.
+    ring : bool
+        Whether to only keep the last `capacity` steps.
+    Attributes
+    ----------
+    history : `ColumnHistory`
+        The performance of every step of the current episode, with a 'step'
+        column holding the clock step.
+    """
+
+    def __init__(self,
+                 base_instrument: 'Instrument',
+                 wallets: 'List[WalletType]' = None,
+                 order_listener: 'OrderListener' = None,
+                 performance_listener: 'Callable[[OrderedDict], None]' = None,
+                 capacity: int = 1024,
+                 ring: bool = False) -> None:
+        super().__init__(base_instrument, wallets, order_listener, performance_listener)
+        self.capacity = capacity
+        self.ring = ring
+        self.history = ColumnHistory(capacity, ring)
+        self._performance = None
+        self._converted = 0
+
+    @property
+    def performance(self) -> 'OrderedDict':
+        history = self.history
+        if not len(history):
+            return None
+
+        if self._performance is None:
+            self._performance = OrderedDict()
+        recorded = history.offset + len(history)
+        new = min(recorded - self._converted, len(history))
+        if new:
+            add_rows(self._performance, history[len(history) - new:], self.base_instrument.symbol)
+        self._converted = recorded
+
+        # steps dropped from a ring history are dropped from the dict too
+        while len(self._performance) > len(history):
+            self._performance.popitem(last=False)
+        return self._performance
+
+    def on_next(self, data: dict) -> None:
+        data = data["internal"]
+
+        if not self._keys:
+            self._keys = self._find_keys(data)
+
+        row = {k: data[k] for k in self._keys}
+        net_worth = data['net_worth']
+
+        if self._initial_net_worth is None:
+            self._initial_net_worth = net_worth
+        self._net_worth = net_worth
+
+        self.history.append(dict(row, step=self.clock.step))
+
+        if self.performance_listener:
+            row['base_symbol'] = self.base_instrument.symbol
+            self.performance_listener(OrderedDict([(self.clock.step, row)]))
+
+    def reset(self) -> None:
+        super().reset()
+        # a new history, so snapshots of the previous episode stay valid
+        self.history = ColumnHistory(self.capacity, self.ring)
+        self._performance = None
+        self._converted = 0
+
+
+class PortfolioView:
+    """The performance of a `ColumnarPortfolio` held in a `ColumnHistory`
+    that no longer changes, e.g. a snapshot or a recording, read by the
+    renderers like the portfolio itself.
+    Parameters
+    ----------
+    history : `ColumnHistory`
+        The performance columns, with a 'step' column.
+    base_symbol : str
+        The symbol of the base instrument of the portfolio.
+    """
+
+    def __init__(self, history: 'ColumnHistory', base_symbol: str) -> None:
+        self.history = history
+        self.base_symbol = base_symbol
+        self._performance = None
+
+    @property
+    def performance(self) -> 'OrderedDict':
+        if self._performance is None:
+            self._performance = performance_dict(self.history, self.base_symbol)
+        return self._performance
+
+
+def performance_dict(history: 'ColumnHistory', base_symbol: str) -> 'OrderedDict':
+    """Converts the performance columns of a `ColumnarPortfolio` to the
+    ordered dict of a `Portfolio`, or None if nothing was recorded yet."""
+    if not len(history):
+        return None
+    return add_rows(OrderedDict(), history, base_symbol)
+
+
+def add_rows(performance: 'OrderedDict', rows: 'List[dict]', base_symbol: str) -> 'OrderedDict':
+    """Adds performance rows holding a 'step' to an ordered dict of a
+    `Portfolio`, keyed by their step."""
+    for row in rows:
+        row['base_symbol'] = base_symbol
+        performance[int(row.pop('step'))] = row
+    return performance
+
+
+def history_frame(history: 'Union[ColumnHistory, List[dict]]') -> pd.DataFrame:
+    """The renderer history of an observer as a `pd.DataFrame`, whether it is
+    a `ColumnHistory` or a list of row dicts."""
+    if isinstance(history, ColumnHistory):
+        return history.to_frame()
+    return pd.DataFrame(history)
+
+
+def performance_frame(portfolio: 'Portfolio') -> pd.DataFrame:
+    """The performance of a portfolio as a `pd.DataFrame` indexed by step,
+    read from its columns when it has a `ColumnHistory`."""
+    history = getattr(portfolio, "history", None)
+    if history is not None:
+        frame = history.to_frame()
+        frame.index = frame.pop("step").astype(int).to_numpy()
+        return frame
+    return pd.DataFrame.from_dict(portfolio.performance, orient='index')
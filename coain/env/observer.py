@@ -0,0 +1,218 @@
+"""Contains an observer that serves observation windows as views of a
+precomputed feature matrix."""
+
+from typing import Tuple
+
+import numpy as np
+
+from gym.spaces import Box, Space
+from numpy.lib.stride_tricks import sliding_window_view
+
+from tensortrade.feed.core import Stream, DataFeed
+from tensortrade.env.generic import Observer
+from tensortrade.env.default.observers import _create_internal_streams
+
+from coain.env.feed import seek
+from coain.env.history import ColumnHistory
+
+
+def pad(values: np.ndarray, window_size: int, dtype: 'np.dtype' = np.float32) -> np.ndarray:
+    """Converts a feature matrix to `dtype`, with nans replaced by zeros, and
+    prepends the `window_size - 1` rows of zeros the first observation
+    windows are padded with.
+    Parameters
+    ----------
+    values : `np.ndarray`
+        The feature matrix of shape (steps, features).
+    window_size : int
+        The size of the observation window.
+    dtype : `np.dtype`
+        The dtype of the padded matrix.
+    Returns
+    -------
+    `np.ndarray`
+        The padded matrix of shape (steps + window_size - 1, features).
+    """
+    n_steps, n_features = values.shape
+    padded = np.zeros((n_steps + window_size - 1, n_features), dtype=dtype)
+    padded[window_size - 1:] = np.nan_to_num(values)
+    return padded
+
+
+def window_view(values: np.ndarray, window_size: int, dtype: 'np.dtype' = np.float32, padded: bool = False) -> np.ndarray:
+    """Creates the observation windows of every row of a feature matrix.
+
+    The matrix is padded with `pad`, so the first windows look like the ones
+    of the `ObservationHistory` of tensortrade, unless `padded` says it
+    already is, in which case the windows are views of `values` itself.
+    Parameters
+    ----------
+    values : `np.ndarray`
+        The feature matrix of shape (steps, features).
+    window_size : int
+        The size of the observation window.
+    dtype : `np.dtype`
+        The dtype of the windows.
+    padded : bool
+        Whether `values` is the output of `pad`.
+    Returns
+    -------
+    `np.ndarray`
+        A read-only view of shape (steps, window_size, features) whose i-th
+        entry is the window ending at row i.
+    """
+    if not padded:
+        values = pad(values, window_size, dtype=dtype)
+        values.setflags(write=False)
+
+    return sliding_window_view(values, (window_size, values.shape[1]), writeable=False)[:, 0]
+
+
+class WindowObserver(Observer):
+    """An observer that returns each observation window as a read-only view
+    of the feature matrix of a `CompiledFeed`.
+
+    The feature matrix is converted to the observation dtype and padded with
+    `window_size - 1` rows of zeros once, when the observer is created, unless
+    the feed already is. Every window is then a strided view into it, so a
+    step only moves an index and allocates nothing. Observations are
+    identical to the ones of the `TensorTradeObserver`.
+    Parameters
+    ----------
+    portfolio : `Portfolio`
+        The portfolio to be used to create the internal data feed mechanism.
+    feed : `CompiledFeed`
+        The precomputed features.
+    renderer_feed : `DataFeed`
+        The feed to be used for giving information to the renderer.
+    window_size : int
+        The size of the observation window.
+    min_periods : int
+        The amount of steps needed to warmup the `feed`.
+    dtype : `np.dtype`
+        The dtype of the observations.
+    history_capacity : int
+        The number of steps of renderer history allocated up front, or kept
+        in ring mode.
+    history_ring : bool
+        Whether to only keep the last `history_capacity` steps of renderer
+        history.
+    Attributes
+    ----------
+    feed : `DataFeed`
+        The feed of the portfolio and renderer streams.
+    windows : `np.ndarray`
+        The view of every observation window, of shape
+        (steps, window_size, features).
+    renderer_history : `ColumnHistory`
+        The history of the renderer data feed, one column per stream.
+    start : int
+        The row the episodes start at.
+    end : int
+        The row the episodes end before.
+    """
+
+    def __init__(self,
+                 portfolio: 'Portfolio',
+                 feed: 'CompiledFeed',
+                 renderer_feed: 'DataFeed' = None,
+                 window_size: int = 1,
+                 min_periods: int = None,
+                 dtype: 'np.dtype' = np.float32,
+                 history_capacity: int = 1024,
+                 history_ring: bool = False) -> None:
+        streams = [Stream.group(_create_internal_streams(portfolio)).rename("internal")]
+        if renderer_feed:
+            streams += [Stream.group(renderer_feed.inputs).rename("renderer")]
+
+        self.feed = DataFeed(streams).attach(portfolio)
+        self.feed.compile()
+
+        self.window_size = window_size
+        self.min_periods = min_periods
+
+        # a feed already padded for the window is viewed without a copy
+        offset = (feed.padding or 0) - (window_size - 1)
+        if feed.padding is not None and offset >= 0 and feed.padded_values.dtype == dtype:
+            self.windows = window_view(feed.padded_values[offset:], window_size, padded=True)
+        else:
+            self.windows = window_view(feed.values, window_size, dtype=dtype)
+        self.values = self.windows[:, -1]
+
+        self._observation_space = Box(
+            low=-np.inf,
+            high=np.inf,
+            shape=self.windows.shape[1:],
+            dtype=dtype
+        )
+
+        self.history_capacity = history_capacity
+        self.history_ring = history_ring
+        self.renderer_history = ColumnHistory(history_capacity, history_ring)
+        self.start = 0
+        self.end = len(self.windows)
+        self._step = 0
+
+        self.warmup()
+
+    @property
+    def observation_space(self) -> Space:
+        return self._observation_space
+
+    @property
+    def cursor(self) -> int:
+        """The number of rows of the feature matrix observed so far."""
+        return self._step
+
+    def warmup(self) -> None:
+        """Warms up the data feed."""
+        if self.min_periods is not None:
+            for _ in range(self.min_periods):
+                if self.has_next():
+                    self.feed.next()
+                    self._step += 1
+
+    def seek(self, start: int, length: int = None) -> None:
+        """Sets the rows the episodes play, from the next reset on.
+        Parameters
+        ----------
+        start : int
+            The row of the first observation of an episode.
+        length : int, optional
+            The number of rows of an episode, by default up to the end of the
+            history.
+        """
+        self.start = start
+        self.end = len(self.windows) if length is None else min(start + length, len(self.windows))
+
+    def window_bounds(self, step: int = None) -> 'Tuple[int, int]':
+        """The (start, end) rows of `values` in the window observed at `step`,
+        by default the last one. Windows of the first steps hold fewer than
+        `window_size` rows and are padded with zeros when observed.
+        """
+        end = self._step if step is None else step + 1
+        return max(end - self.window_size, 0), end
+
+    def window(self, step: int) -> np.ndarray:
+        """The observation window of `step`, a view of the feature matrix."""
+        return self.windows[step]
+
+    def observe(self, env: 'TradingEnv') -> np.ndarray:
+        data = self.feed.next()
+
+        if "renderer" in data.keys():
+            self.renderer_history.append(data["renderer"])
+
+        obs = self.windows[self._step]
+        self._step += 1
+        return obs
+
+    def has_next(self) -> bool:
+        return self._step < self.end and self.feed.has_next()
+
+    def reset(self) -> None:
+        self.renderer_history = ColumnHistory(self.history_capacity, self.history_ring)
+        self._step = self.start
+        self.feed.reset()
+        seek(self.feed, self.start)
+        self.warmup()
@@ -0,0 +1,221 @@
+"""Contains a profiler timing the components of a `TradingEnv` step by
+step."""
+
+import time
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+_MISSING = object()
+
+
+class StepProfiler:
+    """Times the hot paths of a `TradingEnv` and reports them per component
+    and per episode.
+
+    Attaching the profiler replaces the timed methods of the components of
+    the env with timing wrappers on the instances themselves, and detaching
+    it removes them, so an env that is not profiled runs exactly the code it
+    would without the profiler. The timed components are:
+
+    - step: `TradingEnv.step` as a whole.
+    - reset: `TradingEnv.reset`.
+    - get_orders: `get_orders` of the action scheme.
+    - execution: `Broker.update`, where submitted orders are executed, and
+      `execute_market_order` of the action scheme, where `BuySellHold` and
+      `MySimpleOrders` execute simple market orders without the broker. The
+      latter runs within get_orders and adds a call for every order it
+      executes, on top of the call to the broker of every step.
+    - reward: `get_reward` of the reward scheme.
+    - observe: `observe` of the observer.
+    - feed: the data feed of the observer, including the renderer feed.
+    - renderer_feed: the streams of the renderer feed, summed per step.
+    - stop: `stop` of the stopper.
+    - info: `info` of the informer.
+
+    Components are nested, e.g. feed runs within observe within step, so
+    their shares of the step time do not add up to one.
+    Parameters
+    ----------
+    percentiles : Tuple[float]
+        The percentiles of the durations to report.
+    verbose : bool
+        Whether to print the summary table of every episode when it ends.
+    Attributes
+    ----------
+    episodes : List[`pd.DataFrame`]
+        The summary table of every finished episode.
+    """
+
+    def __init__(self, percentiles: 'Tuple[float]' = (50, 90, 99), verbose: bool = False) -> None:
+        self.percentiles = percentiles
+        self.verbose = verbose
+
+        self.episodes = []
+        self._samples = defaultdict(list)
+        self._episode = defaultdict(list)
+        self._renderer_time = 0.
+        self._patched = []
+
+    def _wrap(self, obj: object, name: str, component: str) -> None:
+        original = getattr(obj, name)
+        samples = self._episode
+        timer = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = timer()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples[component].append(timer() - start)
+
+        self._patch(obj, name, timed)
+
+    def _patch(self, obj: object, name: str, value: object) -> None:
+        self._patched += [(obj, name, vars(obj).get(name, _MISSING))]
+        setattr(obj, name, value)
+
+    def _renderer_streams(self, observer: 'Observer') -> list:
+        feed = getattr(observer, "feed", None)
+        groups = [s for s in getattr(feed, "inputs", []) if s.name == "renderer"]
+
+        # streams overload ==, so they are told apart by id
+        streams, stack = {}, list(groups)
+        while stack:
+            s = stack.pop()
+            if id(s) not in streams:
+                streams[id(s)] = s
+                stack += s.inputs
+        return list(streams.values())
+
+    def attach(self, env: 'TradingEnv') -> 'StepProfiler':
+        """Starts profiling `env`.
+        Parameters
+        ----------
+        env : `TradingEnv`
+            The env to profile.
+        Returns
+        -------
+        `StepProfiler`
+            The profiler itself.
+        """
+        self._wrap(env.action_scheme, "get_orders", "get_orders")
+        if hasattr(env.action_scheme, "broker"):
+            self._wrap(env.action_scheme.broker, "update", "execution")
+        if hasattr(env.action_scheme, "execute_market_order"):
+            self._wrap(env.action_scheme, "execute_market_order", "execution")
+        self._wrap(env.reward_scheme, "get_reward", "reward")
+        self._wrap(env.observer, "observe", "observe")
+        if hasattr(env.observer, "feed"):
+            self._wrap(env.observer.feed, "next", "feed")
+        self._wrap(env.stopper, "stop", "stop")
+        self._wrap(env.informer, "info", "info")
+
+        for stream in self._renderer_streams(env.observer):
+            self._time_renderer(stream)
+
+        self._wrap_env(env)
+        return self
+
+    def _time_renderer(self, stream: 'Stream') -> None:
+        run = stream.run
+        timer = time.perf_counter
+
+        def timed():
+            start = timer()
+            run()
+            self._renderer_time += timer() - start
+
+        self._patch(stream, "run", timed)
+
+    def _wrap_env(self, env: 'TradingEnv') -> None:
+        step, reset = env.step, env.reset
+        samples = self._episode
+        timer = time.perf_counter
+
+        def timed_step(action):
+            self._renderer_time = 0.
+            start = timer()
+            obs, reward, done, info = step(action)
+            samples["step"].append(timer() - start)
+            samples["renderer_feed"].append(self._renderer_time)
+
+            if done:
+                self.end_episode()
+            return obs, reward, done, info
+
+        def timed_reset():
+            if samples:
+                self.end_episode()
+
+            start = timer()
+            obs = reset()
+            samples["reset"].append(timer() - start)
+            return obs
+
+        self._patch(env, "step", timed_step)
+        self._patch(env, "reset", timed_reset)
+
+    def detach(self) -> None:
+        """Stops profiling, restoring the original methods of the env."""
+        for obj, name, original in reversed(self._patched):
+            if original is _MISSING:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, original)
+        self._patched = []
+
+    def _table(self, samples: 'Dict[str, List[float]]') -> pd.DataFrame:
+        step_total = np.sum(samples.get("step", [])) or np.nan
+
+        rows = {}
+        for component, durations in samples.items():
+            durations = np.asarray(durations)
+            if not len(durations):
+                continue
+
+            row = {
+                "calls": len(durations),
+                "total_s": durations.sum(),
+                "mean_us": durations.mean() * 1e6
+            }
+            for q, value in zip(self.percentiles, np.percentile(durations, self.percentiles)):
+                row["p{:g}_us".format(q)] = value * 1e6
+            row["max_us"] = durations.max() * 1e6
+            row["share"] = durations.sum() / step_total if component != "reset" else np.nan
+            rows[component] = row
+
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def end_episode(self) -> pd.DataFrame:
+        """Closes the current episode, adding its samples to the totals.
+        Returns
+        -------
+        `pd.DataFrame`
+            The summary table of the episode.
+        """
+        table = self._table(self._episode)
+        self.episodes += [table]
+
+        for component, durations in self._episode.items():
+            self._samples[component] += durations
+        self._episode.clear()
+
+        if self.verbose:
+            print("episode {}\n{}".format(len(self.episodes), table.to_string(float_format="{:.2f}".format)))
+        return table
+
+    def summary(self) -> pd.DataFrame:
+        """The summary table of every call timed so far, one row per
+        component, with the number of calls, the total time, the mean,
+        percentiles and max duration in microseconds and the share of the
+        step time."""
+        samples = defaultdict(list)
+        for source in (self._samples, self._episode):
+            for component, durations in source.items():
+                samples[component] += durations
+        return self._table(samples)
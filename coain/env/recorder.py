@@ -0,0 +1,371 @@
+"""Contains a recorder streaming the steps of an env to an append-only log
+on disk, and the loading of the recorded runs."""
+
+import os
+import glob
+
+from collections import OrderedDict
+from decimal import Decimal
+from itertools import islice
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tensortrade.oms.instruments import ExchangePair, Instrument, Quantity
+from tensortrade.oms.orders import TradeSide, TradeType
+
+from coain.env.history import ColumnHistory, PortfolioView
+from coain.TheScheme.execution import Fill
+
+
+_MISSING = object()
+
+
+class EpisodeRecorder:
+    """Streams the steps of a `TradingEnv` to an append-only log of chunked
+    `.npz` files, so long runs can be analysed and re-rendered later without
+    running the env again.
+
+    Every step and reset records one row with the episode, the clock step,
+    the action, the reward, the net worth, whether the episode is done, the
+    last row of the observation window as 'obs.<feature>' columns and the
+    last row of the renderer history as 'renderer.<name>' columns. The
+    trades executed since the previous row are recorded in a separate table,
+    with their quantity, price and commission as decimal strings, so the
+    replayed trades hold the exact `Decimal`s of the env.
+    Rows are buffered in a `ColumnHistory` of `chunk_size` steps and written
+    to a new chunk file when it is full, so memory stays bounded however
+    long the run is. Each chunk is written to a temporary file and renamed,
+    so a run being recorded can be loaded at any time with
+    `load_recording`, up to its last chunk. Recording into a directory that
+    already holds chunks appends to them. With `flush_on_done` the rows are
+    also written when an episode ends, so processes that are killed without
+    closing their env, like rllib workers, lose at most the episode being
+    played.
+
+    Attaching the recorder replaces `step`, `reset` and `close` of the env
+    with recording wrappers on the instance itself, like `StepProfiler`, and
+    closing the env writes the buffered rows. The recorder should be
+    attached before the first reset of an episode, so its rows start at the
+    first observation.
+    Parameters
+    ----------
+    path : str
+        The directory of the chunk files.
+    chunk_size : int
+        The number of steps written per chunk.
+    feature_names : List[str], optional
+        The names of the observed features, their index by default.
+    compress : bool
+        Whether to compress the chunk files.
+    flush_on_done : bool
+        Whether to write the buffered rows at the end of every episode.
+    Attributes
+    ----------
+    episode : int
+        The number of the episode being recorded.
+    chunks : int
+        The number of chunks in the directory.
+    """
+
+    def __init__(self,
+                 path: str,
+                 chunk_size: int = 4096,
+                 feature_names: 'List[str]' = None,
+                 compress: bool = False,
+                 flush_on_done: bool = False) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.compress = compress
+        self.flush_on_done = flush_on_done
+
+        os.makedirs(path, exist_ok=True)
+        chunk_files = _chunk_files(path)
+        self.chunks = len(chunk_files)
+        self.episode = -1
+        if chunk_files:
+            with np.load(chunk_files[-1]) as chunk:
+                self.episode = int(chunk["steps/episode"].max())
+
+        self._steps = ColumnHistory(chunk_size)
+        self._trades = ColumnHistory(chunk_size)
+        self._n_trades = 0
+        self._base_symbol = None
+        self._obs_keys = []
+        self._renderer_keys = {}
+        self._patched = []
+
+    def attach(self, env: 'TradingEnv') -> 'EpisodeRecorder':
+        """Starts recording `env`.
+        Parameters
+        ----------
+        env : `TradingEnv`
+            The env to record.
+        Returns
+        -------
+        `EpisodeRecorder`
+            The recorder itself.
+        """
+        step, reset, close = env.step, env.reset, env.close
+
+        def recorded_step(action):
+            obs, reward, done, info = step(action)
+            self.record(env, obs, action, reward, done)
+            return obs, reward, done, info
+
+        def recorded_reset():
+            obs = reset()
+            self.episode += 1
+            self._n_trades = 0
+            self.record(env, obs)
+            return obs
+
+        def recorded_close():
+            self.flush()
+            return close()
+
+        self._patch(env, "step", recorded_step)
+        self._patch(env, "reset", recorded_reset)
+        self._patch(env, "close", recorded_close)
+        return self
+
+    def _patch(self, obj: object, name: str, value: object) -> None:
+        self._patched += [(obj, name, vars(obj).get(name, _MISSING))]
+        setattr(obj, name, value)
+
+    def detach(self) -> None:
+        """Stops recording, restoring the original methods of the env and
+        writing the buffered rows."""
+        for obj, name, original in reversed(self._patched):
+            if original is _MISSING:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, original)
+        self._patched = []
+        self.flush()
+
+    def record(self,
+               env: 'TradingEnv',
+               obs: 'np.ndarray',
+               action: object = np.nan,
+               reward: float = np.nan,
+               done: bool = False) -> None:
+        """Records the step the env just made.
+        Parameters
+        ----------
+        env : `TradingEnv`
+            The recorded env.
+        obs : `np.ndarray`
+            The observation returned by the step.
+        action : object
+            The action of the step, missing for a reset.
+        reward : float
+            The reward of the step, missing for a reset.
+        done : bool
+            Whether the episode is done.
+        """
+        portfolio = env.action_scheme.portfolio
+        self._base_symbol = portfolio.base_instrument.symbol
+
+        row = {
+            "episode": self.episode,
+            "step": env.clock.step - 1,
+            "action": action,
+            "reward": reward,
+            "net_worth": portfolio.net_worth,
+            "done": done
+        }
+
+        features = np.asarray(obs)
+        features = (features[-1] if features.ndim > 1 else features).reshape(-1)
+        if len(self._obs_keys) != len(features):
+            names = self.feature_names or range(len(features))
+            self._obs_keys = ["obs.{}".format(name) for name in names]
+        row.update(zip(self._obs_keys, features.tolist()))
+
+        renderer_history = env.observer.renderer_history
+        if len(renderer_history):
+            keys = self._renderer_keys
+            for name, value in renderer_history[-1].items():
+                key = keys.get(name)
+                if key is None:
+                    key = keys[name] = "renderer.{}".format(name)
+                row[key] = value
+
+        self._steps.append(row)
+
+        broker = getattr(env.action_scheme, "broker", None)
+        n_new = len(broker.trades) - self._n_trades if broker is not None else 0
+        if n_new > 0:
+            # trades are only appended, so the new ones are the last items
+            for trades in list(islice(reversed(broker.trades.values()), n_new))[::-1]:
+                for trade in trades:
+                    self._trades.append({
+                        "episode": self.episode,
+                        "step": trade.step,
+                        "side": trade.side.value,
+                        "type": trade.type.value,
+                        "base": trade.base_instrument.symbol,
+                        "base_precision": trade.base_instrument.precision,
+                        "quote": trade.quote_instrument.symbol,
+                        "quote_precision": trade.quote_instrument.precision,
+                        "quantity": str(trade.quantity.size),
+                        "price": str(trade.price),
+                        "commission": str(trade.commission.size)
+                    })
+            self._n_trades = len(broker.trades)
+
+        if len(self._steps) >= self.chunk_size or (done and self.flush_on_done):
+            self.flush()
+
+    @staticmethod
+    def _arrays(prefix: str, history: 'ColumnHistory') -> 'Dict[str, np.ndarray]':
+        arrays = {}
+        for name in history.columns:
+            column = history[name]
+            # object columns are saved as strings, so loading needs no pickle
+            arrays["{}/{}".format(prefix, name)] = column.astype(str) if column.dtype == object else column
+        return arrays
+
+    def flush(self) -> None:
+        """Writes the buffered rows to a new chunk file."""
+        if not len(self._steps):
+            return
+
+        arrays = self._arrays("steps", self._steps)
+        arrays.update(self._arrays("trades", self._trades))
+        arrays["meta/base_symbol"] = np.array(self._base_symbol or "")
+
+        filename = os.path.join(self.path, "chunk_{:06d}.npz".format(self.chunks))
+        with open(filename + ".tmp", "wb") as f:
+            (np.savez_compressed if self.compress else np.savez)(f, **arrays)
+        os.replace(filename + ".tmp", filename)
+
+        self.chunks += 1
+        self._steps = ColumnHistory(self.chunk_size)
+        self._trades = ColumnHistory(self.chunk_size)
+
+    def close(self) -> None:
+        """Writes the buffered rows and stops recording."""
+        self.detach()
+
+
+class Recording:
+    """A run recorded by an `EpisodeRecorder`, loaded from its chunk files.
+    Parameters
+    ----------
+    steps : `pd.DataFrame`
+        A row per recorded step.
+    trades : `pd.DataFrame`
+        A row per recorded trade.
+    base_symbol : str, optional
+        The symbol of the base instrument of the portfolio.
+    """
+
+    def __init__(self, steps: pd.DataFrame, trades: pd.DataFrame, base_symbol: str = None) -> None:
+        self.steps = steps
+        self.trades = trades
+        self.base_symbol = base_symbol
+
+    @property
+    def episodes(self) -> 'List[int]':
+        """The numbers of the recorded episodes."""
+        return [int(e) for e in pd.unique(self.steps["episode"])] if len(self.steps) else []
+
+    def episode(self, episode: int) -> 'Tuple[pd.DataFrame, pd.DataFrame]':
+        """The steps and trades of an episode, indexed from 0."""
+        steps = self.steps[self.steps["episode"] == episode].reset_index(drop=True)
+        trades = self.trades[self.trades["episode"] == episode].reset_index(drop=True) \
+            if len(self.trades) else self.trades
+        return steps, trades
+
+    def env_view(self, episode: int) -> 'SimpleNamespace':
+        """Builds a view of the env at the end of a recorded episode, holding
+        the renderer history, performance and trades the renderers read.
+        Parameters
+        ----------
+        episode : int
+            The number of the episode.
+        Returns
+        -------
+        `SimpleNamespace`
+            The view of the env, to pass to `Renderer.render`.
+        """
+        steps, trades = self.episode(episode)
+
+        renderer_history = ColumnHistory.from_columns({
+            c[len("renderer."):]: steps[c].to_numpy() for c in steps.columns if c.startswith("renderer.")
+        }, offset=int(steps["step"].iloc[0]) if len(steps) else 0)
+        performance = ColumnHistory.from_columns({
+            "net_worth": steps["net_worth"].to_numpy(),
+            "step": steps["step"].to_numpy()
+        })
+
+        fills = OrderedDict()
+        for t in trades.itertuples(index=False):
+            pair = Instrument(t.base, int(t.base_precision)) / Instrument(t.quote, int(t.quote_precision))
+            side = TradeSide(t.side)
+            instrument = side.instrument(pair)
+            fills[len(fills)] = [Fill(
+                step=int(t.step),
+                exchange_pair=ExchangePair(None, pair),
+                side=side,
+                quantity=Quantity(instrument, Decimal(t.quantity)),
+                price=Decimal(t.price),
+                commission=Quantity(instrument, Decimal(t.commission)),
+                type=TradeType(t.type)
+            )]
+
+        return SimpleNamespace(
+            clock=SimpleNamespace(step=int(steps["step"].iloc[-1]) + 1 if len(steps) else 0),
+            observer=SimpleNamespace(renderer_history=renderer_history),
+            action_scheme=SimpleNamespace(
+                portfolio=PortfolioView(performance, self.base_symbol),
+                broker=SimpleNamespace(trades=fills)
+            )
+        )
+
+    def render(self, renderer: 'Renderer', episode: int, **kwargs) -> None:
+        """Renders a recorded episode with `renderer`, from a new chart."""
+        renderer.reset()
+        renderer.render(self.env_view(episode), **kwargs)
+
+
+def _chunk_files(path: str) -> 'List[str]':
+    return sorted(glob.glob(os.path.join(path, "chunk_*.npz")))
+
+
+def load_recording(path: str, base_symbol: str = None) -> 'Recording':
+    """Loads the chunks written so far by an `EpisodeRecorder`, whether its
+    run is finished or still being recorded.
+    Parameters
+    ----------
+    path : str
+        The directory of the chunk files.
+    base_symbol : str, optional
+        The symbol of the base instrument of the portfolio, by default the
+        one recorded.
+    Returns
+    -------
+    `Recording`
+        The recorded run.
+    """
+    steps, trades = [], []
+    for filename in _chunk_files(path):
+        with np.load(filename) as chunk:
+            tables = {"steps": {}, "trades": {}, "meta": {}}
+            for key in chunk.files:
+                table, name = key.split("/", 1)
+                tables[table][name] = chunk[key]
+        base_symbol = base_symbol or str(tables["meta"].get("base_symbol", "")) or None
+        steps += [pd.DataFrame(tables["steps"])]
+        trades += [pd.DataFrame(tables["trades"])]
+
+    return Recording(
+        steps=pd.concat(steps, ignore_index=True) if steps else pd.DataFrame(),
+        trades=pd.concat(trades, ignore_index=True) if trades else pd.DataFrame(),
+        base_symbol=base_symbol
+    )
@@ -0,0 +1,215 @@
+"""Contains samplers of episode windows over a long history and the env that
+draws its episodes from them."""
+
+from abc import ABC, abstractmethod
+from itertools import cycle
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from tensortrade.env.generic import TradingEnv
+
+
+class EpisodeSampler(ABC):
+    """Draws the start row and length of each episode of an env that owns the
+    whole feature history.
+    Parameters
+    ----------
+    length : Union[int, Tuple[int, int]]
+        The number of rows of each episode, or the range it is drawn from.
+    seed : int, optional
+        The seed of the random generator.
+    """
+
+    def __init__(self, length: 'Union[int, Tuple[int, int]]', seed: int = None) -> None:
+        self.length = length
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def min_length(self) -> int:
+        return self.length[0] if isinstance(self.length, tuple) else self.length
+
+    def _length(self, n_steps: int) -> int:
+        if isinstance(self.length, tuple):
+            length = int(self.rng.integers(self.length[0], self.length[1], endpoint=True))
+        else:
+            length = self.length
+        return min(length, n_steps)
+
+    @abstractmethod
+    def sample(self, n_steps: int) -> 'Tuple[int, int]':
+        """Draws the window of the next episode.
+        Parameters
+        ----------
+        n_steps : int
+            The number of rows of the history.
+        Returns
+        -------
+        Tuple[int, int]
+            The start row and length of the episode.
+        """
+        raise NotImplementedError()
+
+    def reset(self) -> None:
+        """Restarts the sequence of episodes."""
+        self.rng = np.random.default_rng(self.seed)
+
+
+class RandomEpisodeSampler(EpisodeSampler):
+    """Draws episode starts uniformly over the history.
+    Parameters
+    ----------
+    length : Union[int, Tuple[int, int]]
+        The number of rows of each episode, or the range it is drawn from.
+    min_start : int
+        The first row an episode can start at, e.g. `window_size - 1` so every
+        window is filled with history.
+    seed : int, optional
+        The seed of the random generator.
+    """
+
+    def __init__(self,
+                 length: 'Union[int, Tuple[int, int]]',
+                 min_start: int = 0,
+                 seed: int = None) -> None:
+        super().__init__(length, seed)
+        self.min_start = min_start
+
+    def sample(self, n_steps: int) -> 'Tuple[int, int]':
+        length = self._length(n_steps - self.min_start)
+        start = int(self.rng.integers(self.min_start, n_steps - length, endpoint=True))
+        return start, length
+
+
+class ScheduledEpisodeSampler(EpisodeSampler):
+    """Plays episodes at a fixed list of starts, in order and over again,
+    e.g. for walk-forward evaluation.
+    Parameters
+    ----------
+    starts : List[int]
+        The start row of each episode.
+    length : Union[int, Tuple[int, int]]
+        The number of rows of each episode, or the range it is drawn from.
+    seed : int, optional
+        The seed of the random generator of the lengths.
+    """
+
+    def __init__(self,
+                 starts: 'List[int]',
+                 length: 'Union[int, Tuple[int, int]]',
+                 seed: int = None) -> None:
+        super().__init__(length, seed)
+        self.starts = list(starts)
+        self._starts = cycle(self.starts)
+
+    def sample(self, n_steps: int) -> 'Tuple[int, int]':
+        start = next(self._starts)
+        return start, self._length(n_steps - start)
+
+    def reset(self) -> None:
+        super().reset()
+        self._starts = cycle(self.starts)
+
+
+class StratifiedEpisodeSampler(EpisodeSampler):
+    """Spreads episode starts evenly across volatility regimes.
+
+    Every possible start is ranked by the standard deviation of the log
+    returns over the episode it starts, and the starts are split into
+    `n_strata` quantiles of it. Episodes cycle through the strata in a random
+    order and start at a uniformly drawn row of their stratum, so calm and
+    turbulent markets are visited equally often whatever their share of the
+    history.
+    Parameters
+    ----------
+    prices : `np.ndarray`
+        The price history the regimes are measured on.
+    length : Union[int, Tuple[int, int]]
+        The number of rows of each episode, or the range it is drawn from.
+        Regimes are measured over the shortest length.
+    n_strata : int
+        The number of volatility regimes.
+    min_start : int
+        The first row an episode can start at.
+    seed : int, optional
+        The seed of the random generator.
+    Attributes
+    ----------
+    volatility : `np.ndarray`
+        The volatility of the episode starting at each row.
+    strata : List[`np.ndarray`]
+        The starts of each regime, from the calmest to the most volatile.
+    """
+
+    def __init__(self,
+                 prices: np.ndarray,
+                 length: 'Union[int, Tuple[int, int]]',
+                 n_strata: int = 4,
+                 min_start: int = 0,
+                 seed: int = None) -> None:
+        super().__init__(length, seed)
+        self.n_strata = n_strata
+        self.min_start = min_start
+
+        # rolling std of the log returns over every window, in one pass
+        returns = np.diff(np.log(np.asarray(prices, dtype=np.float64)), prepend=np.nan)
+        returns = np.nan_to_num(returns)
+        w = self.min_length
+        s1 = np.concatenate([[0.], np.cumsum(returns)])
+        s2 = np.concatenate([[0.], np.cumsum(returns ** 2)])
+        mean = (s1[w:] - s1[:-w]) / w
+        self.volatility = np.sqrt(np.maximum((s2[w:] - s2[:-w]) / w - mean ** 2, 0))
+
+        starts = np.arange(min_start, len(self.volatility))
+        edges = np.quantile(self.volatility[starts], np.linspace(0, 1, n_strata + 1)[1:-1])
+        labels = np.searchsorted(edges, self.volatility[starts], side="right")
+        self.strata = [s for s in (starts[labels == i] for i in range(n_strata)) if len(s)]
+
+        self._order = []
+
+    def sample(self, n_steps: int) -> 'Tuple[int, int]':
+        if not self._order:
+            self._order = list(self.rng.permutation(len(self.strata)))
+
+        stratum = self.strata[self._order.pop()]
+        start = int(self.rng.choice(stratum))
+        return start, self._length(n_steps - start)
+
+    def reset(self) -> None:
+        super().reset()
+        self._order = []
+
+
+class SampledTradingEnv(TradingEnv):
+    """A `TradingEnv` that owns the whole feature history and plays each
+    episode on a window of it drawn by an `EpisodeSampler`.
+
+    On `reset` the observer and its portfolio and renderer sources jump to
+    the start of the window by moving their cursors, and reward schemes
+    reading prices by clock step, like the array mode of `PBR`, have their
+    `offset` moved along. No stream, exchange or feed is rebuilt.
+    Parameters
+    ----------
+    sampler : `EpisodeSampler`
+        The sampler of the episode windows.
+    **kwargs : keyword arguments
+        The components of the `TradingEnv`, with a `WindowObserver`.
+    """
+
+    def __init__(self, sampler: EpisodeSampler, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.sampler = sampler
+
+        if getattr(self.reward_scheme, "feed", None) is not None:
+            raise ValueError("Reward schemes evaluating their own feed cannot follow sampled episodes.")
+        self._offset = getattr(self.reward_scheme, "offset", None)
+
+    def reset(self) -> 'np.array':
+        start, length = self.sampler.sample(len(self.observer.windows))
+        self.observer.seek(start, length)
+
+        if self._offset is not None:
+            self.reward_scheme.offset = self._offset + start
+
+        return super().reset()
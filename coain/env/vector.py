@@ -0,0 +1,247 @@
+"""Contains a vectorized environment stepping many BuySellHold episodes at
+once."""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from gym.spaces import Box, Discrete
+
+from coain.env.observer import window_view
+
+try:
+    from ray.rllib.env import VectorEnv
+except ImportError:
+    class VectorEnv:
+        """Stands in for the rllib `VectorEnv` when ray is not installed, so
+        the env can be stepped on its own."""
+
+        def __init__(self, observation_space: 'Space', action_space: 'Space', num_envs: int) -> None:
+            self.observation_space = observation_space
+            self.action_space = action_space
+            self.num_envs = num_envs
+
+
+class VectorBuySellHoldEnv(VectorEnv):
+    """Steps `num_envs` independent `BuySellHold` + `PBR` episodes over the
+    same price history in a single NumPy call.
+
+    The state of each episode is only its position flag, cash and asset
+    balances and the row of the price history it has reached, so the whole
+    batch is a handful of arrays. Orders follow the semantics of
+    `proportion_order` executed by the simulated `execute_order` service:
+    every position flip trades the whole balance of the source wallet at the
+    current price quantized to the cash precision, and pays `commission` on
+    it. Balances are rounded to the precision of their instrument like the
+    `Decimal` quantities of the OMS.
+
+    It is an rllib `VectorEnv` when ray is installed, so env creators
+    registered with rllib can return it and have every worker step
+    `num_envs` episodes at once:
+    `vector_reset`, `reset_at` and `vector_step` leave episodes that are done
+    as they are until rllib resets them. `observation_space` and
+    `action_space` are the spaces of a single episode, as rllib expects. The
+    `reset`, `step`, `step_async` and `step_wait` methods of the gym
+    `VectorEnv` are provided as well: `reset` returns a batch of observations
+    and `step` takes a batch of actions and returns batches of observations,
+    rewards, dones and infos, automatically resetting the episodes that are
+    done and giving their last observation as the 'terminal_observation' of
+    their info.
+    Parameters
+    ----------
+    num_envs : int
+        The number of episodes to step at once.
+    prices : `np.ndarray`
+        The price history of the traded pair.
+    features : `np.ndarray`
+        The feature matrix of shape (steps, features) the observations are
+        taken from, e.g. `CompiledFeed.values`.
+    window_size : int
+        The size of the observation window.
+    padding : int
+        The number of leading rows of zeros of `features`, like the
+        `padding` of a `CompiledFeed`. Features padded with `pad` for the
+        window are viewed without a copy.
+    cash : float
+        The starting cash balance.
+    asset : float
+        The starting asset balance.
+    cash_precision : int
+        The precision of the cash instrument.
+    asset_precision : int
+        The precision of the asset instrument.
+    commission : float
+        The commission of the exchange.
+    max_allowed_loss : float
+        The fraction of the initial net worth that can be lost before an
+        episode stops.
+    """
+
+    def __init__(self,
+                 num_envs: int,
+                 prices: np.ndarray,
+                 features: np.ndarray,
+                 window_size: int = 1,
+                 padding: int = 0,
+                 cash: float = 1000.,
+                 asset: float = 0.,
+                 cash_precision: int = 2,
+                 asset_precision: int = 8,
+                 commission: float = 0.003,
+                 max_allowed_loss: float = 0.5) -> None:
+        self.prices = np.asarray(prices, dtype=np.float64)
+
+        features = np.asarray(features)
+        offset = padding - (window_size - 1)
+        if offset >= 0 and features.dtype == np.float32:
+            self.windows = window_view(features[offset:], window_size, padded=True)
+        else:
+            self.windows = window_view(features[padding:], window_size)
+
+        self.initial_cash = cash
+        self.initial_asset = asset
+        self.cash_precision = cash_precision
+        self.asset_precision = asset_precision
+        self.commission = commission
+        self.max_allowed_loss = max_allowed_loss
+
+        # the price exchanges quote orders at, and the change the PBR rewards
+        self._quoted = np.round(self.prices, cash_precision)
+        diffs = np.diff(self.prices, prepend=np.nan)
+        self._diffs = np.where(np.isnan(diffs), 0, diffs)
+
+        super().__init__(
+            observation_space=Box(
+                low=-np.inf,
+                high=np.inf,
+                shape=self.windows.shape[1:],
+                dtype=self.windows.dtype
+            ),
+            action_space=Discrete(2),
+            num_envs=num_envs
+        )
+        self.single_observation_space = self.observation_space
+        self.single_action_space = self.action_space
+
+        self.cash = np.zeros(num_envs)
+        self.asset = np.zeros(num_envs)
+        self.position = np.zeros(num_envs, dtype=np.int64)
+        self.row = np.zeros(num_envs, dtype=np.int64)
+        self.initial_net_worth = np.zeros(num_envs)
+        self._actions = None
+
+    @property
+    def net_worth(self) -> np.ndarray:
+        """The net worth of every episode at the current row."""
+        return self.cash + self.asset * self.prices[self.row]
+
+    def _reset(self, mask: np.ndarray) -> None:
+        self.cash[mask] = np.round(self.initial_cash, self.cash_precision)
+        self.asset[mask] = np.round(self.initial_asset, self.asset_precision)
+        self.position[mask] = 0
+        self.row[mask] = 0
+        self.initial_net_worth[mask] = self.net_worth[mask]
+
+    def reset(self) -> np.ndarray:
+        """Resets every episode.
+        Returns
+        -------
+        `np.ndarray`
+            The first observation of every episode.
+        """
+        self._reset(np.ones(self.num_envs, dtype=bool))
+        return self.windows[self.row]
+
+    def _trade(self, mask: np.ndarray, source: np.ndarray, target: np.ndarray,
+               source_precision: int, target_precision: int, rate: np.ndarray) -> None:
+        """Sends the whole `source` balance of the masked episodes to `target`,
+        converting it at `rate`, in place."""
+        filled = source[mask]
+        commission = self.commission * filled
+
+        # orders whose commission is below the precision are cancelled
+        ok = commission >= 10. ** -source_precision
+        idx = np.flatnonzero(mask)[ok]
+        filled, commission = filled[ok], commission[ok]
+
+        paid = np.round(commission, source_precision)
+        quantity = np.round(filled - commission, source_precision)
+
+        source[idx] = np.round(filled - paid - quantity, source_precision)
+        target[idx] = np.round(target[idx] + np.round(quantity * rate[ok], target_precision), target_precision)
+
+    def _step(self, actions: np.ndarray) -> 'Tuple[np.ndarray, np.ndarray, List[dict]]':
+        """Steps every episode without resetting the ones that are done."""
+        actions = np.asarray(actions, dtype=np.int64)
+        quoted = self._quoted[self.row]
+
+        flip = actions != self.position
+        buy = flip & (self.position == 0) & (self.cash > 0)
+        sell = flip & (self.position == 1) & (self.asset > 0)
+
+        self._trade(buy, self.cash, self.asset, self.cash_precision, self.asset_precision, 1 / quoted[buy])
+        self._trade(sell, self.asset, self.cash, self.asset_precision, self.cash_precision, quoted[sell])
+        self.position = np.where(flip, actions, self.position)
+
+        self.row += 1
+
+        rewards = np.where(actions == 0, -1., 1.) * self._diffs[self.row]
+        rewards[self.row == 1] = 0.
+
+        net_worth = self.net_worth
+        dones = (1 - net_worth / self.initial_net_worth > self.max_allowed_loss) | (self.row >= len(self.windows) - 1)
+        infos = [{"net_worth": nw} for nw in net_worth]
+        return rewards, dones, infos
+
+    def step(self, actions: np.ndarray) -> 'Tuple[np.ndarray, np.ndarray, np.ndarray, List[dict]]':
+        """Steps every episode.
+        Parameters
+        ----------
+        actions : `np.ndarray`
+            The action of every episode, 0 to be out of the market and 1 to be
+            in it.
+        Returns
+        -------
+        `np.ndarray`
+            The observation of every episode. Episodes that are done are
+            reset and give their first observation.
+        `np.ndarray`
+            The reward of every episode.
+        `np.ndarray`
+            Whether every episode is done.
+        List[dict]
+            The info of every episode, holding its final `net_worth`, and its
+            'terminal_observation' if it is done.
+        """
+        rewards, dones, infos = self._step(actions)
+
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i]["terminal_observation"] = self.windows[self.row[i]]
+            self._reset(dones)
+
+        return self.windows[self.row], rewards, dones, infos
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._actions = actions
+
+    def step_wait(self) -> 'Tuple[np.ndarray, np.ndarray, np.ndarray, List[dict]]':
+        return self.step(self._actions)
+
+    def vector_reset(self) -> 'List[np.ndarray]':
+        return list(self.reset())
+
+    def reset_at(self, index: int = None) -> np.ndarray:
+        index = 0 if index is None else index
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[index] = True
+        self._reset(mask)
+        return self.windows[self.row[index]]
+
+    def vector_step(self, actions: 'List[int]') -> 'Tuple[List[np.ndarray], List[float], List[bool], List[dict]]':
+        # rllib resets the episodes that are done with reset_at
+        rewards, dones, infos = self._step(np.asarray(actions))
+        return list(self.windows[self.row]), rewards.tolist(), dones.tolist(), infos
+
+    def close(self) -> None:
+        pass
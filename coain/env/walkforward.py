@@ -0,0 +1,233 @@
+"""Contains the walk-forward folds of a price history and a runner training
+and evaluating them in parallel processes."""
+
+import os
+import time
+import logging
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Union
+
+import numpy as np
+import pandas as pd
+
+from coain.dataset.store import PriceStore
+
+
+# the variables sizing the thread pools of numerical libraries
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS"
+]
+
+
+class Fold(NamedTuple):
+    """The rows a fold trains on and the rows right after them it is tested
+    on, as [start, stop) ranges of the history."""
+
+    index: int
+    train_start: int
+    train_stop: int
+    test_start: int
+    test_stop: int
+
+    @property
+    def train_size(self) -> int:
+        return self.train_stop - self.train_start
+
+    @property
+    def test_size(self) -> int:
+        return self.test_stop - self.test_start
+
+
+def walk_forward_folds(n_rows: int,
+                       train_size: int,
+                       test_size: int,
+                       step: int = None,
+                       anchored: bool = False,
+                       start: int = 0) -> 'List[Fold]':
+    """Splits a history into walk-forward folds.
+
+    Every fold trains on `train_size` rows and is tested on the `test_size`
+    rows following them, and each fold moves `step` rows forward from the
+    previous one, so with the default step the test sets tile the history
+    without overlapping. The folds are aligned so that the last one is
+    tested on the last rows of the history: when the rows after `start`
+    are not a whole number of steps, the first `(n_rows - start -
+    train_size - test_size) % step` of them are left out of the rolling
+    folds. Anchored folds train from `start` and use them too.
+    Parameters
+    ----------
+    n_rows : int
+        The number of rows of the history.
+    train_size : int
+        The number of rows trained on, at least as many if `anchored`.
+    test_size : int
+        The number of rows tested on.
+    step : int, optional
+        The number of rows between folds, `test_size` by default.
+    anchored : bool
+        Whether every fold trains from `start`, so the training sets grow
+        instead of rolling.
+    start : int
+        The first row of the history that can be used.
+    Returns
+    -------
+    List[`Fold`]
+        The folds in time order.
+    """
+    step = step or test_size
+    span = n_rows - start - train_size - test_size
+    if span < 0:
+        return []
+
+    first = start + span % step
+    folds = []
+    for i, train_start in enumerate(range(first, n_rows - train_size - test_size + 1, step)):
+        train_stop = train_start + train_size
+        folds += [Fold(
+            index=i,
+            train_start=start if anchored else train_start,
+            train_stop=train_stop,
+            test_start=train_stop,
+            test_stop=train_stop + test_size
+        )]
+    return folds
+
+
+def backtest_metrics(result: 'BacktestResult') -> 'Dict[str, float]':
+    """The final net worth, total return, maximum drawdown, per step Sharpe
+    ratio and number of trades of a single policy replayed by `Backtest`.
+
+    Steps from a net worth of zero have a return of zero, like in
+    `SharpeRatio`, and a single step has a Sharpe ratio of zero."""
+    net_worth = np.asarray(result.net_worth, dtype=np.float64).reshape(-1)
+    previous = net_worth[:-1]
+    returns = np.divide(np.diff(net_worth), previous, out=np.zeros(len(previous)), where=previous != 0)
+    peak = np.maximum.accumulate(net_worth)
+    drawdown = 1 - np.divide(net_worth, peak, out=np.ones(len(peak)), where=peak != 0)
+    std = returns.std() if len(returns) else 0.
+
+    return {
+        "final_net_worth": float(net_worth[-1]),
+        "total_return": float(net_worth[-1] / net_worth[0] - 1) if net_worth[0] != 0 else 0.,
+        "max_drawdown": float(drawdown.max()),
+        "sharpe": float(returns.mean() / std) if std > 0 else 0.,
+        "trades": len(result.trades)
+    }
+
+
+_store = None
+
+
+def _init_worker(path: str) -> None:
+    global _store
+    _store = PriceStore(path)
+
+
+def _run_fold(fn: 'Callable[[PriceStore, Fold], dict]', fold: 'Fold') -> 'Dict[str, object]':
+    start = time.perf_counter()
+    metrics = fn(_store, fold)
+    return dict(metrics, seconds=time.perf_counter() - start, pid=os.getpid())
+
+
+class WalkForward:
+    """Trains and evaluates every fold of a walk-forward split in a pool of
+    processes.
+
+    The price history is shared through a `PriceStore`: each worker opens
+    it once, memory-mapped, so all of them read the same page-cached copy of
+    the data and only the path and the fold bounds are sent to them. The
+    folds are submitted at once, longest first, so the workers stay busy and
+    the last ones to finish are short. Each worker limits the thread pools
+    of the numerical libraries to `threads_per_worker`, so the processes do
+    not compete for the cores.
+
+    `fn` is called in the workers with the store and a fold and returns the
+    metrics of the fold as a dict. It must be importable from the workers,
+    i.e. defined at the top level of a module, and the script running the
+    folds should be guarded by `if __name__ == "__main__"`.
+    Parameters
+    ----------
+    store : `PriceStore` or str
+        The store of the history, or its path.
+    folds : List[`Fold`]
+        The folds to run.
+    fn : Callable[[`PriceStore`, `Fold`], dict]
+        Trains and evaluates a fold, returning its metrics.
+    max_workers : int, optional
+        The number of processes, by default the number of cores available.
+    threads_per_worker : int
+        The number of threads each worker lets its numerical libraries use.
+    mp_context : str
+        The start method of the processes.
+    """
+
+    def __init__(self,
+                 store: 'Union[PriceStore, str]',
+                 folds: 'List[Fold]',
+                 fn: 'Callable[[PriceStore, Fold], dict]',
+                 max_workers: int = None,
+                 threads_per_worker: int = 1,
+                 mp_context: str = 'spawn') -> None:
+        self.path = store.path if isinstance(store, PriceStore) else store
+        self.folds = folds
+        self.fn = fn
+        self.max_workers = max_workers or _available_cores()
+        self.threads_per_worker = threads_per_worker
+        self.mp_context = mp_context
+
+    def run(self) -> pd.DataFrame:
+        """Runs every fold.
+        Returns
+        -------
+        `pd.DataFrame`
+            A row per fold, in fold order, with its bounds, the metrics
+            returned by `fn`, the seconds it took and the process it ran in.
+            Folds that raised have their error in an `error` column instead,
+            and the exception is logged.
+        """
+        rows = {}
+        order = sorted(self.folds, key=lambda f: f.train_size + f.test_size, reverse=True)
+
+        # the workers inherit the variables when they are started
+        saved = {v: os.environ.get(v) for v in THREAD_VARIABLES}
+        os.environ.update({v: str(self.threads_per_worker) for v in THREAD_VARIABLES})
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, max(len(order), 1)),
+                                     mp_context=multiprocessing.get_context(self.mp_context),
+                                     initializer=_init_worker,
+                                     initargs=(self.path,)) as executor:
+                futures = {executor.submit(_run_fold, self.fn, fold): fold for fold in order}
+                _restore(saved)
+
+                for future in as_completed(futures):
+                    fold = futures[future]
+                    try:
+                        metrics = future.result()
+                    except Exception as e:
+                        logging.exception("Fold {} failed.".format(fold.index))
+                        metrics = {"error": repr(e)}
+                    rows[fold.index] = dict(fold._asdict(), **metrics)
+        finally:
+            _restore(saved)
+
+        return pd.DataFrame([rows[f.index] for f in self.folds if f.index in rows])
+
+
+def _available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _restore(saved: 'Dict[str, str]') -> None:
+    for variable, value in saved.items():
+        if value is None:
+            os.environ.pop(variable, None)
+        else:
+            os.environ[variable] = value
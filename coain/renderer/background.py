@@ -0,0 +1,222 @@
+"""Contains a renderer wrapper that renders and saves charts on a background
+thread."""
+
+import logging
+import threading
+
+from collections import OrderedDict, deque
+from itertools import islice
+from types import SimpleNamespace
+from typing import NamedTuple, Union
+
+from tensortrade.env.generic import Renderer
+
+from coain.env.history import ColumnHistory, PortfolioView
+
+
+class _Task(NamedTuple):
+    episode: int
+    step: int
+    rows: 'Union[list, ColumnHistory]'
+    n_rows: int
+    performance: 'Union[list, ColumnHistory]'
+    n_performance: int
+    base_symbol: str
+    trades: list
+    n_trades: int
+    kwargs: dict
+    render: bool
+    save: bool
+
+
+class BackgroundRenderer(Renderer):
+    """Renders another renderer on a background thread so rendering and
+    saving never stall the training loop.
+
+    On `render` a snapshot of the env is queued and the call returns at once.
+    The snapshot does not copy the histories the renderers read: the renderer
+    history of the observer is append-only and replaced on reset, so it is
+    referenced with its current length, and the performance of the portfolio
+    and the trades of the broker are mirrored in append-only lists that only
+    take the entries added since the previous snapshot. The worker thread
+    cuts the histories at the snapshot lengths and renders the wrapped
+    renderer on a view of the env holding them. Histories kept in a
+    `ColumnHistory` are snapshotted with views of their columns, or copies
+    of them in ring mode.
+
+    The queue holds at most `max_queue` snapshots. When it is full the oldest
+    one is dropped, so a slow renderer skips frames instead of blocking
+    `env.step`. The wrapped renderer is reset by the worker when the
+    snapshots move to a new episode.
+
+    Renderers running in the background should work headlessly, e.g.
+    `MyPlotlyTradingChart(display=False, save_format='html')` or
+    `PositionChangeChart(path='charts')`.
+    Parameters
+    ----------
+    renderer : `Renderer`
+        The renderer to run in the background.
+    max_queue : int
+        The maximum number of snapshots waiting to be rendered.
+    auto_save : bool
+        Whether to save the chart after every render.
+    Attributes
+    ----------
+    dropped : int
+        The number of snapshots dropped because the queue was full.
+    errors : int
+        The number of renders or saves that raised an exception, which is
+        logged.
+    """
+
+    def __init__(self, renderer: 'Renderer', max_queue: int = 2, auto_save: bool = True) -> None:
+        self.renderer = renderer
+        self.max_queue = max_queue
+        self.auto_save = auto_save
+
+        self.dropped = 0
+        self.errors = 0
+
+        self._episode = 0
+        self._performance = []
+        self._trades = []
+        self._sources = (None, None)
+        self._last = None
+
+        self._queue = deque()
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="BackgroundRenderer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _mirror(mirror: list, source: 'OrderedDict') -> None:
+        """Appends the items of an append-only `source` dict missing from
+        `mirror`."""
+        n_new = len(source) - len(mirror)
+        if n_new > 0:
+            mirror += list(islice(reversed(source.items()), n_new))[::-1]
+
+    def render(self, env: 'TradingEnv', **kwargs) -> None:
+        portfolio = env.action_scheme.portfolio
+        columns = getattr(portfolio, "history", None)
+        performance = columns if columns is not None else portfolio.performance or OrderedDict()
+        trades = env.action_scheme.broker.trades
+
+        # the histories are replaced, not cleared, when the env resets
+        if performance is not self._sources[0] or trades is not self._sources[1]:
+            self._performance = []
+            self._trades = []
+            self._sources = (performance, trades)
+        if columns is None:
+            self._mirror(self._performance, performance)
+        self._mirror(self._trades, trades)
+
+        rows = env.observer.renderer_history
+        self._last = _Task(
+            episode=self._episode,
+            step=env.clock.step,
+            rows=rows.snapshot() if isinstance(rows, ColumnHistory) else rows,
+            n_rows=None if isinstance(rows, ColumnHistory) else len(rows),
+            performance=columns.snapshot() if columns is not None else self._performance,
+            n_performance=None if columns is not None else len(self._performance),
+            base_symbol=portfolio.base_instrument.symbol,
+            trades=self._trades,
+            n_trades=len(self._trades),
+            kwargs=kwargs,
+            render=True,
+            save=self.auto_save
+        )
+        self._put(self._last)
+
+    def save(self) -> None:
+        """Queues a save of the chart, after the renders already queued."""
+        with self._cond:
+            if self._queue:
+                self._queue[-1] = self._queue[-1]._replace(save=True)
+                return
+        if self._last is not None:
+            self._put(self._last._replace(render=False, save=True))
+
+    def reset(self) -> None:
+        self._episode += 1
+        self._performance = []
+        self._trades = []
+        self._sources = (None, None)
+        self._last = None
+
+    def _put(self, task: '_Task') -> None:
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(task)
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        episode = 0
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                task = self._queue.popleft()
+                self._busy = True
+
+            try:
+                if task.episode != episode:
+                    episode = task.episode
+                    self.renderer.reset()
+                if task.render:
+                    self.renderer.render(self._view(task), **task.kwargs)
+                if task.save:
+                    self.renderer.save()
+            except Exception:
+                self.errors += 1
+                logging.exception("Background rendering failed.")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _view(task: '_Task') -> 'SimpleNamespace':
+        """Builds the view of the env a renderer reads from a snapshot."""
+        if task.n_performance is None:
+            portfolio = PortfolioView(task.performance, task.base_symbol)
+        else:
+            portfolio = SimpleNamespace(performance=OrderedDict(task.performance[:task.n_performance]))
+
+        return SimpleNamespace(
+            clock=SimpleNamespace(step=task.step),
+            observer=SimpleNamespace(renderer_history=task.rows if task.n_rows is None else task.rows[:task.n_rows]),
+            action_scheme=SimpleNamespace(
+                portfolio=portfolio,
+                broker=SimpleNamespace(trades=OrderedDict(task.trades[:task.n_trades]))
+            )
+        )
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every queued snapshot is rendered.
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait.
+        Returns
+        -------
+        bool
+            Whether the queue was emptied in time.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def close(self) -> None:
+        """Renders the queued snapshots, stops the worker thread and closes the
+        wrapped renderer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.renderer.close()
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 from tensortrade.env.generic import Renderer
 
@@ -11,8 +12,9 @@ import importlib
 
 from abc import abstractmethod
 from datetime import datetime
-from typing import Union, Tuple
-from collections import OrderedDict
+from typing import Union, Tuple, List
+from collections import OrderedDict, deque
+from itertools import islice
 
 import numpy as np
 import pandas as pd
@@ -24,51 +26,84 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from tensortrade.oms.orders import TradeSide
 from tensortrade.env.generic import Renderer, TradingEnv
-from tensortrade.env.default.renderers import BaseRenderer
+from tensortrade.env.default.renderers import BaseRenderer, _check_valid_format, _check_path, _create_auto_file_name
+
+from coain.renderer.downsample import lttb
+from coain.env.history import ColumnHistory, history_frame, performance_frame
 
 
 
 class PositionChangeChart(Renderer):
+    """Plots the price with the position changes and the performance of an
+    episode with matplotlib.
+    Parameters
+    ----------
+    color : str
+        The color of the price line.
+    max_points : int
+        The maximum number of points of each line, which are downsampled with
+        LTTB beyond it. The position change markers are always exact.
+    path : str, optional
+        A folder to save every chart to as a png instead of showing it. The
+        chart is then drawn without pyplot, so it can be rendered from a
+        background thread.
+    filename_prefix : str
+        A string that precedes the automatically-created file names.
+    """
 
-    def __init__(self, color: str = "orange"):
+    def __init__(self,
+                 color: str = "orange",
+                 max_points: int = 5000,
+                 path: str = None,
+                 filename_prefix: str = 'chart_'):
         self.color = "orange"
+        self.max_points = max_points
+        self.path = path
+        self.filename_prefix = filename_prefix
 
     def render(self, env, **kwargs):
-        history = pd.DataFrame(env.observer.renderer_history)
-
-        actions = list(history.action)
-        p = list(history.price)
-
-        buy = {}
-        sell = {}
+        # the columns of a ColumnHistory are read as views
+        history = env.observer.renderer_history
+        offset = getattr(history, "offset", 0)
+        if not isinstance(history, ColumnHistory):
+            history = pd.DataFrame(history)
 
-        for i in range(len(actions) - 1):
-            a1 = actions[i]
-            a2 = actions[i + 1]
+        actions = np.asarray(history["action"])
+        p = np.asarray(history["price"])
 
-            if a1 != a2:
-                if a1 == 0 and a2 == 1:
-                    buy[i] = p[i]
-                else:
-                    sell[i] = p[i]
+        changes = np.flatnonzero(actions[:-1] != actions[1:])
+        bought = (actions[changes] == 0) & (actions[changes + 1] == 1)
 
-        buy = pd.Series(buy)
-        sell = pd.Series(sell)
+        buy = pd.Series(p[changes[bought]], index=changes[bought] + offset)
+        sell = pd.Series(p[changes[~bought]], index=changes[~bought] + offset)
 
-        fig, axs = plt.subplots(1, 2, figsize=(15, 5))
+        if self.path:
+            fig = Figure(figsize=(15, 5))
+            axs = fig.subplots(1, 2)
+        else:
+            fig, axs = plt.subplots(1, 2, figsize=(15, 5))
 
         fig.suptitle("Performance")
 
-        axs[0].plot(np.arange(len(p)), p, label="price", color=self.color)
+        kept = lttb(p, self.max_points)
+        axs[0].plot(kept + offset, p[kept], label="price", color=self.color)
         axs[0].scatter(buy.index, buy.values, marker="^", color="green")
         axs[0].scatter(sell.index, sell.values, marker="^", color="red")
         axs[0].set_title("Trading Chart")
 
-        performance_df = pd.DataFrame().from_dict(env.action_scheme.portfolio.performance, orient='index')
-        performance_df.plot(ax=axs[1])
+        performance_df = performance_frame(env.action_scheme.portfolio)
+        for name, values in performance_df.select_dtypes("number").items():
+            kept = lttb(values.to_numpy(), self.max_points)
+            axs[1].plot(values.index[kept], values.to_numpy()[kept], label=name)
+        axs[1].legend()
         axs[1].set_title("Net Worth")
 
-        plt.show()
+        if self.path:
+            _check_path(self.path)
+            filename = _create_auto_file_name(self.filename_prefix, 'png', '%Y%m%d_%H%M%S_%f')
+            fig.savefig(os.path.join(self.path, filename))
+        else:
+            plt.show()
 
 
 
@@ -102,13 +137,18 @@ class MyPlotlyTradingChart(BaseRenderer):
         requires an Internet connect while True includes the library resulting
         in much larger file sizes. False to not include the library. For more
         details, refer to https://plot.ly/python-api-reference/generated/plotly.graph_objects.Figure.html
+    incremental : bool
+        True to only append the bars added since the last render, keeping
+        the last `max_visible_steps` of them in the chart, so a render costs
+        the same however long the episode is. False to redraw the whole
+        history on every render. Default False.
+    max_visible_steps : int
+        The number of most recent steps shown in incremental mode, after
+        which the chart slides along with the new data. Default 1000.
     Notes
     -----
     Possible Future Enhancements:
         - Saving images without using Orca.
-        - Limit displayed step range for the case of a large number of steps and let
-          the shown part of the chart slide after filling that range to keep showing
-          recent data as it's being added.
     References
     ----------
     .. [1] https://plot.ly/python-api-reference/generated/plotly.graph_objects.Figure.html
@@ -126,7 +166,9 @@ class MyPlotlyTradingChart(BaseRenderer):
                  path: str = 'charts',
                  filename_prefix: str = 'chart_',
                  auto_open_html: bool = False,
-                 include_plotlyjs: Union[bool, str] = 'cdn') -> None:
+                 include_plotlyjs: Union[bool, str] = 'cdn',
+                 incremental: bool = False,
+                 max_visible_steps: int = 1000) -> None:
         super().__init__()
         self._height = height
         self._timestamp_format = timestamp_format
@@ -141,6 +183,8 @@ class MyPlotlyTradingChart(BaseRenderer):
 
         self.fig = None
         self._price_chart = None
+        self._buy_chart = None
+        self._sell_chart = None
         self._volume_chart = None
         self._performance_chart = None
         self._net_worth_chart = None
@@ -148,6 +192,23 @@ class MyPlotlyTradingChart(BaseRenderer):
         self._last_trade_step = 0
         self._show_chart = display
 
+        self._incremental = incremental
+        self._max_visible_steps = max_visible_steps
+        self._displayed = False
+        self._rendered_rows = 0
+        self._rendered_performance = 0
+        self._window = {k: deque(maxlen=max_visible_steps)
+                        for k in ('x', 'date', 'open', 'high', 'low', 'close', 'volume', 'step', 'net_worth')}
+        self._markers = None
+        self._clear_trades()
+
+    def _clear_trades(self) -> None:
+        self._markers = {side: {
+            'x': np.empty(0, dtype=np.int64),
+            'y': np.empty(0),
+            'customdata': np.empty((0, 9), dtype=object)
+        } for side in ('buy', 'sell')}
+
     def _create_figure(self, performance_keys: dict) -> None:
         fig = make_subplots(
             rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.03,
@@ -157,6 +218,19 @@ class MyPlotlyTradingChart(BaseRenderer):
                                      showlegend=False), row=1, col=1)
         fig.update_layout(xaxis_rangeslider_visible=False)
 
+        # trades are markers with their hover text built from customdata
+        # columns, which plotly renders far faster than layout annotations
+        for side, symbol, color in (('buy', 'triangle-up', 'DarkGreen'), ('sell', 'triangle-down', 'FireBrick')):
+            fig.add_trace(go.Scatter(
+                mode='markers', name=side.capitalize(), showlegend=False,
+                marker=dict(symbol=symbol, color=color, size=10, opacity=0.6),
+                hoverlabel=dict(bgcolor=color),
+                hovertemplate='Step %{customdata[0]} [%{customdata[1]}]<br>'
+                              + side.upper() + ' %{customdata[2]} %{customdata[3]} @ %{y} %{customdata[4]} '
+                              '%{customdata[5]}<br>Total: %{customdata[6]} %{customdata[4]} - '
+                              'Comm.: %{customdata[7]} %{customdata[8]}<extra></extra>'
+            ), row=1, col=1)
+
         fig.add_trace(go.Bar(name='Volume', showlegend=False,
                              marker={'color': 'DodgerBlue'}),
                       row=2, col=1)
@@ -173,92 +247,84 @@ class MyPlotlyTradingChart(BaseRenderer):
 
         self.fig = go.FigureWidget(fig)
         self._price_chart = self.fig.data[0]
-        self._volume_chart = self.fig.data[1]
+        self._buy_chart = self.fig.data[1]
+        self._sell_chart = self.fig.data[2]
+        self._volume_chart = self.fig.data[3]
         self._net_worth_chart = self.fig.data[-1]
 
         self.fig.update_annotations({'font': {'size': 12}})
         self.fig.update_layout(template='plotly_white', height=self._height, margin=dict(t=50))
         self._base_annotations = self.fig.layout.annotations
 
-    def _create_trade_annotations(self,
-                                  trades: 'OrderedDict',
-                                  price_history: 'pd.DataFrame') -> 'Tuple[go.layout.Annotation]':
-        """Creates annotations of the new trades after the last one in the chart.
+    def _append_trades(self,
+                       trades: 'OrderedDict',
+                       price_history: 'pd.DataFrame') -> None:
+        """Appends the trades made after the last one in the chart to the
+        columns of the buy and sell markers.
         Parameters
         ----------
         trades : `OrderedDict`
             The history of trades for the current episode.
         price_history : `pd.DataFrame`
-            The price history of the current episode.
-        Returns
-        -------
-        `Tuple[go.layout.Annotation]`
-            A tuple of annotations used in the renderering process.
+            The price history of the current episode, indexed by step.
         """
-        annotations = []
+        new = []
         for trade in reversed(trades.values()):
             trade = trade[0]
-
-            tp = float(trade.price)
-            ts = float(trade.size)
-
             if trade.step <= self._last_trade_step:
                 break
+            new += [trade]
 
-            if trade.side.value == 'buy':
-                color = 'DarkGreen'
-                ay = 15
-                qty = round(ts / tp, trade.quote_instrument.precision)
-
-                text_info = dict(
-                    step=trade.step,
-                    datetime=price_history.iloc[trade.step - 1]['date'],
-                    side=trade.side.value.upper(),
-                    qty=qty,
-                    size=ts,
-                    quote_instrument=trade.quote_instrument,
-                    price=tp,
-                    base_instrument=trade.base_instrument,
-                    type=trade.type.value.upper(),
-                    commission=trade.commission
-                )
-
-            elif trade.side.value == 'sell':
-                color = 'FireBrick'
-                ay = -15
-                # qty = round(ts * tp, trade.quote_instrument.precision)
-
-                text_info = dict(
-                    step=trade.step,
-                    datetime=price_history.iloc[trade.step - 1]['date'],
-                    side=trade.side.value.upper(),
-                    qty=ts,
-                    size=round(ts * tp, trade.base_instrument.precision),
-                    quote_instrument=trade.quote_instrument,
-                    price=tp,
-                    base_instrument=trade.base_instrument,
-                    type=trade.type.value.upper(),
-                    commission=trade.commission
-                )
-            else:
-                raise ValueError(f"Valid trade side values are 'buy' and 'sell'. Found '{trade.side.value}'.")
-
-            hovertext = 'Step {step} [{datetime}]<br>' \
-                        '{side} {qty} {quote_instrument} @ {price} {base_instrument} {type}<br>' \
-                        'Total: {size} {base_instrument} - Comm.: {commission}'.format(**text_info)
-
-            annotations += [go.layout.Annotation(
-                x=trade.step - 1, y=tp,
-                ax=0, ay=ay, xref='x1', yref='y1', showarrow=True,
-                arrowhead=2, arrowcolor=color, arrowwidth=4,
-                arrowsize=0.8, hovertext=hovertext, opacity=0.6,
-                hoverlabel=dict(bgcolor=color)
-            )]
-
-        if trades:
-            self._last_trade_step = trades[list(trades)[-1]][0].step
-
-        return tuple(annotations)
+        if not new:
+            return
+        new.reverse()
+        self._last_trade_step = new[-1].step
+
+        step = np.array([t.step for t in new])
+        price = np.array([float(t.price) for t in new])
+        size = np.array([float(t.size) for t in new])
+        is_buy = np.array([t.side == TradeSide.BUY for t in new])
+        quote = np.array([t.quote_instrument.symbol for t in new], dtype=object)
+        base = np.array([t.base_instrument.symbol for t in new], dtype=object)
+
+        # buys spend the base instrument and sells the quote instrument
+        precision = np.array([
+            t.quote_instrument.precision if b else t.base_instrument.precision for t, b in zip(new, is_buy)
+        ])
+        scale = 10. ** precision
+        qty = np.where(is_buy, np.round(size / price * scale) / scale, size)
+        total = np.where(is_buy, size, np.round(size * price * scale) / scale)
+
+        customdata = np.column_stack([
+            step,
+            price_history['date'].reindex(step - 1).astype(str).to_numpy(dtype=object),
+            qty,
+            quote,
+            base,
+            np.array([t.type.value.upper() for t in new], dtype=object),
+            total,
+            np.array([float(t.commission.size) for t in new]),
+            np.where(is_buy, base, quote)
+        ]).astype(object)
+
+        for side, mask in (('buy', is_buy), ('sell', ~is_buy)):
+            markers = self._markers[side]
+            markers['x'] = np.concatenate([markers['x'], step[mask] - 1])
+            markers['y'] = np.concatenate([markers['y'], price[mask]])
+            markers['customdata'] = np.concatenate([markers['customdata'], customdata[mask]])
+
+    def _trim_trades(self, first: int) -> None:
+        """Drops the markers of the trades before step `first`."""
+        for markers in self._markers.values():
+            kept = markers['x'] >= first
+            if not kept.all():
+                for k in markers:
+                    markers[k] = markers[k][kept]
+
+    def _update_trades(self) -> None:
+        for side, chart in (('buy', self._buy_chart), ('sell', self._sell_chart)):
+            markers = self._markers[side]
+            chart.update(dict(x=markers['x'], y=markers['y'], customdata=markers['customdata']))
 
     def render_env(self,
                    episode: int = None,
@@ -284,25 +350,149 @@ class MyPlotlyTradingChart(BaseRenderer):
         if self._show_chart:  # ensure chart visibility through notebook cell reruns
             display(self.fig)
 
-        self.fig.layout.title = self._create_log_entry(episode, max_episodes, step, max_steps)
-        self._price_chart.update(dict(
-            open=price_history['open'],
-            high=price_history['high'],
-            low=price_history['low'],
-            close=price_history['close']
-        ))
-        self.fig.layout.annotations += self._create_trade_annotations(trades, price_history)
+        with self.fig.batch_update():
+            self.fig.layout.title = self._create_log_entry(episode, max_episodes, step, max_steps)
+            self._price_chart.update(dict(
+                x=price_history.index,
+                open=price_history['open'],
+                high=price_history['high'],
+                low=price_history['low'],
+                close=price_history['close']
+            ))
+            self._append_trades(trades, price_history)
+            self._update_trades()
 
-        self._volume_chart.update({'y': price_history['volume']})
+            self._volume_chart.update({'x': price_history.index, 'y': price_history['volume']})
 
-        #for trace in self.fig.select_traces(row=3):
-        #    trace.update({'y': performance[trace.name]})
+            #for trace in self.fig.select_traces(row=3):
+            #    trace.update({'y': performance[trace.name]})
 
-        self._net_worth_chart.update({'y': net_worth})
+            self._net_worth_chart.update({'y': net_worth})
 
         if self._show_chart:
             self.fig.show()
 
+    def render(self, env: 'TradingEnv', **kwargs) -> None:
+        history = env.observer.renderer_history
+        portfolio = env.action_scheme.portfolio
+
+        if not self._incremental:
+            performance = performance_frame(portfolio)
+            self.render_env(
+                episode=kwargs.get("episode", None),
+                max_episodes=kwargs.get("max_episodes", None),
+                step=env.clock.step,
+                max_steps=kwargs.get("max_steps", None),
+                price_history=history_frame(history) if len(history) > 0 else None,
+                net_worth=performance.net_worth,
+                performance=performance.drop(columns=['base_symbol'], errors='ignore'),
+                trades=env.action_scheme.broker.trades
+            )
+            return
+
+        # only the rows added since the last render that can still be seen
+        # are read, so the cost does not grow with the episode. Ring
+        # histories have dropped their first `offset` rows
+        offset = getattr(history, "offset", 0)
+        n_rows = offset + len(history)
+        start = max(self._rendered_rows, n_rows - self._max_visible_steps, offset)
+        rows = history[start - offset:]
+        self._rendered_rows = n_rows
+
+        columns = getattr(portfolio, "history", None)
+        if columns is not None:
+            n_performance = columns.offset + len(columns)
+            n_new = min(n_performance - self._rendered_performance, self._max_visible_steps, len(columns))
+            net_worth = columns["net_worth"][len(columns) - n_new:].tolist()
+        else:
+            performance = portfolio.performance or {}
+            n_performance = len(performance)
+            n_new = min(n_performance - self._rendered_performance, self._max_visible_steps)
+            net_worth = [p['net_worth'] for p in islice(reversed(performance.values()), n_new)][::-1]
+        self._rendered_performance = n_performance
+        net_worth_start = n_performance - n_new
+
+        self.append_env(
+            episode=kwargs.get("episode", None),
+            max_episodes=kwargs.get("max_episodes", None),
+            step=env.clock.step,
+            max_steps=kwargs.get("max_steps", None),
+            start=start,
+            rows=rows,
+            net_worth=net_worth,
+            net_worth_start=net_worth_start,
+            trades=env.action_scheme.broker.trades
+        )
+
+    def append_env(self,
+                   episode: int = None,
+                   max_episodes: int = None,
+                   step: int = None,
+                   max_steps: int = None,
+                   start: int = 0,
+                   rows: 'List[dict]' = None,
+                   net_worth: 'List[float]' = None,
+                   net_worth_start: int = 0,
+                   trades: 'OrderedDict' = None) -> None:
+        """Appends the new bars to the chart in incremental mode.
+        Parameters
+        ----------
+        episode : int
+            The current episode.
+        max_episodes : int
+            The maximum number of episodes.
+        step : int
+            The current step of the episode.
+        max_steps : int
+            The maximum number of steps of an episode.
+        start : int
+            The index in the renderer history of the first new row.
+        rows : List[dict]
+            The new rows of the renderer history.
+        net_worth : List[float]
+            The new net worths of the portfolio.
+        net_worth_start : int
+            The index in the performance history of the first new net worth.
+        trades : `OrderedDict`
+            The history of trades for the current episode.
+        """
+        if not self.fig:
+            self._create_figure(None)
+
+        # a FigureWidget shows its updates live once it is displayed
+        if self._show_chart and not self._displayed:
+            display(self.fig)
+            self._displayed = True
+
+        w = self._window
+        for i, row in enumerate(rows or [], start):
+            w['x'].append(i)
+            for k in ('date', 'open', 'high', 'low', 'close', 'volume'):
+                w[k].append(row[k])
+        for i, value in enumerate(net_worth or [], net_worth_start):
+            w['step'].append(i)
+            w['net_worth'].append(value)
+
+        if not w['x']:
+            return
+
+        price_history = pd.DataFrame({'date': list(w['date'])}, index=list(w['x']))
+        self._append_trades(trades or OrderedDict(), price_history)
+        self._trim_trades(w['x'][0])
+
+        with self.fig.batch_update():
+            self.fig.layout.title = self._create_log_entry(episode, max_episodes, step, max_steps)
+            self._price_chart.update(dict(
+                x=list(w['x']),
+                open=list(w['open']),
+                high=list(w['high']),
+                low=list(w['low']),
+                close=list(w['close'])
+            ))
+            self._volume_chart.update(dict(x=list(w['x']), y=list(w['volume'])))
+            self._net_worth_chart.update(dict(x=list(w['step']), y=list(w['net_worth'])))
+            self._update_trades()
+
     def save(self) -> None:
         """Saves the current chart to a file.
         Notes
@@ -326,6 +516,13 @@ class MyPlotlyTradingChart(BaseRenderer):
 
     def reset(self) -> None:
         self._last_trade_step = 0
+        self._rendered_rows = 0
+        self._rendered_performance = 0
+        self._displayed = False
+        for values in self._window.values():
+            values.clear()
+        self._clear_trades()
+
         if self.fig is None:
             return
 
@@ -0,0 +1,85 @@
+"""Contains downsampling of long histories for plotting."""
+
+import numpy as np
+import pandas as pd
+
+from coain.dataset.bars import aggregate
+
+
+def lttb(y: np.ndarray, n_out: int, x: np.ndarray = None) -> np.ndarray:
+    """Selects the points of a line series that keep its visual shape, with
+    the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept and the others are split into
+    `n_out - 2` buckets. From each bucket the point forming the largest
+    triangle with the point kept from the previous bucket and the average of
+    the next bucket is kept, so peaks and troughs survive the downsampling.
+    Parameters
+    ----------
+    y : `np.ndarray`
+        The values of the series.
+    n_out : int
+        The number of points to keep.
+    x : `np.ndarray`, optional
+        The numeric positions of the values, their index by default.
+    Returns
+    -------
+    `np.ndarray`
+        The sorted indices of the kept points, all of them if the series has
+        no more than `n_out` points.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    # the middle points split into n_out - 2 buckets, with their averages
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs((x[a] - avg_x[b]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[b] - y[a]))
+        a = lo + int(np.argmax(area))
+        indices[b + 1] = a
+
+    return indices
+
+
+def ohlc_buckets(df: pd.DataFrame, n_buckets: int) -> pd.DataFrame:
+    """Aggregates a candle history into at most `n_buckets` candles of
+    consecutive rows.
+
+    The buckets are aggregated with `aggregate`, so each spans the highest
+    high and lowest low of its rows, no price reached in the history is cut
+    off and markers placed at the exact time and price of a trade still fall
+    within their candle.
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        The candle history, with 'open', 'high', 'low' and 'close' columns.
+    n_buckets : int
+        The maximum number of candles.
+    Returns
+    -------
+    `pd.DataFrame`
+        The aggregated candles with the columns of `df`, indexed by the index
+        of the first row of each bucket, or `df` itself if it has no more
+        than `n_buckets` rows.
+    """
+    n = len(df)
+    if n <= n_buckets:
+        return df
+
+    starts = np.unique(np.linspace(0, n, n_buckets, endpoint=False).astype(np.int64))
+    return aggregate(df, starts)
@@ -1,8 +1,13 @@
 import pandas as pd
 import plotly.graph_objects as go
 
-def plot_df(df, filename, quote_symbol, base_symbol):
-    
+from coain.renderer.downsample import ohlc_buckets
+
+def plot_df(df, filename, quote_symbol, base_symbol, max_candles=5000):
+
+    # long histories are aggregated into at most max_candles candles
+    df = ohlc_buckets(df, max_candles)
+
     candlestick = go.Candlestick(
         x=df['time'],
         open=df['open'],
@@ -6,7 +6,8 @@ import tensortrade.stochastic as sp
 import tensortrade.env.default as default
 
 from tensortrade.feed.core import Stream, DataFeed
-from tensortrade.data.cdd import CryptoDataDownload
+from coain.dataset.cryptodownload import CryptoDataDownload
+from coain.dataset.cache import OHLCVCache
 from tensortrade.oms.wallets import Portfolio, Wallet
 from tensortrade.oms.exchanges import Exchange
 from tensortrade.oms.services.execution.simulated import execute_order
@@ -17,7 +18,7 @@ from tensortrade.env.default.renderers import PlotlyTradingChart, FileLogger
 
 def run():
 
-    cdd = CryptoDataDownload()
+    cdd = CryptoDataDownload(cache=OHLCVCache(ttl=24 * 60 * 60))
     bitfinex_btc = cdd.fetch("Bitfinex", "USD", "BTC", "1h")
 
     bitfinex = Exchange("bitfinex", service=execute_order)(
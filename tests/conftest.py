@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset.createfeatures import create_basic_features
+from coain.TheScheme import buysellhold
+
+
+def synthetic_history(rows: int, seed: int = 0, crash: bool = False) -> pd.DataFrame:
+    # minute candles of a random walk around 100, in cents
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, rows)).round(2)
+    open_ = np.roll(close, 1)
+    open_[0] = close[0]
+    high = np.maximum(open_, close) + rng.integers(0, 5, rows) * 0.01
+    low = np.minimum(open_, close) - rng.integers(0, 5, rows) * 0.01
+    df = pd.DataFrame({
+        'time': pd.date_range('2018-01-01', periods=rows, freq='min'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.uniform(0, 10, rows)
+    })
+    if crash:
+        # prices falling to 30% by the end, so episodes in the market stop on
+        # losses
+        ohlc = ['open', 'high', 'low', 'close']
+        df[ohlc] = (df[ohlc].to_numpy() * np.linspace(1, 0.3, rows)[:, None]).round(2)
+    return df
+
+
+@pytest.fixture(scope="session")
+def make_history():
+    """Builds synthetic histories, each built once per session and copied to
+    every test asking for it. By default the 1500 candles of a crash with the
+    basic features and the 'volume eth' column `trade_ai.create_env` reads."""
+    built = {}
+
+    def make(rows=1500, seed=0, crash=True, features=True):
+        key = rows, seed, crash, features
+        if key not in built:
+            df = synthetic_history(rows, seed, crash)
+            if features:
+                df = create_basic_features(df).rename(columns={'volume': 'volume eth'}).reset_index(drop=True)
+            built[key] = df
+        return built[key].copy()
+
+    return make
+
+
+@pytest.fixture
+def history(request, make_history):
+    """A synthetic history from `make_history`, whose arguments can be given
+    with an indirect parametrization."""
+    return make_history(**getattr(request, "param", {}))
+
+
+@pytest.fixture(params=[True, False], ids=["fast_path", "broker"])
+def fast_path(request, monkeypatch):
+    """Runs a test with the action schemes executing market orders on the
+    fast path of `execute_market_order`, then with every order submitted to
+    the `Broker` and executed by the `execute_order` service of tensortrade."""
+    if not request.param:
+        def fail(*args, **kwargs):
+            raise AssertionError("The fast path is disabled.")
+
+        monkeypatch.setattr(buysellhold, "is_simple_market_order", lambda *args, **kwargs: False)
+        monkeypatch.setattr(buysellhold, "execute_market_order", fail)
+    return request.param
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from tensortrade.feed.core import Stream
+from tensortrade.oms.exchanges import Exchange
+from tensortrade.oms.services.execution.simulated import execute_order
+from tensortrade.oms.instruments import ETH, Instrument
+from tensortrade.oms.wallets import Wallet, Portfolio
+
+import trade_ai
+
+from coain.TheScheme.buysellhold import MySimpleOrders, PBR
+from coain.env.backtest import Backtest
+from coain.env.create import create
+from coain.env.feed import CompiledFeed
+
+
+def simple_orders_env(prices, **kwargs):
+    close = Stream.source(prices, dtype="float").rename("USDT-ETH")
+    exchange = Exchange("binance", service=execute_order)(close)
+    USDT = Instrument("USDT", 3, "U.S. Dollar Tender")
+    portfolio = Portfolio(USDT, [Wallet(exchange, 1000 * USDT), Wallet(exchange, 0 * ETH)])
+
+    return create(
+        portfolio=portfolio,
+        action_scheme=MySimpleOrders(**kwargs),
+        reward_scheme=PBR(prices=prices),
+        feed=CompiledFeed({"close": prices}),
+        window_size=1
+    )
+
+
+def rollout(env, actions):
+    # the net worth curve, trades and stop step of an episode of the env
+    env.reset()
+    for action in actions:
+        _, _, done, _ = env.step(int(action))
+        if done:
+            break
+
+    portfolio = env.action_scheme.portfolio
+    net_worth = np.array([p["net_worth"] for p in portfolio.performance.values()], dtype=float)
+    # trades are stamped with the clock step, one after the action placing them
+    trades = [
+        (t.step - 1, t.side.value, float(t.price), float(t.quantity.size), float(t.commission.size))
+        for trades in env.action_scheme.broker.trades.values() for t in trades
+    ]
+    balances = {w.instrument.symbol: float(w.balance.size) for w in portfolio.wallets}
+    return net_worth, trades, len(net_worth) - 1, balances
+
+
+def check_parity(result, policy, net_worth, trades, end, balances):
+    assert result.end[policy] == end
+    np.testing.assert_allclose(result.net_worth[policy, :end + 1], net_worth, rtol=1e-12)
+    # the curves stay frozen after the stop
+    assert (result.net_worth[policy, end:] == result.net_worth[policy, end]).all()
+
+    assert result.cash[policy, -1] == balances["USDT"]
+    assert result.asset[policy, -1] == balances["ETH"]
+
+    replayed = result.trades[result.trades["policy"] == policy]
+    assert list(zip(
+        replayed["step"],
+        replayed["side"],
+        replayed["price"],
+        replayed["quantity"],
+        replayed["commission"]
+    )) == trades
+
+
+def test_buy_sell_hold_parity(history, fast_path):
+    prices = history["close"].to_numpy()
+    n_steps = len(prices) - 1
+    rng = np.random.default_rng(0)
+
+    actions = np.concatenate([
+        (rng.random((3, n_steps)) < [[0.01], [0.05], [0.3]]).cumsum(axis=1) % 2,
+        # in the market from the top of the first half, until the episode stops
+        (np.arange(n_steps) >= np.argmax(prices[:n_steps // 2]))[None],
+        np.zeros((1, n_steps))
+    ]).astype(int)
+
+    result = Backtest(prices, cash=1000, cash_precision=3).buy_sell_hold(actions)
+    ends = []
+    for policy in range(len(actions)):
+        net_worth, trades, end, balances = rollout(trade_ai.create_env(history), actions[policy])
+        check_parity(result, policy, net_worth, trades, end, balances)
+        ends += [end]
+
+    assert min(ends) < n_steps == max(ends)
+
+    # a single sequence gives the same as its row of a batch
+    single = Backtest(prices, cash=1000, cash_precision=3).buy_sell_hold(actions[1])
+    np.testing.assert_array_equal(single.net_worth, result.net_worth[1])
+    assert single.end == result.end[1]
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(trade_sizes=4),
+    dict(trade_sizes=[0.3, 1.0], durations=[4, 8], min_order_pct=0.1, min_order_abs=5.)
+])
+def test_simple_orders_parity(history, kwargs, fast_path):
+    prices = history["close"].to_numpy()
+    n_steps = len(prices) - 1
+    env = simple_orders_env(prices, **kwargs)
+    rng = np.random.default_rng(1)
+
+    actions = rng.integers(0, env.action_space.n, size=(4, n_steps))
+    actions[rng.random(actions.shape) < [[0.5], [0.7], [0.9], [0.97]]] = 0
+
+    result = Backtest(prices, cash=1000, cash_precision=3).simple_orders(actions, **kwargs)
+    for policy in range(len(actions)):
+        net_worth, trades, end, balances = rollout(env, actions[policy])
+        check_parity(result, policy, net_worth, trades, end, balances)
+        assert len(trades) > 0
+
+
+def test_rounding_edges(fast_path):
+    # orders too small to pay a commission are cancelled, and at a price of
+    # 0.512 buying an odd number of cash units rounds a tie
+    prices = np.tile([0.512, 0.512, 0.731, 1.024], 100)
+    kwargs = dict(trade_sizes=[0.0002, 0.013, 0.5, 1.0], min_order_pct=0.)
+    env = simple_orders_env(prices, **kwargs)
+    rng = np.random.default_rng(2)
+
+    actions = rng.integers(0, env.action_space.n, size=(4, len(prices) - 1))
+    result = Backtest(prices, cash=1000, cash_precision=3).simple_orders(actions, **kwargs)
+    for policy in range(len(actions)):
+        net_worth, trades, end, balances = rollout(env, actions[policy])
+        check_parity(result, policy, net_worth, trades, end, balances)
+
+
+def test_too_many_actions():
+    with pytest.raises(ValueError):
+        Backtest(np.ones(10)).buy_sell_hold(np.ones(10, dtype=int))
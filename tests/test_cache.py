@@ -0,0 +1,150 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset import cache as cache_module
+from coain.dataset.bars import bars_key
+from coain.dataset.cache import OHLCVCache
+from coain.dataset.cryptodownload import CryptoDataDownload
+
+
+def candles(rows, start=0, offset=0.):
+    date = pd.date_range('2021-01-01', periods=start + rows, freq='D')[start:]
+    close = np.arange(start, start + rows, dtype=np.float64) + 100 + offset
+    return pd.DataFrame({
+        'date': date,
+        'open': close - 1,
+        'high': close + 1,
+        'low': close - 2,
+        'close': close,
+        'volume': np.arange(start, start + rows, dtype=np.float64)
+    })
+
+
+def write_csv(path, df, base='USD', quote='BTC'):
+    # the layout of the cryptodatadownload files, newest first under a banner
+    csv = pd.DataFrame({
+        'Date': df['date'].dt.strftime('%Y-%m-%d'),
+        'symbol': '{}/{}'.format(quote, base),
+        'open': df['open'],
+        'high': df['high'],
+        'low': df['low'],
+        'close': df['close'],
+        'Volume {}'.format(base): df['volume'],
+        'Volume {}'.format(quote): df['volume'] * df['close']
+    })[::-1]
+    with open(os.path.join(path, 'Coinbase_{}{}_d.csv'.format(quote, base)), 'w') as f:
+        f.write('https://www.cryptodatadownload.com\n')
+        csv.to_csv(f, index=False)
+
+
+def test_update_appends_newer_candles(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    key = cache.key('Coinbase', 'USD', 'BTC', 'd')
+
+    cache.update(key, candles(10))
+    # the overlapping candles were revised upstream, the cached ones are kept
+    df = cache.update(key, candles(10, start=5, offset=0.5))
+
+    expected = pd.concat([candles(10), candles(5, start=10, offset=0.5)], ignore_index=True)
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+    pd.testing.assert_frame_equal(cache.load(key), expected, check_freq=False)
+
+
+def test_ttl(tmp_path, monkeypatch):
+    cache = OHLCVCache(str(tmp_path), ttl=60)
+    key = cache.key('Coinbase', 'USD', 'BTC', 'd')
+    assert cache.age(key) is None and not cache.is_fresh(key)
+
+    now = 1000000.
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now)
+    cache.update(key, candles(10))
+    assert cache.age(key) == 0 and cache.is_fresh(key)
+
+    now += 61
+    assert cache.age(key) == 61 and not cache.is_fresh(key)
+    assert OHLCVCache(str(tmp_path)).is_fresh(key)
+
+
+def test_invalidate(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    keys = [cache.key('Coinbase', 'USD', symbol, 'd') for symbol in ('BTC', 'ETH', 'LTC')]
+    for key in keys:
+        cache.update(key, candles(10))
+
+    cache.invalidate(keys[0])
+    assert cache.load(keys[0]) is None and cache.load(keys[1]) is not None
+
+    cache.invalidate()
+    assert all(cache.load(key) is None for key in keys)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_concurrent_writers(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    key = cache.key('Coinbase', 'USD', 'BTC', 'd')
+    frames = [candles(1000, offset=i) for i in range(8)]
+
+    def write(i):
+        for _ in range(10):
+            cache._write(key, frames[i], np.arange(1000))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write, range(8)))
+
+    assert os.listdir(str(tmp_path)) == [os.path.basename(cache.filename(key))]
+    df = cache.load(key)
+    assert any(df['close'].equals(frame['close']) for frame in frames)
+
+
+@pytest.fixture
+def local(tmp_path):
+    folder = tmp_path / 'cdd'
+    folder.mkdir()
+    write_csv(str(folder), candles(10))
+    return str(folder) + os.sep
+
+
+def test_fetch_local_folder(tmp_path, local):
+    cdd = CryptoDataDownload(url=local, cache=OHLCVCache(str(tmp_path / 'cache')))
+
+    df = cdd.fetch('Coinbase', 'USD', 'BTC', 'd')
+    assert list(df.columns) == ['date', 'open', 'high', 'low', 'close', 'volume']
+    np.testing.assert_array_equal(df['close'], candles(10)['close'])
+
+    # newer candles are only read on refresh, and appended to the cached ones
+    write_csv(local, candles(15, offset=0.5))
+    assert len(cdd.fetch('Coinbase', 'USD', 'BTC', 'd')) == 10
+
+    df = cdd.fetch('Coinbase', 'USD', 'BTC', 'd', refresh=True)
+    np.testing.assert_array_equal(df['close'][:10], candles(10)['close'])
+    np.testing.assert_array_equal(df['close'][10:], candles(5, start=10, offset=0.5)['close'])
+
+
+def test_fetch_local_folder_expired(tmp_path, local):
+    cdd = CryptoDataDownload(url=local, cache=OHLCVCache(str(tmp_path / 'cache'), ttl=0))
+
+    assert len(cdd.fetch('Coinbase', 'USD', 'BTC', 'd')) == 10
+    write_csv(local, candles(15))
+    assert len(cdd.fetch('Coinbase', 'USD', 'BTC', 'd')) == 15
+
+
+def test_close_bar_sizes_are_cached_apart(tmp_path, local):
+    cache = OHLCVCache(str(tmp_path / 'cache'))
+    cdd = CryptoDataDownload(url=local, cache=cache)
+
+    # the dollar value traded adds up to exactly 1030 on the fifth day
+    below = cdd.fetch_bars('Coinbase', 'USD', 'BTC', dollar=1029.9999, timeframe='d')
+    above = cdd.fetch_bars('Coinbase', 'USD', 'BTC', dollar=1030.0001, timeframe='d')
+    assert not below.equals(above)
+
+    assert bars_key(dollar=1029.9999) != bars_key(dollar=1030.0001)
+    assert bars_key(volume=0.1 + 0.2) != bars_key(volume=0.3)
+    for dollar, expected in [(1029.9999, below), (1030.0001, above)]:
+        key = cache.key('Coinbase', 'USD', 'BTC', 'd', bars_key(dollar=dollar))
+        pd.testing.assert_frame_equal(cache.load(key), expected)
+        pd.testing.assert_frame_equal(cdd.fetch_bars('Coinbase', 'USD', 'BTC', dollar=dollar, timeframe='d'), expected)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset.createfeatures import create_basic_features
+
+
+def legacy_basic_features(df: pd.DataFrame, drop_zero_wicks: bool = True) -> pd.DataFrame:
+    # the row by row implementation create_basic_features replaced, with zero
+    # wicks dropped or set to 0.01 instead of overwriting their whole row
+    df = df.copy()
+    df['change'] = df['open'] - df['close']
+    df['body'] = abs(df['change'])
+    df['abs'] = df['change'].apply(lambda x: 1 if x > 0 else -1)
+
+    df['agreewick'] = [row.high - row.close if row.abs == 1 else row.close - row.low for row in df.itertuples()]
+    df['diswick'] = [row.open - row.low if row.abs == 1 else row.high - row.open for row in df.itertuples()]
+
+    zero_wick = (df['agreewick'] == 0) | (df['diswick'] == 0)
+    if drop_zero_wicks:
+        df = df[~zero_wick]
+    else:
+        df.loc[df['agreewick'] == 0, 'agreewick'] = 0.01
+        df.loc[df['diswick'] == 0, 'diswick'] = 0.01
+
+    df['agreebodywick'] = [row.body / row.agreewick for row in df.itertuples()]
+    df['disbodywick'] = [row.body / row.diswick for row in df.itertuples()]
+
+    return df.drop(['agreewick', 'diswick'], axis=1)
+
+
+@pytest.fixture
+def history(make_history):
+    df = make_history(5000, crash=False, features=False)
+    # flat candles, whose change is 0 and which count as down candles, and
+    # candles without an upper or a lower shadow
+    df.loc[::5, 'open'] = df.loc[::5, 'close']
+    df.loc[::7, 'high'] = df.loc[::7, ['open', 'close']].max(axis=1)
+    df.loc[3::11, 'low'] = df.loc[3::11, ['open', 'close']].min(axis=1)
+    return df
+
+
+@pytest.mark.parametrize("drop_zero_wicks", [True, False])
+def test_matches_legacy(history, drop_zero_wicks):
+    expected = legacy_basic_features(history, drop_zero_wicks)
+    result = create_basic_features(history, drop_zero_wicks=drop_zero_wicks)
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_history_has_zero_wicks(history):
+    # both paths are only told apart by candles with a zero wick
+    result = create_basic_features(history, drop_zero_wicks=True)
+    assert 0 < len(result) < len(history)
+
+
+def test_legacy_rows_without_zero_wicks_unchanged(history):
+    # the original implementation, which overwrote the rows of zero wicks
+    df = history[['open', 'high', 'low', 'close', 'volume']].copy()
+    df['change'] = df['open'] - df['close']
+    df['body'] = abs(df['change'])
+    df['abs'] = df['change'].apply(lambda x: 1 if x > 0 else -1)
+    df['agreewick'] = [row.high - row.close if row.abs == 1 else row.close - row.low for row in df.itertuples()]
+    df['diswick'] = [row.open - row.low if row.abs == 1 else row.high - row.open for row in df.itertuples()]
+    overwritten = (df['agreewick'] == 0) | (df['diswick'] == 0)
+    df[df['agreewick'] == 0] = 0.01
+    df[df['diswick'] == 0] = 0.01
+    df['agreebodywick'] = [row.body / row.agreewick for row in df.itertuples()]
+    df['disbodywick'] = [row.body / row.diswick for row in df.itertuples()]
+    legacy = df.drop(['agreewick', 'diswick'], axis=1)[~overwritten]
+
+    result = create_basic_features(history)[legacy.columns]
+    np.testing.assert_array_equal(result.index, legacy.index)
+    np.testing.assert_array_equal(result.to_numpy(dtype=float), legacy.to_numpy(dtype=float))
+
+
+def test_input_not_modified(history):
+    before = history.copy()
+    create_basic_features(history, drop_zero_wicks=False)
+    pd.testing.assert_frame_equal(history, before)
@@ -0,0 +1,93 @@
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from coain.dataset.cryptodownload import CryptoDataDownload
+
+
+CSV = ("https://www.cryptodatadownload.com\n"
+       "Date,symbol,open,high,low,close,Volume USD,Volume BTC\n"
+       "2021-01-02,BTC/USD,2,3,1,2.5,20,8\n"
+       "2021-01-01,BTC/USD,1,2,0.5,1.5,10,4\n")
+
+
+@pytest.fixture
+def server():
+    # the responses each file gets in turn, the last one repeating
+    responses = {}
+    requests = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.lstrip("/")
+            requests[name] = requests.get(name, 0) + 1
+            plan = responses.get(name, [404])
+            response = plan[min(requests[name], len(plan)) - 1]
+
+            if response == "stall":
+                time.sleep(1)
+                response = 200
+            try:
+                self.send_response(response)
+                self.end_headers()
+                if response == 200:
+                    self.wfile.write(CSV.encode())
+            except ConnectionError:
+                # the client timed out
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_port), responses, requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch_many(url, pairs, **kwargs):
+    cdd = CryptoDataDownload(url=url, timeout=0.3)
+    return cdd, cdd.fetch_many(pairs, retries=2, backoff=0, **kwargs)
+
+
+def test_transient_errors_are_retried(server):
+    url, responses, requests = server
+    responses["Coinbase_BTCUSD_d.csv"] = [500, 429, 200]
+    responses["Kraken_BTCUSD_d.csv"] = ["stall", 200]
+
+    pairs = [("Coinbase", "USD", "BTC", "d"), ("Kraken", "USD", "BTC", "d")]
+    cdd, data = fetch_many(url, pairs)
+
+    assert list(data) == pairs and cdd.errors == {}
+    assert list(data[pairs[0]]["close"]) == [1.5, 2.5]
+    assert requests == {"Coinbase_BTCUSD_d.csv": 3, "Kraken_BTCUSD_d.csv": 2}
+
+
+def test_other_errors_are_not_retried(server):
+    url, responses, requests = server
+    responses["Coinbase_BTCUSD_d.csv"] = [200]
+    responses["gemini_BTCUSD_d.csv"] = [500]
+
+    pairs = [("Coinbase", "USD", "BTC", "d"), ("Missing", "USD", "BTC", "d"), ("Gemini", "USD", "BTC", "d")]
+    cdd, data = fetch_many(url, pairs)
+
+    assert list(data) == pairs[:1]
+    assert set(cdd.errors) == set(pairs[1:])
+    # a missing file fails at once, a server error after every retry
+    assert requests == {"Coinbase_BTCUSD_d.csv": 1, "Missing_BTCUSD_d.csv": 1, "gemini_BTCUSD_d.csv": 3}
+
+
+def test_stalled_requests_time_out(server):
+    url, responses, requests = server
+    responses["Coinbase_BTCUSD_d.csv"] = ["stall"]
+
+    start = time.perf_counter()
+    cdd, data = fetch_many(url, [("Coinbase", "USD", "BTC", "d")])
+
+    assert data == {} and requests == {"Coinbase_BTCUSD_d.csv": 3}
+    assert time.perf_counter() - start < 3
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from tensortrade.feed.core import Stream
+from tensortrade.oms.exchanges import Exchange, ExchangeOptions
+from tensortrade.oms.instruments import ETH, Instrument
+from tensortrade.oms.orders import TradeType
+from tensortrade.oms.services.execution.simulated import execute_order
+from tensortrade.oms.wallets import Wallet, Portfolio
+
+from coain.TheScheme import buysellhold
+from coain.TheScheme.execution import Fill, is_simple_market_order
+from coain.env.create import create, create_schemes
+from coain.env.feed import CompiledFeed
+from coain.env.profiler import StepProfiler
+
+
+USDT = Instrument("USDT", 3, "U.S. Dollar Tender")
+
+
+def build_env(prices, action, commission, service=execute_order):
+    close = Stream.source(prices, dtype="float").rename("USDT-ETH")
+    exchange = Exchange("binance", service=service, options=ExchangeOptions(commission=commission))(close)
+    cash = Wallet(exchange, 1000 * USDT)
+    asset = Wallet(exchange, 0 * ETH)
+    action_scheme, reward_scheme = create_schemes(action, "pbr", cash, asset, prices=prices)
+
+    return create(
+        portfolio=Portfolio(USDT, [cash, asset]),
+        action_scheme=action_scheme,
+        reward_scheme=reward_scheme,
+        feed=CompiledFeed({"close": prices}),
+        window_size=1
+    )
+
+
+def rollout(env, actions):
+    env.reset()
+    for action in actions:
+        _, _, done, _ = env.step(int(action))
+        if done:
+            break
+
+    portfolio = env.action_scheme.portfolio
+    net_worth = [p["net_worth"] for p in portfolio.performance.values()]
+    trades = [
+        (t.step, t.side, t.price, t.quantity, t.commission)
+        for trades in env.action_scheme.broker.trades.values() for t in trades
+    ]
+    balances = [w.balance for w in portfolio.wallets]
+    kinds = {type(t) for trades in env.action_scheme.broker.trades.values() for t in trades}
+    return net_worth, trades, balances, kinds
+
+
+@pytest.mark.parametrize("commission", [0.003, 0.0, 0.1])
+@pytest.mark.parametrize("action", ["bsh", "simple4"])
+def test_fast_path_matches_broker(make_history, monkeypatch, action, commission):
+    prices = make_history(rows=800, features=False)["close"].to_numpy()
+    env = build_env(prices, action, commission)
+    rng = np.random.default_rng(0)
+
+    if action == "bsh":
+        actions = (rng.random(len(prices) - 1) < 0.1).cumsum() % 2
+    else:
+        actions = rng.integers(0, env.action_space.n, size=len(prices) - 1)
+        actions[rng.random(len(actions)) < 0.7] = 0
+
+    net_worth, trades, balances, kinds = rollout(env, actions)
+
+    with monkeypatch.context() as m:
+        m.setattr(buysellhold, "is_simple_market_order", lambda *args, **kwargs: False)
+        broker_net_worth, broker_trades, broker_balances, broker_kinds = rollout(env, actions)
+
+    # the same quantities, to the last unit of their precision
+    assert net_worth == broker_net_worth
+    assert trades == broker_trades
+    assert balances == broker_balances
+    if commission == 0.0:
+        # orders too small to pay a commission are cancelled on both paths
+        assert trades == []
+    else:
+        assert len(trades) > 0
+        assert kinds == {Fill} and Fill not in broker_kinds
+
+
+def test_is_simple_market_order():
+    # the fast path recognizes the simulated service by the private `_service`
+    # of the exchange, which it relies on not being renamed
+    env = build_env(np.linspace(100, 110, 20), "bsh", 0.003)
+    ep = env.action_scheme.portfolio.exchange_pairs[0]
+    assert ep.exchange._service is execute_order
+    assert is_simple_market_order(ep, env.action_scheme.portfolio)
+    assert not is_simple_market_order(ep, env.action_scheme.portfolio, trade_type=TradeType.LIMIT)
+
+    env = build_env(np.linspace(100, 110, 20), "bsh", 0.003, service=lambda *args: None)
+    ep = env.action_scheme.portfolio.exchange_pairs[0]
+    assert not is_simple_market_order(ep, env.action_scheme.portfolio)
+
+
+def test_profiler_times_fast_path():
+    prices = np.linspace(100, 130, 300)
+    env = build_env(prices, "bsh", 0.003)
+    profiler = StepProfiler().attach(env)
+
+    net_worth = rollout(env, np.arange(len(prices) - 1) // 10 % 2)[0]
+    profiler.detach()
+
+    # the broker is updated every step, and every switch trades on the fast path
+    trades = len(env.action_scheme.broker.trades)
+    assert trades > 0
+    assert profiler.episodes[-1].loc["execution", "calls"] == len(net_worth) - 1 + trades
+    assert "execute_market_order" not in vars(env.action_scheme)
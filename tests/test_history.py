@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tensortrade.feed.core import Stream
+from tensortrade.oms.exchanges import Exchange
+from tensortrade.oms.instruments import ETH, Instrument
+from tensortrade.oms.services.execution.simulated import execute_order
+from tensortrade.oms.wallets import Wallet, Portfolio
+
+from coain.TheScheme.buysellhold import BuySellHold, PBR
+from coain.env.create import create
+from coain.env.feed import CompiledFeed
+from coain.env.history import ColumnHistory, ColumnarPortfolio
+
+
+def rows(n):
+    return [
+        {"step": i, "net_worth": 1000. + i, "time": np.datetime64("2018-01-01") + np.timedelta64(i, "m")}
+        for i in range(n)
+    ]
+
+
+def check_rows(history, expected):
+    assert len(history) == len(expected)
+    assert list(history) == expected
+    assert history[:] == expected
+    assert history[1:7:2] == expected[1:7:2]
+    assert history[0] == expected[0]
+    assert history[-1] == expected[-1]
+    for name in expected[0]:
+        np.testing.assert_array_equal(history[name], [row[name] for row in expected])
+
+
+def test_matches_list():
+    history = ColumnHistory(capacity=4)
+    recorded = rows(37)
+    for row in recorded:
+        history.append(row)
+
+    check_rows(history, recorded)
+    assert history["net_worth"].dtype == np.float64
+    assert history["time"].dtype == "datetime64[ns]"
+    # numbers are stored as floats
+    pd.testing.assert_frame_equal(history.to_frame(), pd.DataFrame(recorded).astype({"step": float}))
+
+    with pytest.raises(IndexError):
+        history[37]
+    with pytest.raises(ValueError):
+        history["net_worth"][0] = 0.
+
+
+@pytest.mark.parametrize("n", [3, 8, 9, 21])
+def test_ring_wraps_around(n):
+    history = ColumnHistory(capacity=8, ring=True)
+    recorded = rows(n)
+    snapshots = []
+    for row in recorded:
+        history.append(row)
+        snapshots += [(history.snapshot(), list(recorded[:row["step"] + 1][-8:]))]
+
+    check_rows(history, recorded[-8:])
+    assert history.offset == max(n - 8, 0)
+    assert list(history.to_frame().index) == list(range(max(n - 8, 0), n))
+
+    # snapshots keep their rows while the ring is overwritten
+    for snapshot, expected in snapshots:
+        check_rows(snapshot, expected)
+
+
+def test_object_fallback():
+    history = ColumnHistory(capacity=2, ring=True)
+    history.append({"value": 1., "label": "a"})
+    history.append({"value": "n/a"})
+    history.append({"value": 3., "label": "c"})
+
+    assert history["value"].dtype == object
+    assert list(history["value"]) == ["n/a", 3.]
+    assert list(history["label"]) == [None, "c"]
+
+    # columns added later are missing in the earlier rows
+    history = ColumnHistory(capacity=2)
+    history.append({"value": 1.})
+    history.append({"value": 2., "extra": 5.})
+    assert np.isnan(history["extra"][0]) and history["extra"][1] == 5.
+
+
+def build_env(portfolio_class, prices, **kwargs):
+    USDT = Instrument("USDT", 3, "U.S. Dollar Tender")
+    exchange = Exchange("binance", service=execute_order)(
+        Stream.source(prices, dtype="float").rename("USDT-ETH")
+    )
+    cash = Wallet(exchange, 1000 * USDT)
+    asset = Wallet(exchange, 0 * ETH)
+    action_scheme = BuySellHold(cash=cash, asset=asset)
+    reward_scheme = PBR(prices=prices)
+    action_scheme.attach(reward_scheme)
+
+    return create(
+        portfolio=portfolio_class(USDT, [cash, asset], **kwargs),
+        action_scheme=action_scheme,
+        reward_scheme=reward_scheme,
+        feed=CompiledFeed({"close": prices}),
+        window_size=1
+    )
+
+
+@pytest.mark.parametrize("kwargs", [dict(capacity=16), dict(capacity=16, ring=True)])
+def test_portfolio_performance(kwargs):
+    prices = np.linspace(100, 130, 60)
+    actions = np.arange(len(prices) - 1) // 5 % 2
+    env = build_env(Portfolio, prices)
+    columnar_env = build_env(ColumnarPortfolio, prices, **kwargs)
+
+    for episode in range(2):
+        env.reset()
+        columnar_env.reset()
+        for i, action in enumerate(actions):
+            env.step(int(action))
+            columnar_env.step(int(action))
+
+            # read every step, or now and then
+            if i % (1 + episode * 7) == 0:
+                performance = env.action_scheme.portfolio.performance
+                columnar = columnar_env.action_scheme.portfolio.performance
+                expected = list(performance.items())[-16 if kwargs.get("ring") else 0:]
+                assert list(columnar.items()) == expected
+
+    performance = columnar_env.action_scheme.portfolio.performance
+    assert columnar_env.action_scheme.portfolio.performance is performance
+
+    # the reset of the env records the first step of the next episode
+    columnar_env.reset()
+    assert list(columnar_env.action_scheme.portfolio.performance) == [0]
+    assert len(performance) == (16 if kwargs.get("ring") else len(prices))
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset.createfeatures import create_basic_features, macd_series, rsi_series, sma_series
+from coain.dataset.incremental import FeatureEngine
+
+
+@pytest.fixture
+def history(make_history):
+    df = make_history(3000, crash=False, features=False)
+    # flat candles and candles without an upper or a lower shadow
+    df.loc[::5, 'open'] = df.loc[::5, 'close']
+    df.loc[::7, 'high'] = df.loc[::7, ['open', 'close']].max(axis=1)
+    df.loc[3::11, 'low'] = df.loc[3::11, ['open', 'close']].min(axis=1)
+    return df
+
+
+def batch_features(df, drop_zero_wicks):
+    # the features of trade_ai.create_env, computed over the whole history
+    df = create_basic_features(df, drop_zero_wicks=drop_zero_wicks)
+    close = df['close']
+    return df.assign(
+        fast=sma_series(close, window=10),
+        medium=sma_series(close, window=50),
+        slow=sma_series(close, window=100),
+        rsi=rsi_series(close, period=20),
+        macd=macd_series(close, fast=10, slow=50, signal=5)
+    )
+
+
+def check(result, expected):
+    np.testing.assert_array_equal(result.index, expected.index)
+    for c in result.columns:
+        values, expected_values = result[c].to_numpy(dtype=float), expected[c].to_numpy(dtype=float)
+        np.testing.assert_array_equal(np.isnan(values), np.isnan(expected_values), err_msg=c)
+        np.testing.assert_allclose(values, expected_values, rtol=1e-12, atol=1e-12, err_msg=c)
+
+
+@pytest.mark.parametrize("drop_zero_wicks", [True, False])
+def test_matches_batch_features(history, drop_zero_wicks):
+    engine = FeatureEngine(drop_zero_wicks=drop_zero_wicks)
+    result = engine.update_many(history)
+
+    expected = batch_features(history, drop_zero_wicks)
+    assert len(result) == len(expected) and list(result.columns) == engine.columns
+    check(result, expected)
+
+
+@pytest.mark.parametrize("drop_zero_wicks", [True, False])
+def test_restored_engine_continues(tmp_path, history, drop_zero_wicks):
+    engine = FeatureEngine(drop_zero_wicks=drop_zero_wicks)
+    first = engine.update_many(history[:1234])
+    engine.save(str(tmp_path / "engine.json"))
+
+    restored = FeatureEngine(drop_zero_wicks=drop_zero_wicks)
+    restored.restore(str(tmp_path / "engine.json"))
+    result = pd.concat([first, restored.update_many(history[1234:])])
+
+    check(result, batch_features(history, drop_zero_wicks))
+
+
+def test_update_skips_zero_wicks():
+    # a flat candle without an upper shadow
+    candle = {"open": 1., "high": 1., "low": 0.5, "close": 1.}
+    assert FeatureEngine().update(candle) is None
+
+    features = FeatureEngine(drop_zero_wicks=False).update(candle)
+    assert features["abs"] == -1 and features["disbodywick"] == 0
+
+
+def test_reset(history):
+    engine = FeatureEngine()
+    expected = engine.update_many(history[:500])
+    engine.update_many(history[500:])
+
+    engine.reset()
+    check(engine.update_many(history[:500]), expected)
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from tensortrade.oms.instruments import ExchangePair, Instrument, Quantity
+from tensortrade.oms.orders import TradeSide
+
+import trade_ai
+
+from coain.env.recorder import EpisodeRecorder, load_recording
+from coain.TheScheme.execution import Fill
+
+
+pytestmark = pytest.mark.parametrize("history", [dict(rows=300, crash=False)], indirect=True)
+
+
+def play(env, n_steps=None):
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 2, len(env.observer.windows))
+    for i, action in enumerate(actions):
+        _, _, done, _ = env.step(int(action))
+        if done or i + 1 == n_steps:
+            return i + 1
+
+
+def test_flush_on_done(tmp_path, history):
+    recorder = EpisodeRecorder(str(tmp_path), flush_on_done=True)
+    env = trade_ai.create_env(history, recorder=recorder)
+
+    n_steps = play(env)
+    # the episode is on disk without closing the recorder
+    steps = load_recording(str(tmp_path)).steps
+    assert len(steps) == n_steps + 1
+    assert steps["done"].iloc[-1]
+
+    play(env, n_steps=10)
+    assert len(load_recording(str(tmp_path)).steps) == n_steps + 1
+
+
+def test_close_env_flushes(tmp_path, history):
+    recorder = EpisodeRecorder(str(tmp_path))
+    env = trade_ai.create_env(history, recorder=recorder)
+
+    n_steps = play(env)
+    assert len(load_recording(str(tmp_path)).steps) == 0
+
+    env.close()
+    recording = load_recording(str(tmp_path))
+    assert len(recording.steps) == n_steps + 1
+    assert recording.episodes == [0]
+
+    # detaching restores the methods of the env
+    recorder.detach()
+    assert "close" not in vars(env) and "step" not in vars(env)
+
+
+def trade_tuples(trades):
+    # recorded instruments only keep their symbol and precision
+    return [
+        (t.step, t.side, t.type, str(t.exchange_pair.pair), str(t.quantity), t.quantity.size, t.price,
+         str(t.commission), t.commission.size)
+        for trades in trades.values() for t in trades
+    ]
+
+
+def test_trades_are_exact(tmp_path, history):
+    recorder = EpisodeRecorder(str(tmp_path))
+    env = trade_ai.create_env(history, recorder=recorder)
+    play(env)
+    env.close()
+
+    trades = load_recording(str(tmp_path)).env_view(0).action_scheme.broker.trades
+    assert len(trades) > 0
+    assert trade_tuples(trades) == trade_tuples(env.action_scheme.broker.trades)
+
+    # quantities with more digits than a float holds
+    WEI = Instrument("WEI", 18, "Wei")
+    USD = Instrument("USD", 2, "U.S. Dollar")
+    broker = SimpleNamespace(trades=OrderedDict([(0, [Fill(
+        step=3,
+        exchange_pair=ExchangePair(None, USD / WEI),
+        side=TradeSide.SELL,
+        quantity=Quantity(WEI, Decimal("1234567.123456789012345678")),
+        price=Decimal("0.000000000000000001"),
+        commission=Quantity(WEI, Decimal("3703.701370370367037037"))
+    )])]))
+    env = SimpleNamespace(
+        clock=SimpleNamespace(step=4),
+        observer=SimpleNamespace(renderer_history=[]),
+        action_scheme=SimpleNamespace(portfolio=SimpleNamespace(base_instrument=USD, net_worth=1.), broker=broker)
+    )
+    path = str(tmp_path / "wei")
+    recorder = EpisodeRecorder(path)
+    recorder.record(env, np.zeros(1))
+    recorder.flush()
+
+    trades = load_recording(path).env_view(-1).action_scheme.broker.trades
+    assert trade_tuples(trades) == trade_tuples(broker.trades)
@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tensortrade.feed.core import Stream
+from tensortrade.oms.exchanges import Exchange
+from tensortrade.oms.services.execution.simulated import execute_order
+from tensortrade.oms.instruments import ETH, Instrument
+from tensortrade.oms.wallets import Wallet, Portfolio
+
+import trade_ai
+
+from coain.TheScheme.buysellhold import BuySellHold, SharpeRatio
+from coain.env.create import create
+from coain.env.feed import CompiledFeed
+from coain.env.history import ColumnarPortfolio
+
+
+USDT = Instrument("USDT", 3, "U.S. Dollar Tender")
+
+
+def legacy_reward(portfolio, window_size, return_algorithm, target_returns=0.):
+    # the reward computed from the whole performance of the portfolio, as
+    # SharpeRatio did before keeping running moments
+    net_worths = [nw['net_worth'] for nw in portfolio.performance.values()][-(window_size + 1):]
+    returns = pd.Series(net_worths).pct_change().dropna()
+    if return_algorithm == 'sortino':
+        downside = np.minimum(returns.to_numpy() - target_returns, 0)
+        return (np.mean(returns) + 1e-9) / (np.sqrt(np.mean(downside ** 2)) + 1e-9)
+    return (np.mean(returns) + 1e-9) / (np.std(returns) + 1e-9)
+
+
+def prices_of(kind, rows=600):
+    if kind == "walk":
+        rng = np.random.default_rng(0)
+        return 100 + np.cumsum(rng.normal(0, 0.5, rows)).round(2)
+    # a steady trend, whose returns are constant up to rounding
+    return 100 * 1.001 ** np.arange(rows)
+
+
+def rollout(portfolio_class, prices, reward_scheme, actions):
+    close = Stream.source(prices, dtype="float").rename("USDT-ETH")
+    exchange = Exchange("binance", service=execute_order)(close)
+    cash = Wallet(exchange, 1000 * USDT)
+    asset = Wallet(exchange, 0 * ETH)
+    portfolio = portfolio_class(USDT, [cash, asset])
+
+    env = create(
+        portfolio=portfolio,
+        action_scheme=BuySellHold(cash=cash, asset=asset),
+        reward_scheme=reward_scheme,
+        feed=CompiledFeed({"close": prices}),
+        window_size=1,
+        max_allowed_loss=0.9
+    )
+
+    env.reset()
+    for action in actions:
+        _, reward, done, _ = env.step(int(action))
+        yield portfolio, reward
+        if done:
+            break
+
+
+@pytest.mark.parametrize("portfolio_class", [Portfolio, ColumnarPortfolio])
+@pytest.mark.parametrize("return_algorithm", ["sharpe", "sortino"])
+@pytest.mark.parametrize("window_size", [1, 2, 7, 50])
+@pytest.mark.parametrize("kind", ["walk", "trend"])
+def test_matches_legacy(portfolio_class, return_algorithm, window_size, kind):
+    prices = prices_of(kind)
+    rng = np.random.default_rng(window_size)
+    # positions held for a while, so windows hold both flat and moving returns
+    actions = (rng.random(len(prices) - 1) < 0.05).cumsum() % 2
+    actions[:20] = 1
+
+    reward_scheme = SharpeRatio(window_size=window_size, return_algorithm=return_algorithm)
+    rewards, expected = [], []
+    for portfolio, reward in rollout(portfolio_class, prices, reward_scheme, actions):
+        rewards += [reward]
+        expected += [legacy_reward(portfolio, window_size, return_algorithm)]
+
+    assert len(rewards) == len(prices) - 1
+    np.testing.assert_allclose(rewards, expected, rtol=1e-6, atol=1e-9)
+
+
+def test_reset_clears_window():
+    prices = prices_of("walk", 100)
+    reward_scheme = SharpeRatio(window_size=10)
+    first = [r for _, r in rollout(ColumnarPortfolio, prices, reward_scheme, np.ones(50))]
+    second = [r for _, r in rollout(ColumnarPortfolio, prices, reward_scheme, np.ones(50))]
+    np.testing.assert_array_equal(first, second)
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        SharpeRatio(return_algorithm='calmar')
+
+
+@pytest.mark.parametrize("return_algorithm", ["sharpe", "sortino"])
+def test_zero_net_worth(return_algorithm):
+    net_worths = [1000., 0., 0., 10.]
+    rewards = {}
+    for path in ("performance", "history"):
+        reward_scheme = SharpeRatio(window_size=3, return_algorithm=return_algorithm)
+        rewards[path] = []
+        for i in range(1, len(net_worths) + 1):
+            if path == "performance":
+                portfolio = SimpleNamespace(performance={j: {"net_worth": nw} for j, nw in enumerate(net_worths[:i])})
+            else:
+                portfolio = SimpleNamespace(history={"net_worth": np.array(net_worths[:i])})
+            rewards[path] += [reward_scheme.get_reward(portfolio)]
+
+    np.testing.assert_array_equal(rewards["performance"], rewards["history"])
+    # the returns after the wipe out are taken as flat
+    ratio = getattr(SharpeRatio(target_returns=0.), "_{}_ratio".format(return_algorithm))
+    np.testing.assert_allclose(rewards["history"][1:], [ratio(pd.Series(r)) for r in ([-1.], [-1., 0.], [-1., 0., 0.])])
+
+
+def test_pbr_modes_match(history):
+    stream_env = trade_ai.create_env(history, compiled=False)
+    array_env = trade_ai.create_env(history)
+    rng = np.random.default_rng(0)
+
+    # several episodes on each env, so resets are covered
+    for p in (0.02, 0.2, 0.5):
+        actions = (rng.random(len(history)) < p).cumsum() % 2
+        rewards = {}
+        for name, env in (("stream", stream_env), ("array", array_env)):
+            env.reset()
+            rewards[name] = []
+            for action in actions:
+                _, reward, done, _ = env.step(int(action))
+                rewards[name] += [reward]
+                if done:
+                    break
+
+        n_steps = len(rewards["stream"])
+        assert n_steps > 100
+        np.testing.assert_allclose(rewards["array"], rewards["stream"], rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(array_env.reward_scheme.rewards_for(actions[:n_steps]), rewards["stream"],
+                                   rtol=1e-12, atol=1e-12)
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from tensortrade.feed.core import Stream
+from tensortrade.oms.exchanges import Exchange
+from tensortrade.oms.services.execution.simulated import execute_order
+from tensortrade.oms.instruments import ETH, Instrument
+from tensortrade.oms.wallets import Wallet
+
+from coain.TheScheme.buysellhold import BuySellHold, PBR
+from coain.env.create import create
+from coain.env.feed import CompiledFeed
+from coain.env.history import ColumnarPortfolio
+from coain.env.observer import pad
+from coain.env.sampler import (
+    RandomEpisodeSampler,
+    ScheduledEpisodeSampler,
+    StratifiedEpisodeSampler
+)
+
+
+WINDOW_SIZE = 5
+
+
+def build_env(prices, features, sampler=None):
+    # features are padded with the window_size - 1 rows before the first one
+    close = Stream.source(prices, dtype="float").rename("USDT-ETH")
+    exchange = Exchange("binance", service=execute_order)(close)
+    USDT = Instrument("USDT", 3, "U.S. Dollar Tender")
+    cash = Wallet(exchange, 1000 * USDT)
+    asset = Wallet(exchange, 0 * ETH)
+    reward_scheme = PBR(prices=prices)
+
+    return create(
+        portfolio=ColumnarPortfolio(USDT, [cash, asset]),
+        action_scheme=BuySellHold(cash=cash, asset=asset).attach(reward_scheme),
+        reward_scheme=reward_scheme,
+        feed=CompiledFeed(features, dtype="float32", padding=WINDOW_SIZE - 1),
+        window_size=WINDOW_SIZE,
+        max_allowed_loss=0.5,
+        sampler=sampler
+    )
+
+
+def play(env, actions):
+    observations, rewards, dones, net_worths = [env.reset()], [], [], []
+    for action in actions:
+        obs, reward, done, _ = env.step(int(action))
+        observations += [obs]
+        rewards += [reward]
+        dones += [done]
+        net_worths += [env.action_scheme.portfolio.net_worth]
+        if done:
+            break
+    return np.array(observations), np.array(rewards), np.array(dones), np.array(net_worths, dtype=float)
+
+
+@pytest.fixture
+def data(history):
+    prices = history["close"].to_numpy()
+    features = pad(history[["close", "body", "agreebodywick", "volume eth"]].to_numpy(), WINDOW_SIZE)
+    return prices, features
+
+
+def test_sampled_episodes_match_sliced_envs(data):
+    prices, features = data
+    # the last episode is cut short by the end of the history
+    episodes = [(0, 300), (731, 250), (400, 600), (1200, 1000)]
+    env = build_env(prices, features, sampler=ScheduledEpisodeSampler([s for s, _ in episodes], 0))
+    rng = np.random.default_rng(0)
+
+    for start, length in episodes:
+        env.sampler.length = length
+        actions = (rng.random(length) < 0.1).cumsum() % 2
+
+        sliced = build_env(prices[start:start + length], features[start:start + WINDOW_SIZE - 1 + length])
+        expected = play(sliced, actions)
+        result = play(env, actions)
+
+        assert env.observer.start == start
+        assert len(result[1]) == min(length, len(prices) - start) - 1
+        for values, expected_values in zip(result, expected):
+            np.testing.assert_array_equal(values, expected_values)
+        # the last observation holds the last row of the window
+        np.testing.assert_array_equal(result[0][-1], env.observer.windows[start + len(result[1])])
+
+
+def test_episodes_stop_on_losses(data):
+    prices, features = data
+    # the crash of the history stops an episode held in the market
+    start = int(np.argmax(prices[:len(prices) // 2]))
+    env = build_env(prices, features, sampler=ScheduledEpisodeSampler([start], len(prices)))
+    observations, rewards, dones, net_worths = play(env, np.ones(len(prices), dtype=int))
+
+    assert dones[-1] and len(rewards) < len(prices) - 1 - start
+    assert net_worths[-1] < 0.5 * 1000
+
+
+def draws(sampler, n_steps, n=50):
+    return [sampler.sample(n_steps) for _ in range(n)]
+
+
+@pytest.mark.parametrize("make", [
+    lambda seed: RandomEpisodeSampler((100, 300), min_start=4, seed=seed),
+    lambda seed: StratifiedEpisodeSampler(np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, 2000))),
+                                          (100, 300), n_strata=4, min_start=4, seed=seed),
+    lambda seed: ScheduledEpisodeSampler([10, 500, 1500], (100, 300), seed=seed)
+])
+def test_seeded_samplers_are_reproducible(make):
+    first = draws(make(0), 2000)
+    assert draws(make(0), 2000) == first
+    assert draws(make(1), 2000) != first
+
+    sampler = make(0)
+    draws(sampler, 2000, 7)
+    sampler.reset()
+    assert draws(sampler, 2000) == first
+
+    for start, length in first:
+        assert 100 <= length <= 300 and 0 <= start and start + length <= 2000
+
+
+def test_scheduled_sampler_cycles():
+    sampler = ScheduledEpisodeSampler([10, 500, 1900], 200)
+    assert draws(sampler, 2000, 4) == [(10, 200), (500, 200), (1900, 100), (10, 200)]
+
+
+def test_stratified_sampler_visits_every_regime():
+    rng = np.random.default_rng(0)
+    # a calm first half and a turbulent second half
+    returns = np.concatenate([rng.normal(0, 0.001, 1000), rng.normal(0, 0.02, 1000)])
+    sampler = StratifiedEpisodeSampler(np.exp(np.cumsum(returns)), 100, n_strata=2, seed=0)
+
+    starts = np.array([start for start, _ in draws(sampler, 2000, 100)])
+    for stratum in sampler.strata:
+        assert np.isin(starts, stratum).sum() == 50
+    assert sampler.volatility[sampler.strata[0]].max() <= sampler.volatility[sampler.strata[1]].min()
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset.store import PriceStore, PriceStoreWriter
+
+
+def history(rows, columns=('open', 'close', 'volume')):
+    rng = np.random.default_rng(rows)
+    # the store keeps nanoseconds, newer pandas may default to microseconds
+    data = {'date': pd.date_range('2020-01-01', periods=rows, freq='min').astype('datetime64[ns]')}
+    data.update({c: rng.random(rows) for c in columns})
+    return pd.DataFrame(data)
+
+
+def test_round_trip(tmp_path):
+    df = history(1000)
+    store = PriceStore.write(str(tmp_path / "store"), df)
+
+    frame = store.frame(time_column='date')
+    pd.testing.assert_frame_equal(frame, df, check_freq=False)
+    assert len(store) == 1000
+    assert not store.column("close").flags.writeable
+
+
+def test_rewrite_keeps_open_stores_valid(tmp_path):
+    path = str(tmp_path / "store")
+    df = history(100000)
+    old = PriceStore.write(path, df)
+
+    # a smaller store with fewer columns replaces it
+    new = PriceStore.write(path, history(10, columns=('close',)))
+
+    # the open store still reads its own files, which were not truncated
+    np.testing.assert_array_equal(old.column("volume"), df["volume"].to_numpy())
+    np.testing.assert_array_equal(old.column("close")[-5:], df["close"].to_numpy()[-5:])
+
+    assert len(new) == 10 and new.columns == ["close"]
+    assert sorted(os.listdir(path)) == ["0.bin", "1.bin", PriceStore.meta_filename]
+    assert os.listdir(str(tmp_path)) == ["store"]
+
+
+def test_failed_write_keeps_store(tmp_path):
+    path = str(tmp_path / "store")
+    df = history(100)
+    PriceStore.write(path, df)
+
+    with pytest.raises(RuntimeError):
+        with PriceStoreWriter(path) as writer:
+            writer.append(np.arange(3), {"close": np.ones(3)})
+            raise RuntimeError()
+
+    np.testing.assert_array_equal(PriceStore(path).column("close"), df["close"].to_numpy())
+    assert os.listdir(str(tmp_path)) == ["store"]
+
+
+def test_descending_chunks_are_reversed(tmp_path):
+    df = history(1000)
+    reversed_df = df[::-1]
+
+    with PriceStoreWriter(str(tmp_path / "store"), block_size=64) as writer:
+        for start in range(0, 1000, 300):
+            chunk = reversed_df.iloc[start:start + 300]
+            writer.append(chunk['date'].to_numpy().view(np.int64), {"close": chunk['close'].to_numpy()})
+
+    np.testing.assert_array_equal(writer.store.column("close"), df['close'].to_numpy())
+    np.testing.assert_array_equal(writer.store.timestamp, df['date'].to_numpy().view(np.int64))
+
+
+def test_write_csv(tmp_path):
+    df = history(1000)
+    csv = tmp_path / "history.csv"
+    # unix times in descending order, in seconds then in milliseconds
+    unix = df['date'].to_numpy().view(np.int64) // 10 ** 9
+    unix[500:] *= 1000
+    df.assign(unix=unix).iloc[::-1].to_csv(csv, index=False)
+
+    store = PriceStore.write_csv(str(tmp_path / "store"), str(csv), columns={'close': 'price'}, chunksize=128)
+
+    assert store.columns == ['price']
+    np.testing.assert_allclose(store.column('price'), df['close'].to_numpy(), rtol=1e-12)
+    np.testing.assert_array_equal(store.timestamp, df['date'].to_numpy().view(np.int64))
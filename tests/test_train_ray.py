@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+ray = pytest.importorskip("ray")
+
+import train_ray
+
+
+@pytest.mark.parametrize("window_size", [10, 25, 40])
+def test_data_padded_for_another_window(window_size):
+    # the data put in the object store by the driver is padded for a window
+    # of 25, whatever the window of the envs
+    shared = {"window_size": window_size, "data": ray.put(train_ray.load_data(window_size=25))}
+    own = {"window_size": window_size}
+
+    for create in (train_ray.create_env, train_ray.create_vector_env):
+        env, expected = create(shared), create(own)
+        np.testing.assert_array_equal(env.reset(), expected.reset())
+
+    env, expected = train_ray.create_env(shared), train_ray.create_env(own)
+    np.testing.assert_array_equal(env.observer.windows, expected.observer.windows)
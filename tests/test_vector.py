@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+import trade_ai
+
+from coain.env.observer import pad
+from coain.env.vector import VectorBuySellHoldEnv
+
+
+@pytest.fixture
+def train_ray():
+    # the ray script needs ray to be imported, the env itself does not
+    pytest.importorskip("ray")
+    import train_ray
+    return train_ray
+
+
+def rollout(env, actions):
+    # the observations, rewards, dones and net worths of an episode of a
+    # scalar env, the observations starting with the one of the reset
+    observations = [env.reset()]
+    rewards, dones, net_worths = [], [], []
+    for action in actions:
+        obs, reward, done, _ = env.step(int(action))
+        observations += [obs]
+        rewards += [reward]
+        dones += [done]
+        net_worths += [env.action_scheme.portfolio.net_worth]
+        if done:
+            break
+    return np.array(observations), np.array(rewards), np.array(dones), np.array(net_worths, dtype=float)
+
+
+def check_parity(env, venv, actions):
+    expected = [rollout(env, a) for a in actions]
+
+    obs = venv.reset()
+    for i, (observations, _, _, _) in enumerate(expected):
+        np.testing.assert_array_equal(obs[i], observations[0])
+
+    finished = np.zeros(venv.num_envs, dtype=bool)
+    t = 0
+    while not finished.all():
+        obs, rewards, dones, infos = venv.step(actions[:, t])
+        for i in np.flatnonzero(~finished):
+            observations, expected_rewards, expected_dones, net_worths = expected[i]
+            assert rewards[i] == pytest.approx(expected_rewards[t], rel=1e-12, abs=1e-12)
+            assert dones[i] == expected_dones[t]
+            assert infos[i]["net_worth"] == pytest.approx(net_worths[t], rel=1e-12)
+            if dones[i]:
+                # the episode is reset and its last observation is in the info
+                np.testing.assert_array_equal(infos[i]["terminal_observation"], observations[t + 1])
+                np.testing.assert_array_equal(obs[i], observations[0])
+                finished[i] = True
+            else:
+                np.testing.assert_array_equal(obs[i], observations[t + 1])
+        t += 1
+
+    return expected
+
+
+def policies(prices, rng):
+    n_steps = len(prices) - 1
+    flips = (rng.random((2, n_steps)) < [[0.02], [0.2]]).cumsum(axis=1) % 2
+    # in the market from the top of the first half, until the episode stops
+    top = (np.arange(n_steps) >= np.argmax(prices[:n_steps // 2]))[None].astype(int)
+    return np.concatenate([flips, top, np.zeros((1, n_steps), dtype=int)])
+
+
+@pytest.mark.parametrize("history", [dict(rows=2000)], indirect=True)
+def test_trade_ai_parity(history):
+    env = trade_ai.create_env(history)
+    prices = history["close"].to_numpy()
+    actions = policies(prices, np.random.default_rng(0))
+
+    venv = VectorBuySellHoldEnv(
+        num_envs=len(actions),
+        prices=prices,
+        features=env.observer.windows[:, -1],
+        window_size=20,
+        cash=1000,
+        cash_precision=3,
+        asset_precision=8
+    )
+    expected = check_parity(env, venv, actions)
+
+    lengths = [len(rewards) for _, rewards, _, _ in expected]
+    assert min(lengths) < len(prices) - 1 == max(lengths)
+
+
+def test_train_ray_parity(train_ray):
+    config = {"window_size": 25, "compiled_feed": True}
+    env = train_ray.create_env(config)
+    venv = train_ray.create_vector_env(dict(config, num_envs=4))
+    prices = venv.prices
+    actions = policies(prices, np.random.default_rng(1))
+
+    expected = check_parity(env, venv, actions)
+
+    lengths = [len(rewards) for _, rewards, _, _ in expected]
+    assert min(lengths) < len(prices) - 1 == max(lengths)
+
+
+def test_padded_features_are_viewed(history):
+    prices = history["close"].to_numpy()
+    features = history[["close", "body", "volume eth"]].to_numpy()
+    padded_features = pad(features, 25)
+    padded = VectorBuySellHoldEnv(2, prices, padded_features, window_size=25, padding=24)
+    unpadded = VectorBuySellHoldEnv(2, prices, features, window_size=25)
+
+    np.testing.assert_array_equal(padded.windows, unpadded.windows)
+    assert np.shares_memory(padded.windows, padded_features)
+    assert not np.shares_memory(unpadded.windows, features)
+
+
+def test_spaces(history):
+    venv = VectorBuySellHoldEnv(3, history["close"].to_numpy(), history[["close", "body"]].to_numpy(), window_size=5)
+
+    assert venv.num_envs == 3
+    assert venv.observation_space.shape == (5, 2) and venv.action_space.n == 2
+    assert venv.single_observation_space is venv.observation_space
+    assert venv.reset()[0] in venv.observation_space
+
+
+def test_rllib_vector_env(train_ray):
+    from ray.rllib.env import VectorEnv
+
+    data = train_ray.load_data(window_size=25)
+    venv = train_ray.create_vector_env({"window_size": 25, "num_envs": 3})
+
+    assert isinstance(venv, VectorEnv)
+    assert venv.num_envs == 3
+    assert venv.observation_space.shape == (25, len(data["columns"]))
+    assert venv.action_space.n == 2
+
+    obs = venv.vector_reset()
+    assert len(obs) == 3 and obs[0] in venv.observation_space
+
+    # vector_step leaves episodes that are done for rllib to reset
+    n_steps = len(data["prices"]) - 1
+    for t in range(n_steps):
+        obs, rewards, dones, infos = venv.vector_step([1, 0, t % 2])
+    assert dones == [True] * 3
+    assert (venv.row == n_steps).all()
+    np.testing.assert_array_equal(obs[1], venv.windows[-1])
+
+    first = venv.reset_at(1)
+    np.testing.assert_array_equal(first, venv.windows[0])
+    assert list(venv.row) == [n_steps, 0, n_steps]
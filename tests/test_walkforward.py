@@ -0,0 +1,90 @@
+import os
+import warnings
+
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coain.dataset.store import PriceStore
+from coain.env.backtest import Backtest
+from coain.env.walkforward import THREAD_VARIABLES, WalkForward, backtest_metrics, walk_forward_folds
+
+
+@pytest.mark.parametrize("n_rows,start,step", [(10000, 0, None), (10350, 0, None), (10350, 120, 700), (6000, 0, None)])
+def test_rolling_folds(n_rows, start, step):
+    folds = walk_forward_folds(n_rows, train_size=5000, test_size=1000, step=step, start=start)
+    step = step or 1000
+
+    assert folds[-1].test_stop == n_rows
+    assert folds[0].train_start == start + (n_rows - start - 6000) % step
+    for i, fold in enumerate(folds):
+        assert fold.index == i
+        assert fold.train_size == 5000 and fold.test_size == 1000
+        assert fold.test_start == fold.train_stop
+    for previous, fold in zip(folds, folds[1:]):
+        assert fold.train_start - previous.train_start == step
+
+
+@pytest.mark.parametrize("n_rows,start", [(10000, 0), (10350, 0), (10350, 120)])
+def test_anchored_folds(n_rows, start):
+    rolling = walk_forward_folds(n_rows, train_size=5000, test_size=1000, start=start)
+    anchored = walk_forward_folds(n_rows, train_size=5000, test_size=1000, anchored=True, start=start)
+
+    assert [f.train_start for f in anchored] == [start] * len(rolling)
+    assert [f[2:] for f in anchored] == [f[2:] for f in rolling]
+    assert anchored[0].train_size >= 5000
+
+
+def test_too_short():
+    assert walk_forward_folds(5999, train_size=5000, test_size=1000) == []
+
+
+def test_backtest_metrics_edges():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        single = backtest_metrics(SimpleNamespace(net_worth=np.array([1000.]), trades=[]))
+        ruined = backtest_metrics(SimpleNamespace(net_worth=np.array([1000., 500., 0., 0.]), trades=[1, 2]))
+
+    assert single == dict(final_net_worth=1000., total_return=0., max_drawdown=0., sharpe=0., trades=0)
+    assert ruined["total_return"] == -1. and ruined["max_drawdown"] == 1.
+    assert np.isfinite(ruined["sharpe"]) and ruined["trades"] == 2
+
+
+def fold_metrics(store, fold):
+    # runs in the workers, so it is defined at the top level
+    if fold.index == 1:
+        raise ValueError("fold 1")
+    prices = store.column("close", fold.test_start, fold.test_stop)
+    result = Backtest(prices, cash=1000, cash_precision=3).buy_sell_hold(np.ones(len(prices) - 1, dtype=int))
+    return dict(backtest_metrics(result), threads=os.environ.get("OMP_NUM_THREADS"))
+
+
+def test_walk_forward_run(tmp_path, monkeypatch):
+    rows = 600
+    store = PriceStore.write(str(tmp_path / "store"), pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="min").astype("datetime64[ns]"),
+        "close": 100 + np.sin(np.arange(rows) / 20) * 10
+    }))
+    folds = walk_forward_folds(rows, train_size=200, test_size=100)
+    monkeypatch.setenv("OMP_NUM_THREADS", "7")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+
+    df = WalkForward(store, folds, fold_metrics, max_workers=2, threads_per_worker=3).run()
+
+    assert list(df["index"]) == [f.index for f in folds]
+    assert list(df["test_start"]) == [f.test_start for f in folds]
+    assert df["error"].notna().tolist() == [f.index == 1 for f in folds]
+    assert "fold 1" in df["error"][1]
+
+    ok = df[df["error"].isna()]
+    assert (ok["threads"] == "3").all()
+    for fold in ok.itertuples():
+        prices = store.column("close", fold.test_start, fold.test_stop)
+        assert fold.final_net_worth == pytest.approx(1000 * prices[-1] / prices[0], rel=0.01)
+
+    # the variables of the parent are restored once the workers are started
+    assert os.environ["OMP_NUM_THREADS"] == "7"
+    assert "MKL_NUM_THREADS" not in os.environ
+    assert all(os.environ.get(v) != "3" for v in THREAD_VARIABLES)
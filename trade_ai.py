@@ -1,16 +1,25 @@
 from coain.dataset.cryptodownload import CryptoDataDownload
-from coain.dataset.createfeatures import create_basic_features, rsi, macd
+from coain.dataset.cache import OHLCVCache
+from coain.dataset.store import PriceStore
+from coain.dataset.createfeatures import create_basic_features, rsi, macd, sma_series, rsi_series, macd_series
 from coain.renderer.history_plot import plot_df
 from coain.renderer.default import MyPlotlyTradingChart
 from coain.TheScheme.buysellhold import BuySellHold, PBR, SharpeRatio, MySimpleOrders
+from coain.env.feed import CompiledFeed
+from coain.env.create import create, create_schemes
+from coain.env.history import ColumnarPortfolio
+from coain.env.backtest import Backtest
+from coain.env.sampler import StratifiedEpisodeSampler
+from coain.env.profiler import StepProfiler
+from coain.env.recorder import EpisodeRecorder
+from coain.env.walkforward import WalkForward, walk_forward_folds, backtest_metrics
 
 from tensortrade.feed.core import Stream, DataFeed
-import tensortrade.env.default as default
 from tensortrade.oms.exchanges import Exchange
 from tensortrade.oms.services.execution.simulated import execute_order
 from tensortrade.oms.instruments import BTC, ETH
 from tensortrade.oms.instruments import Instrument
-from tensortrade.oms.wallets import Wallet, Portfolio
+from tensortrade.oms.wallets import Wallet
 
 from tensortrade.agents import DQNAgent
 
@@ -25,15 +34,30 @@ def run():
     quote_symbol = 'ETH'
     base_symbol = 'USDT'
     timeframe = 'h'
+    # e.g. '4h' or '15min' to trade bars aggregated from the candles of timeframe
+    bars = None
 
     save = False
     view = False
     create = True
-
-    CryptoData = CryptoDataDownload()
-
-    price_history, filename = CryptoData.fetch(exchange_name, base_symbol, quote_symbol, timeframe)
-    price_history = price_history.rename(columns={'date': 'time'})
+    profile = False
+    record = False
+    walk_forward = False
+
+    CryptoData = CryptoDataDownload(cache=OHLCVCache(ttl=24 * 60 * 60))
+
+    if bars is not None:
+        price_history = CryptoData.fetch_bars(exchange_name, base_symbol, quote_symbol, freq=bars, timeframe=timeframe)
+        price_history = price_history.rename(columns={'date': 'time'})
+        filename = '{}_{}{}_{}.csv'.format(exchange_name, quote_symbol, base_symbol, bars)
+    elif timeframe == 'm':
+        # years of minute candles are streamed into a store rather than read at once
+        raw_path = 'data/raw/{}_{}{}_{}'.format(exchange_name, quote_symbol, base_symbol, timeframe)
+        raw_store, filename = CryptoData.ingest_binance(raw_path, base_symbol, quote_symbol, timeframe)
+        price_history = raw_store.frame()
+    else:
+        price_history, filename = CryptoData.fetch(exchange_name, base_symbol, quote_symbol, timeframe)
+        price_history = price_history.rename(columns={'date': 'time'})
 
     csv_name = '{}.csv'.format(filename)
     if save:
@@ -44,50 +68,100 @@ def run():
 
 
     if create:
-        # creates trading features
+        # creates trading features, dropping candles without a wick
         tidy_price_histroy = create_basic_features(price_history)
 
-    # delete some entries that dont make sense
-    index_names = tidy_price_histroy[tidy_price_histroy['open'] == 0.01].index
-    tidy_price_histroy.drop(index_names, inplace=True)
+    # memory map the features so every env reads the same copy of the data
+    store = PriceStore.write('data/store/{}'.format(filename[:-4]), tidy_price_histroy, time_column='time')
+
+    if walk_forward:
+        # trains and tests on rolling folds in parallel, one process per core
+        folds = walk_forward_folds(len(store), train_size=5000, test_size=1000)
+        print(WalkForward(store, folds, train_fold).run())
+        return
+
+    train_data = store.frame(stop=-1000)
+    test_data = store.frame(-1000)
 
-    train_data = tidy_price_histroy[-6000:-1000]
-    test_data = tidy_price_histroy[-1000:]
+    # one env owns the whole training history and plays its episodes on
+    # windows of it, spread evenly across volatility regimes
+    sampler = StratifiedEpisodeSampler(train_data["close"].to_numpy(), length=5000, n_strata=4, min_start=19)
 
-    train_env = create_env(train_data)
+    # streams the training steps to disk, see load_recording
+    recorder = EpisodeRecorder('data/runs/{}'.format(filename[:-4])) if record else None
+
+    train_env = create_env(train_data, sampler=sampler, recorder=recorder)
     test_env = create_env(test_data)
 
+    if profile:
+        # prints where the time of every episode goes
+        StepProfiler(verbose=True).attach(train_env)
+
 
     agent = DQNAgent(train_env)
     agent.train(n_steps=5000, n_episodes=10, render_interval=None, save_path="agents/")
 
     agent.policy_network.save('agents/my_agent.hdf5"')
 
-    agent.env = test_env
-    agent.train(n_steps=1000, n_episodes=1)
-
+    if recorder is not None:
+        recorder.close()
 
-def create_env(data):
-    # creates a list of streams for use in RL environment
-    features = []
-    for c in data.columns[1:]:
-        s = Stream.source(list(data[c]), dtype="float").rename(data[c].name)
-        features += [s]
+    # the observations do not depend on the portfolio, so the greedy actions
+    # of the whole test set are predicted at once and replayed in one pass
+    actions = agent.policy_network.predict(test_env.observer.windows[:-1]).argmax(axis=1)
+    backtest = Backtest(test_data["close"].to_numpy(), cash=1000, cash_precision=3)
+    result = backtest.buy_sell_hold(actions)
+    print(result.final_net_worth, len(result.trades))
 
-    close_price = features[3]
 
-    # add SMA
-    features += [close_price.rolling(window=10).mean().rename("fast")]
-    features += [close_price.rolling(window=50).mean().rename("medium")]
-    features += [close_price.rolling(window=100).mean().rename("slow")]
-
-    # add rsi and macd
-    features += [rsi(close_price, period=20).rename("rsi")]
-    features += [macd(close_price, fast=10, slow=50, signal=5).rename("macd")]
+def train_fold(store, fold):
+    train_env = create_env(store.frame(fold.train_start, fold.train_stop))
+    test_data = store.frame(fold.test_start, fold.test_stop)
+    test_env = create_env(test_data)
 
-    # compile feed for use in env
-    feed = DataFeed(features)
-    feed.compile()
+    agent = DQNAgent(train_env)
+    agent.train(n_steps=5000, n_episodes=10, render_interval=None)
+
+    actions = agent.policy_network.predict(test_env.observer.windows[:-1]).argmax(axis=1)
+    backtest = Backtest(test_data["close"].to_numpy(), cash=1000, cash_precision=3)
+    return backtest_metrics(backtest.buy_sell_hold(actions))
+
+
+def create_env(data, compiled=True, sampler=None, recorder=None, action="bsh", reward="pbr"):
+    if compiled:
+        # computes every feature once over the whole dataset
+        close = data["close"]
+        features = data.iloc[:, 1:].assign(
+            fast=sma_series(close, window=10),
+            medium=sma_series(close, window=50),
+            slow=sma_series(close, window=100),
+            rsi=rsi_series(close, period=20),
+            macd=macd_series(close, fast=10, slow=50, signal=5)
+        )
+        feed = CompiledFeed(features)
+
+        close_price = Stream.source(close.to_numpy(), dtype="float").rename("close")
+    else:
+        # creates a list of streams for use in RL environment
+        features = []
+        for c in data.columns[1:]:
+            s = Stream.source(data[c].to_numpy(), dtype="float").rename(data[c].name)
+            features += [s]
+
+        close_price = features[3]
+
+        # add SMA
+        features += [close_price.rolling(window=10).mean().rename("fast")]
+        features += [close_price.rolling(window=50).mean().rename("medium")]
+        features += [close_price.rolling(window=100).mean().rename("slow")]
+
+        # add rsi and macd
+        features += [rsi(close_price, period=20).rename("rsi")]
+        features += [macd(close_price, fast=10, slow=50, signal=5).rename("macd")]
+
+        # compile feed for use in env
+        feed = DataFeed(features)
+        feed.compile()
 
     # creates the exchange in which orders are served
     binance = Exchange("binance", service=execute_order)(
@@ -102,7 +176,7 @@ def create_env(data):
     asset = Wallet(binance, 0 * ETH)
 
     # define the portfolio
-    portfolio = Portfolio(USDT, [
+    portfolio = ColumnarPortfolio(USDT, [
         cash,
         asset
     ])
@@ -117,33 +191,42 @@ def create_env(data):
 
     '''
 
-    reward_scheme = PBR(price=close_price)
-
-    action_scheme = BuySellHold(
+    # buy sell hold and position based returns by default, see create_schemes
+    action_scheme, reward_scheme = create_schemes(
+        action,
+        reward,
         cash=cash,
-        asset=asset
-    ).attach(reward_scheme)
+        asset=asset,
+        prices=data["close"].to_numpy() if compiled else None,
+        price=close_price
+    )
 
     # define the chart renderer
     renderer_feed = DataFeed([
-        Stream.source(list(data["time"])).rename("date"),
-        Stream.source(list(data["open"]), dtype="float").rename("open"),
-        Stream.source(list(data["high"]), dtype="float").rename("high"),
-        Stream.source(list(data["low"]), dtype="float").rename("low"),
-        Stream.source(list(data["close"]), dtype="float").rename("close"),
-        Stream.source(list(data["volume eth"]), dtype="float").rename("volume")
+        Stream.source(data["time"].to_numpy()).rename("date"),
+        Stream.source(data["open"].to_numpy(), dtype="float").rename("open"),
+        Stream.source(data["high"].to_numpy(), dtype="float").rename("high"),
+        Stream.source(data["low"].to_numpy(), dtype="float").rename("low"),
+        Stream.source(data["close"].to_numpy(), dtype="float").rename("close"),
+        Stream.source(data["volume eth"].to_numpy(), dtype="float").rename("volume")
     ])
 
-    env = default.create(
+    env = create(
         portfolio=portfolio,
         action_scheme=action_scheme,
         reward_scheme=reward_scheme,
         feed=feed,
         renderer_feed=renderer_feed,
         renderer=MyPlotlyTradingChart(),
-        window_size=20
+        window_size=20,
+        sampler=sampler
     )
 
+    if recorder is not None:
+        if recorder.feature_names is None:
+            recorder.feature_names = getattr(feed, "columns", None)
+        recorder.attach(env)
+
     return env
 
 
@@ -1,16 +1,18 @@
 from coain.dataset.cryptodownload import CryptoDataDownload
-from coain.dataset.createfeatures import create_basic_features, rsi, macd
+from coain.dataset.createfeatures import create_basic_features, rsi, macd, sma_series
 from coain.renderer.history_plot import plot_df
 from coain.TheScheme.buysellhold import BuySellHold, PBR, SharpeRatio, MySimpleOrders
 from coain.renderer.default import PositionChangeChart
+from coain.env.feed import CompiledFeed
+from coain.env.create import create, create_schemes
+from coain.env.history import ColumnarPortfolio
 
 from tensortrade.feed.core import Stream, DataFeed
-import tensortrade.env.default as default
 from tensortrade.oms.exchanges import Exchange
 from tensortrade.oms.services.execution.simulated import execute_order
 from tensortrade.oms.instruments import BTC, ETH
 from tensortrade.oms.instruments import Instrument
-from tensortrade.oms.wallets import Wallet, Portfolio
+from tensortrade.oms.wallets import Wallet
 
 from tensortrade.agents import DQNAgent
 
@@ -25,11 +27,20 @@ TTT = Instrument("TTT", 8, "TensorTrade Test")
 
 def run():
 
+    compiled = True
+
+    env = create_env(compiled=compiled)
+
+    agent = DQNAgent(env)
+    agent.train(n_steps=1000, n_episodes=10, render_interval=None, save_path="agents/")
+
+
+def create_env(rows=1001, compiled=True, action="simple4", reward="sharpe"):
+
     # create some fake data
-    x = np.arange(0, 2 * np.pi, 2 * np.pi / 1001)
+    x = np.arange(0, 2 * np.pi, 2 * np.pi / rows)
     y = 50 * np.sin(3 * x) + 100
 
-    x = np.arange(0, 2 * np.pi, 2 * np.pi / 1000)
     price = Stream.source(y, dtype="float").rename("USD-TTT")
 
     # create exchange
@@ -41,31 +52,47 @@ def run():
     cash = Wallet(binance, 1000 * USDT)
     asset = Wallet(binance, 0 * TTT)
 
-    portfolio = Portfolio(USDT, [
+    portfolio = ColumnarPortfolio(USDT, [
         cash,
         asset
     ])
 
     # define the features
-    feed = DataFeed([
-        price,
-        price.rolling(window=10).mean().rename("fast"),
-        price.rolling(window=50).mean().rename("medium"),
-        price.rolling(window=100).mean().rename("slow"),
-        price.log().diff().fillna(0).rename("lr")
-    ])
-    feed.compile()
-
-    reward_scheme = SharpeRatio()
-
-    action_scheme = MySimpleOrders(trade_sizes=4)
+    if compiled:
+        p = pd.Series(y)
+        feed = CompiledFeed({
+            "USD-TTT": p,
+            "fast": sma_series(p, window=10),
+            "medium": sma_series(p, window=50),
+            "slow": sma_series(p, window=100),
+            "lr": np.log(p).diff().fillna(0)
+        })
+    else:
+        feed = DataFeed([
+            price,
+            price.rolling(window=10).mean().rename("fast"),
+            price.rolling(window=50).mean().rename("medium"),
+            price.rolling(window=100).mean().rename("slow"),
+            price.log().diff().fillna(0).rename("lr")
+        ])
+        feed.compile()
+
+    # simple orders and the sharpe ratio by default, see create_schemes
+    action_scheme, reward_scheme = create_schemes(
+        action,
+        reward,
+        cash=cash,
+        asset=asset,
+        prices=y if compiled else None,
+        price=price
+    )
 
     renderer_feed = DataFeed([
         Stream.source(y, dtype="float").rename("price"),
-        Stream.sensor(action_scheme, lambda s: s.actions, dtype="float").rename("action")
+        Stream.sensor(action_scheme, lambda s: getattr(s, "action", np.nan), dtype="float").rename("action")
     ])
 
-    env = default.create(
+    return create(
         portfolio=portfolio,
         action_scheme=action_scheme,
         reward_scheme=reward_scheme,
@@ -75,9 +102,6 @@ def run():
         window_size=20
     )
 
-    agent = DQNAgent(env)
-    agent.train(n_steps=1000, n_episodes=10, render_interval=None, save_path="agents/")
-
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
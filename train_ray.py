@@ -1,3 +1,4 @@
+import os
 import ray
 import numpy as np
 import pandas as pd
@@ -5,7 +6,6 @@ import pandas as pd
 from ray import tune
 from ray.tune.registry import register_env
 
-import tensortrade.env.default as default
 
 from tensortrade.feed.core import DataFeed, Stream
 from tensortrade.oms.exchanges import Exchange
@@ -14,20 +14,52 @@ from tensortrade.oms.wallets import Wallet, Portfolio
 
 
 from coain.renderer.default import PositionChangeChart
-from coain.TheScheme.buysellhold import BuySellHold, PBR
+from coain.dataset.createfeatures import sma_series
+from coain.env.feed import CompiledFeed
+from coain.env.observer import pad
+from coain.env.create import create, create_schemes
+from coain.env.recorder import EpisodeRecorder
+from coain.env.vector import VectorBuySellHoldEnv
 
 from tensortrade.oms.instruments import Instrument
 
 USD = Instrument("USD", 2, "U.S. Dollar")
 TTC = Instrument("TTC", 8, "TensorTrade Coin")
 
-# creates environment
+# loads the data once, on the driver
 
-def create_env(config):
-    x = np.arange(0, 2*np.pi, 2*np.pi / 1001)
+def load_data(window_size, rows=1001):
+    x = np.arange(0, 2*np.pi, 2*np.pi / rows)
     y = 50*np.sin(3*x) + 100
 
-    x = np.arange(0, 2*np.pi, 2*np.pi / 1000)
+    price = pd.Series(y)
+    features = {
+        "USD-TTC": price,
+        "fast": sma_series(price, window=10),
+        "medium": sma_series(price, window=50),
+        "slow": sma_series(price, window=100),
+        "lr": np.log(price).diff().fillna(0)
+    }
+
+    # padded for the observation window so observers can view it as is
+    return {
+        "prices": y,
+        "columns": list(features),
+        "features": pad(np.column_stack(list(features.values())), window_size),
+        "padding": window_size - 1
+    }
+
+# creates environment
+
+def create_env(config):
+    # arrays read from the object store are zero-copy read-only views of the
+    # shared memory of the node
+    if "data" in config:
+        data = ray.get(config["data"])
+    else:
+        data = load_data(config["window_size"], config.get("rows", 1001))
+
+    y = data["prices"]
     p = Stream.source(y, dtype="float").rename("USD-TTC")
 
     bitfinex = Exchange("bitfinex", service=execute_order)(
@@ -42,27 +74,40 @@ def create_env(config):
         asset
     ])
 
-    feed = DataFeed([
-        p,
-        p.rolling(window=10).mean().rename("fast"),
-        p.rolling(window=50).mean().rename("medium"),
-        p.rolling(window=100).mean().rename("slow"),
-        p.log().diff().fillna(0).rename("lr")
-    ])
-
-    reward_scheme = PBR(price=p)
-
-    action_scheme = BuySellHold(
+    compiled = config.get("compiled_feed", True)
+
+    if compiled:
+        feed = CompiledFeed(
+            data["features"],
+            dtype="float32",
+            columns=data["columns"],
+            padding=data["padding"]
+        )
+    else:
+        feed = DataFeed([
+            p,
+            p.rolling(window=10).mean().rename("fast"),
+            p.rolling(window=50).mean().rename("medium"),
+            p.rolling(window=100).mean().rename("slow"),
+            p.log().diff().fillna(0).rename("lr")
+        ])
+
+    # buy sell hold and position based returns by default, see create_schemes
+    action_scheme, reward_scheme = create_schemes(
+        config.get("action", "bsh"),
+        config.get("reward", "pbr"),
         cash=cash,
-        asset=asset
-    ).attach(reward_scheme)
+        asset=asset,
+        prices=y if compiled else None,
+        price=p
+    )
 
     renderer_feed = DataFeed([
         Stream.source(y, dtype="float").rename("price"),
-        Stream.sensor(action_scheme, lambda s: s.action, dtype="float").rename("action")
+        Stream.sensor(action_scheme, lambda s: getattr(s, "action", np.nan), dtype="float").rename("action")
     ])
 
-    environment = default.create(
+    environment = create(
         feed=feed,
         portfolio=portfolio,
         action_scheme=action_scheme,
@@ -72,146 +117,191 @@ def create_env(config):
         window_size=config["window_size"],
         max_allowed_loss=0.6
     )
+
+    # each env of each worker process streams its steps to its own
+    # directory, the pid tells training and evaluation workers apart. rllib
+    # kills its workers without running exit handlers, so the steps are
+    # written at the end of every episode
+    if "record_path" in config:
+        path = os.path.join(config["record_path"], "worker_{}_{}_{}".format(
+            getattr(config, "worker_index", 0),
+            getattr(config, "vector_index", 0),
+            os.getpid()
+        ))
+        EpisodeRecorder(path, feature_names=data["columns"], flush_on_done=True).attach(environment)
+
     return environment
 
 register_env("TradingEnv", create_env)
 
-# trains the agent
-
-from ray.rllib.contrib.alpha_zero.models.custom_torch_models import DenseModel
-from ray.rllib.models.catalog import ModelCatalog
-ModelCatalog.register_custom_model("dense_model", DenseModel)
-
-tune.run(
-    "contrib/AlphaZero",
-    stop={
-        "episode_reward_mean": 300
-    },
-    max_failures=0,
-    config={
-        "env": "TradingEnv",
-        "env_config": {
-            "window_size": 25
-        },
-        "rollout_fragment_length": 50,
-        "train_batch_size": 500,
-        "sgd_minibatch_size": 64,
-        "lr": 1e-4,
-        "num_sgd_iter": 1,
-        "mcts_config": {
-            "puct_coefficient": 1.5,
-            "num_simulations": 100,
-            "temperature": 1.0,
-            "dirichlet_epsilon": 0.20,
-            "dirichlet_noise": 0.03,
-            "argmax_tree_policy": False,
-            "add_dirichlet_noise": True,
-        },
-        "ranked_rewards": {
-            "enable": True,
+# creates a batch of envs stepped at once, rllib steps all of them with one
+# call on each worker
+
+def create_vector_env(config):
+    if "data" in config:
+        data = ray.get(config["data"])
+    else:
+        data = load_data(config["window_size"], config.get("rows", 1001))
+
+    return VectorBuySellHoldEnv(
+        num_envs=config.get("num_envs", 64),
+        prices=data["prices"],
+        features=data["features"],
+        window_size=config["window_size"],
+        padding=data["padding"],
+        cash=100000,
+        cash_precision=USD.precision,
+        asset_precision=TTC.precision,
+        max_allowed_loss=0.6
+    )
+
+register_env("VectorTradingEnv", create_vector_env)
+
+
+if __name__ == "__main__":
+    ray.init()
+    data = ray.put(load_data(window_size=25))
+
+    # trains the agent
+
+    from ray.rllib.contrib.alpha_zero.models.custom_torch_models import DenseModel
+    from ray.rllib.models.catalog import ModelCatalog
+    ModelCatalog.register_custom_model("dense_model", DenseModel)
+
+    tune.run(
+        "contrib/AlphaZero",
+        stop={
+            "episode_reward_mean": 300
         },
-        "model": {
-            "custom_model": "dense_model",
+        max_failures=0,
+        config={
+            "env": "TradingEnv",
+            "env_config": {
+                "window_size": 25,
+                "data": data
+            },
+            "rollout_fragment_length": 50,
+            "train_batch_size": 500,
+            "sgd_minibatch_size": 64,
+            "lr": 1e-4,
+            "num_sgd_iter": 1,
+            "mcts_config": {
+                "puct_coefficient": 1.5,
+                "num_simulations": 100,
+                "temperature": 1.0,
+                "dirichlet_epsilon": 0.20,
+                "dirichlet_noise": 0.03,
+                "argmax_tree_policy": False,
+                "add_dirichlet_noise": True,
+            },
+            "ranked_rewards": {
+                "enable": True,
+            },
+            "model": {
+                "custom_model": "dense_model",
+            },
         },
-    },
-    checkpoint_at_end=True,
-)
-
-'''
-analysis = tune.run(
-    "PPO",
-    stop={
-      "episode_reward_mean": 300
-    },
-    config={
-        "env": "TradingEnv",
-        "env_config": {
-            "window_size": 25
+        checkpoint_at_end=True,
+    )
+
+    '''
+    analysis = tune.run(
+        "PPO",
+        stop={
+          "episode_reward_mean": 300
         },
-        "log_level": "DEBUG",
-        "framework": "torch",
-        "ignore_worker_failures": True,
-        "num_workers": 1,
-        "num_gpus": 0,
-        "clip_rewards": True,
-        "lr": 8e-6,
-        "lr_schedule": [
-            [0, 1e-1],
-            [int(1e2), 1e-2],
-            [int(1e3), 1e-3],
-            [int(1e4), 1e-4],
-            [int(1e5), 1e-5],
-            [int(1e6), 1e-6],
-            [int(1e7), 1e-7]
-        ],
-        "gamma": 0,
-        "observation_filter": "MeanStdFilter",
-        "lambda": 0.72,
-        "vf_loss_coeff": 0.5,
-        "entropy_coeff": 0.01
-    },
-    checkpoint_at_end=True
-)
-'''
-
-# loads agent
-
-import ray.rllib.agents.ppo as ppo
-
-# Get checkpoint
-checkpoints = analysis.get_trial_checkpoints_paths(
-    trial=analysis.get_best_trial("episode_reward_mean"),
-    metric="episode_reward_mean"
-)
-checkpoint_path = checkpoints[0][0]
-
-# Restore agent
-agent = ppo.PPOTrainer(
-    env="TradingEnv",
-    config={
-        "env_config": {
-            "window_size": 25
+        config={
+            "env": "TradingEnv",
+            "env_config": {
+                "window_size": 25,
+                "data": data
+            },
+            "log_level": "DEBUG",
+            "framework": "torch",
+            "ignore_worker_failures": True,
+            "num_workers": 1,
+            "num_gpus": 0,
+            "clip_rewards": True,
+            "lr": 8e-6,
+            "lr_schedule": [
+                [0, 1e-1],
+                [int(1e2), 1e-2],
+                [int(1e3), 1e-3],
+                [int(1e4), 1e-4],
+                [int(1e5), 1e-5],
+                [int(1e6), 1e-6],
+                [int(1e7), 1e-7]
+            ],
+            "gamma": 0,
+            "observation_filter": "MeanStdFilter",
+            "lambda": 0.72,
+            "vf_loss_coeff": 0.5,
+            "entropy_coeff": 0.01
         },
-        "framework": "torch",
-        "log_level": "DEBUG",
-        "ignore_worker_failures": True,
-        "num_workers": 1,
-        "num_gpus": 0,
-        "clip_rewards": True,
-        "lr": 8e-6,
-        "lr_schedule": [
-            [0, 1e-1],
-            [int(1e2), 1e-2],
-            [int(1e3), 1e-3],
-            [int(1e4), 1e-4],
-            [int(1e5), 1e-5],
-            [int(1e6), 1e-6],
-            [int(1e7), 1e-7]
-        ],
-        "gamma": 0,
-        "observation_filter": "MeanStdFilter",
-        "lambda": 0.72,
-        "vf_loss_coeff": 0.5,
-        "entropy_coeff": 0.01
-    }
-)
-agent.restore(checkpoint_path)
+        checkpoint_at_end=True
+    )
+    '''
+
+    # loads agent
+
+    import ray.rllib.agents.ppo as ppo
+
+    # Get checkpoint
+    checkpoints = analysis.get_trial_checkpoints_paths(
+        trial=analysis.get_best_trial("episode_reward_mean"),
+        metric="episode_reward_mean"
+    )
+    checkpoint_path = checkpoints[0][0]
+
+    # Restore agent
+    agent = ppo.PPOTrainer(
+        env="TradingEnv",
+        config={
+            "env_config": {
+                "window_size": 25,
+                "data": data
+            },
+            "framework": "torch",
+            "log_level": "DEBUG",
+            "ignore_worker_failures": True,
+            "num_workers": 1,
+            "num_gpus": 0,
+            "clip_rewards": True,
+            "lr": 8e-6,
+            "lr_schedule": [
+                [0, 1e-1],
+                [int(1e2), 1e-2],
+                [int(1e3), 1e-3],
+                [int(1e4), 1e-4],
+                [int(1e5), 1e-5],
+                [int(1e6), 1e-6],
+                [int(1e7), 1e-7]
+            ],
+            "gamma": 0,
+            "observation_filter": "MeanStdFilter",
+            "lambda": 0.72,
+            "vf_loss_coeff": 0.5,
+            "entropy_coeff": 0.01
+        }
+    )
+    agent.restore(checkpoint_path)
 
-# visualise decision making finished #
+    # visualise decision making finished #
 
-# Instantiate the environment
-env = create_env({
-    "window_size": 25
-})
+    # Instantiate the environment
+    env = create_env({
+        "window_size": 25,
+        "data": data
+    })
 
-# Run until episode ends
-episode_reward = 0
-done = False
-obs = env.reset()
+    # Run until episode ends
+    episode_reward = 0
+    done = False
+    obs = env.reset()
 
-while not done:
-    action = agent.compute_action(obs)
-    obs, reward, done, info = env.step(action)
-    episode_reward += reward
+    while not done:
+        action = agent.compute_action(obs)
+        obs, reward, done, info = env.step(action)
+        episode_reward += reward
 
-env.render()
\ No newline at end of file
+    env.render()